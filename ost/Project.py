@@ -28,11 +28,14 @@ from ost.helpers import scihub, helpers as h, srtm, copdem
 from ost.helpers import copernicus as cop
 from ost.helpers.settings import set_log_level, setup_logfile, OST_ROOT
 from ost.helpers.settings import check_ard_parameters
+from ost.helpers.checkpoint import CHECKPOINT_DIR
 
 from ost.s1 import search_data as search
 from ost.s1 import refine_inventory, download
 from ost.s1 import burst_inventory, burst_batch
 from ost.s1 import grd_batch
+from ost.generic import mosaic as mos
+from ost.s1.safe_cache import CACHE_NAME
 
 # get the logger
 logger = logging.getLogger(__name__)
@@ -552,6 +555,8 @@ class Sentinel1Batch(Sentinel1):
         snap_cpu_parallelism=cpu_count(),
         max_workers=1,
         log_level=logging.INFO,
+        ram_disk_quota=None,
+        safe_cache_quota=None,
     ):
         # ------------------------------------------
         # 1 Initialize super class
@@ -614,6 +619,12 @@ class Sentinel1Batch(Sentinel1):
         self.config_dict["max_workers"] = max_workers
         self.config_dict["executor_type"] = "billiard"
 
+        # size in GB of temporary products that may be staged on a RAM disk
+        self.config_dict["ram_disk_quota"] = ram_disk_quota
+
+        # size in GB of the local cache for extracted members of zipped scenes
+        self.config_dict["safe_cache_quota"] = safe_cache_quota
+
         # ---------------------------------------
         # 4 Set up project JSON
         self.config_file = self.project_dir / "config.json"
@@ -698,7 +709,9 @@ class Sentinel1Batch(Sentinel1):
         logger.info("Pre-downloading Copernicus DEM tiles")
         copdem.download_copdem(self.aoi)
 
-    def bursts_to_ards(self, timeseries=False, timescan=False, mosaic=False, overwrite=False):
+    def bursts_to_ards(
+        self, timeseries=False, timescan=False, mosaic=False, overwrite=False, stream_download=None
+    ):
         """Batch processing function for full burst pre-processing workflow
 
         This function allows for the generation of the
@@ -715,6 +728,10 @@ class Sentinel1Batch(Sentinel1):
         :param max_workers: number of parallel burst
         :type max_workers: int, default=1
         processing jobs
+        :param stream_download: arguments of download (mirror, concurrent,
+        uname, pword) to download missing scenes in the background, while
+        bursts are processed as soon as their scenes are downloaded
+        :type stream_download: dict, optional
         :return:
         """
 
@@ -772,8 +789,9 @@ class Sentinel1Batch(Sentinel1):
         # --------------------------------------------
         # 1 delete data from previous runnings
         # delete data in temporary directory in case there is
-        # something left from previous runs
-        h.remove_folder_content(self.config_dict["temp_dir"])
+        # something left from previous runs, but keep the cache
+        # of extracted scenes unless we start from scratch
+        h.remove_folder_content(self.config_dict["temp_dir"], exclude=None if overwrite else [CACHE_NAME])
 
         # in case we strat from scratch, delete all data
         # within processing folder
@@ -798,16 +816,28 @@ class Sentinel1Batch(Sentinel1):
         ):
             self.pre_download_copdem()
         # --------------------------------------------
-        # 6 run the burst to ard batch routine (up to 3 times if needed)
+        # 6 run the burst to ard batch routine (up to 3 times if needed),
+        # the first time while the scenes are downloaded if streaming
+        download_process = None
+        if stream_download:
+            download_process = burst_batch.stream_download(
+                self.burst_inventory, self.inventory, self.config_file, **stream_download
+            )
+
         i = 1
         while i < 4:
-            processed_bursts_df = burst_batch.bursts_to_ards(self.burst_inventory, self.config_file)
+            processed_bursts_df = burst_batch.bursts_to_ards(
+                self.burst_inventory, self.config_file, streaming=download_process is not None and i == 1
+            )
 
             if False in processed_bursts_df.error.isnull().tolist():
                 i += 1
             else:
                 i = 5
 
+        if download_process:
+            download_process.join()
+
         # write processed df to file
         processing_dir = Path(self.config_dict["processing_dir"])
         processed_bursts_df.to_pickle(processing_dir / "processed_bursts.pickle")
@@ -839,6 +869,23 @@ class Sentinel1Batch(Sentinel1):
 
         # return tseries_df
 
+    def export_mosaics(self, outdir=None):
+        """Write the virtual time-series and time-scan mosaics to GeoTiffs
+
+        :param outdir: output folder, defaults to the mosaic folders
+        :type outdir: str/Path, optional
+        :return: list of exported GeoTiffs
+        """
+
+        outfiles = []
+        for layers in ["Timeseries", "Timescan"]:
+            mosaic_dir = self.processing_dir / "Mosaic" / layers
+            if mosaic_dir.exists():
+                out_dir = Path(outdir) / layers if outdir else None
+                outfiles.extend(mos.export_mosaics(mosaic_dir, self.config_file, out_dir))
+
+        return outfiles
+
     @staticmethod
     def create_timeseries_animation(
         timeseries_dir,
@@ -870,7 +917,15 @@ class Sentinel1Batch(Sentinel1):
         overwrite=False,
         max_workers=1,
         executor_type="billiard",
+        stream_download=None,
     ):
+        """Batch processing function for full GRD pre-processing workflow
+
+        :param stream_download: arguments of download (mirror, concurrent,
+        uname, pword) to download missing scenes in the background, while
+        acquisitions are processed as soon as all their frames are downloaded
+        :type stream_download: dict, optional
+        """
 
         self.config_dict["max_workers"] = max_workers
         self.config_dict["executor_type"] = executor_type
@@ -933,8 +988,11 @@ class Sentinel1Batch(Sentinel1):
         # --------------------------------------------
         # 1 delete data in case of previous runs
         # delete data in temporary directory in case there is
-        # something left from aborted previous runs
-        h.remove_folder_content(self.config_dict["temp_dir"])
+        # something left from aborted previous runs, but keep the
+        # checkpoints and extracted scenes unless we start from scratch
+        h.remove_folder_content(
+            self.config_dict["temp_dir"], exclude=None if overwrite else [CHECKPOINT_DIR, CACHE_NAME]
+        )
 
         # --------------------------------------------
         # 5 set resolution in degree
@@ -949,7 +1007,12 @@ class Sentinel1Batch(Sentinel1):
         # --------------------------------------------
         # 5 set resolution in degree
         # the grd to ard batch routine
-        processing_df = grd_batch.grd_to_ard_batch(inventory_df, self.config_file)
+        if stream_download:
+            download_process = grd_batch.stream_download(inventory_df, self.config_file, **stream_download)
+            processing_df = grd_batch.grd_to_ard_batch(inventory_df, self.config_file, streaming=True)
+            download_process.join()
+        else:
+            processing_df = grd_batch.grd_to_ard_batch(inventory_df, self.config_file)
 
         # time-series part
         if timeseries or timescan:
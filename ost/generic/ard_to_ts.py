@@ -9,6 +9,7 @@ from tempfile import TemporaryDirectory
 from retrying import retry
 from osgeo import gdal
 
+from ost.generic import ts_stack, mt_speckle, ledger
 from ost.generic.common_wrappers import create_stack, mt_speckle_filter
 from ost.helpers import raster as ras, helpers as h
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
@@ -24,6 +25,7 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
     # -------------------------------------------
     # 1 unpack list of args
     # convert list of files readable for snap
+    list_of_dims = list_of_files
     list_of_files = f"'{','.join(str(x) for x in list_of_files)}'"
 
     # -------------------------------------------
@@ -44,8 +46,9 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
     Path.mkdir(out_dir, parents=True, exist_ok=True)
 
     # in case some processing has been done before, check if already processed
-    check_file = out_dir / f".{product}.{pol}.processed"
-    if Path.exists(check_file):
+    task = out_dir / f"{product}.{pol}"
+    parameters = [ledger.ard_parameters(ard, product), ard_mt]
+    if ledger.is_done(processing_dir, task, parameters, legacy=out_dir / f".{product}.{pol}.processed"):
         logger.info(f"Timeseries of {burst} for {product} in {pol} " f"polarisation already processed.")
 
         out_files = "already_processed"
@@ -53,6 +56,9 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
 
         return (burst, list_of_files, out_files, out_vrt, f"{product}.{pol}", None)
 
+    # record the start of the task in the job ledger
+    ledger.start(processing_dir, task, list_of_dims, parameters)
+
     # -------------------------------------------
     # 4 adjust processing parameters according to config
     # get the db scaling right
@@ -81,8 +87,27 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
         out_stack = temp / f"{burst}_{product}_{pol}_mt"
         stack_log = out_dir / f"{burst}_{product}_{pol}_stack.err_log"
 
+        # ARDs are usually on the same grid already, so we can skip SNAP's
+        # stacking, unless we need SNAP's stack for the mt speckle filter
+        # (configurations without the mt_speckle_estimator key stay with SNAP)
+        native_filter = (
+            ard_mt.get("mt_speckle_estimator", "SNAP") == "native"
+            and ard_mt["mt_speckle_filter"]["filter"] in mt_speckle.NATIVE_FILTERS
+        )
+        native_stack = None
+        if product != "coh" and (not ard_mt["remove_mt_speckle"] or native_filter):
+            if pol in ["Alpha", "Anisotropy", "Entropy"]:
+                native_stack = ts_stack.native_stack(list_of_dims, temp, pattern=pol)
+            else:
+                native_stack = ts_stack.native_stack(list_of_dims, temp, pol=pol)
+
         # run stacking routine
-        if pol in ["Alpha", "Anisotropy", "Entropy"]:
+        if native_stack:
+            logger.info(
+                f"Stacking images of burst/track {burst} for {product} "
+                f"product in {pol} polarization without SNAP."
+            )
+        elif pol in ["Alpha", "Anisotropy", "Entropy"]:
             logger.info(
                 f"Creating multi-temporal stack of images of burst/track "
                 f"{burst} for the {pol} band of the polarimetric "
@@ -92,6 +117,7 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
                 create_stack(list_of_files, temp_stack, stack_log, config_dict, pattern=pol)
             except (GPTRuntimeError, NotValidFileError) as error:
                 logger.info(error)
+                ledger.fail(processing_dir, [task], error)
                 return None, None, None, None, None, error
         else:
             logger.info(
@@ -102,10 +128,11 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
                 create_stack(list_of_files, temp_stack, stack_log, config_dict, polarisation=pol)
             except (GPTRuntimeError, NotValidFileError) as error:
                 logger.info(error)
+                ledger.fail(processing_dir, [task], error)
                 return None, None, None, None, None, error
 
-        # run mt speckle filter
-        if ard_mt["remove_mt_speckle"] is True:
+        # run mt speckle filter (the native one is applied on export)
+        if ard_mt["remove_mt_speckle"] is True and not native_stack:
 
             speckle_log = out_dir / f"{burst}_{product}_{pol}_mt_speckle.err_log"
 
@@ -114,6 +141,7 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
                 mt_speckle_filter(temp_stack.with_suffix(".dim"), out_stack, speckle_log, config_dict)
             except (GPTRuntimeError, NotValidFileError) as error:
                 logger.info(error)
+                ledger.fail(processing_dir, [task], error)
                 return None, None, None, None, None, error
 
             # remove tmp files
@@ -194,6 +222,48 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
                 # add ot a list for subsequent vrt creation
                 out_files.append(str(outfile))
 
+        elif native_stack and ard_mt["remove_mt_speckle"]:
+
+            logger.debug("Applying multi-temporal speckle filter")
+            out_files = [
+                str(out_dir / f"{i+1:02d}.{date}.{product}.{pol}.tif")
+                for i, (date, _) in enumerate(native_stack)
+            ]
+
+            mt_speckle.mt_speckle_to_tifs(
+                [infile for _, infile in native_stack],
+                out_files,
+                extent,
+                ard_mt["mt_speckle_filter"],
+                to_db=to_db,
+                datatype=ard_mt["dtype_output"],
+                min_value=mm_dict[stretch]["min"],
+                max_value=mm_dict[stretch]["max"],
+                max_workers=config_dict["snap_cpu_parallelism"],
+            )
+
+        elif native_stack:
+
+            out_files = []
+            for i, (date, infile) in enumerate(native_stack):
+
+                # create namespace for output file
+                outfile = out_dir / f"{i+1:02d}.{date}.{product}.{pol}.tif"
+
+                ras.mask_by_shape(
+                    infile,
+                    outfile,
+                    extent,
+                    to_db=to_db,
+                    datatype=ard_mt["dtype_output"],
+                    min_value=mm_dict[stretch]["min"],
+                    max_value=mm_dict[stretch]["max"],
+                    ndv=0.0,
+                )
+
+                # add ot a list for subsequent vrt creation
+                out_files.append(str(outfile))
+
         else:
             # get the dates of the files
             dates = sorted(
@@ -253,18 +323,18 @@ def ard_to_ts(list_of_files, burst, product, pol, config_file):
                 if Path(f"{file}.xml").exists():
                     Path(f"{file}.xml").unlink()
 
+            ledger.fail(processing_dir, [task], f"File check failed with {return_code}")
             return (burst, list_of_files, None, None, f"{product}.{pol}", return_code)
 
-    # write file, so we know this ts has been successfully processed
-    with open(str(check_file), "w") as file:
-        file.write("passed all tests \n")
-
     # -----------------------------------------------
     # 8 Create vrts
     vrt_options = gdal.BuildVRTOptions(srcNodata=0, separate=True)
     out_vrt = str(out_dir / f"Timeseries.{product}.{pol}.vrt")
     gdal.BuildVRT(out_vrt, out_files, options=vrt_options)
 
+    # record the task as done in the job ledger
+    ledger.finish(processing_dir, task, out_files + [out_vrt])
+
     return burst, list_of_files, out_files, out_vrt, f"{product}.{pol}", None
 
 
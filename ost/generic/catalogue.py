@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Catalogue of the products within a processing directory
+
+Batch stages register the products they write in a SQLite database within
+the processing directory, and subsequent stages query this catalogue instead
+of globbing through the processing directory. For projects that have been
+processed before the catalogue existed, it is built once by a full scan of
+the processing directory.
+
+Patterns follow pathlib's glob syntax without recursion (i.e. no '**'),
+relative to the processing directory. Products are only found once their
+producer has registered them, the processing directory is never scanned
+on a query.
+"""
+
+import os
+import sqlite3
+import logging
+from pathlib import Path, PurePosixPath
+from fnmatch import fnmatchcase
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_NAME = ".catalogue.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+
+def _connect(processing_dir):
+    """Open the catalogue and build it in case it does not exist yet
+
+    :param processing_dir: the project's processing directory
+    :return: sqlite3 connection
+    """
+
+    db_file = Path(processing_dir) / CATALOGUE_NAME
+    exists = db_file.exists()
+
+    connection = sqlite3.connect(str(db_file), timeout=TIMEOUT)
+    connection.execute("CREATE TABLE IF NOT EXISTS products (path TEXT PRIMARY KEY)")
+
+    if not exists:
+        _scan(processing_dir, Path(processing_dir), connection)
+
+    return connection
+
+
+def _scan(processing_dir, directory, connection):
+    """Add all files below a directory to the catalogue
+
+    :param processing_dir: the project's processing directory
+    :param directory: directory to scan
+    :param connection: sqlite3 connection to the catalogue
+    """
+
+    files = []
+    for root, _, filenames in os.walk(directory):
+        files.extend(Path(root) / filename for filename in filenames)
+
+    _insert(processing_dir, files, connection)
+
+
+def _insert(processing_dir, files, connection):
+
+    paths = [(Path(file).relative_to(processing_dir).as_posix(),) for file in files]
+    paths = [path for path in paths if path[0] != CATALOGUE_NAME]
+
+    with connection:
+        connection.executemany("INSERT OR IGNORE INTO products (path) VALUES (?)", paths)
+
+
+def register(processing_dir, files):
+    """Add files to the catalogue
+
+    :param processing_dir: the project's processing directory
+    :param files: list of paths within the processing directory
+    """
+
+    files = [file for file in files if file]
+    if not files:
+        return
+
+    connection = _connect(processing_dir)
+    try:
+        _insert(processing_dir, files, connection)
+    finally:
+        connection.close()
+
+
+def register_dir(processing_dir, directory):
+    """Add all files below a directory to the catalogue
+
+    This is meant for directories that have just been written, such as
+    the output directory of a single acquisition.
+
+    :param processing_dir: the project's processing directory
+    :param directory: directory within the processing directory
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        _scan(processing_dir, Path(directory), connection)
+    finally:
+        connection.close()
+
+
+def unregister(processing_dir, files):
+    """Remove files from the catalogue
+
+    :param processing_dir: the project's processing directory
+    :param files: list of paths within the processing directory
+    """
+
+    paths = [(Path(file).relative_to(processing_dir).as_posix(),) for file in files]
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            connection.executemany("DELETE FROM products WHERE path = ?", paths)
+    finally:
+        connection.close()
+
+
+def glob(processing_dir, pattern):
+    """Get all catalogued products matching a glob pattern
+
+    :param processing_dir: the project's processing directory
+    :param pattern: glob pattern relative to the processing directory
+    :return: sorted list of absolute paths
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        # sqlite's GLOB does not stop at path separators,
+        # so we use it as pre-filter only
+        rows = connection.execute("SELECT path FROM products WHERE path GLOB ?", (pattern,)).fetchall()
+    finally:
+        connection.close()
+
+    pattern_parts = PurePosixPath(pattern).parts
+    matches = []
+    for (path,) in rows:
+        parts = PurePosixPath(path).parts
+        if len(parts) == len(pattern_parts) and all(map(fnmatchcase, parts, pattern_parts)):
+            matches.append(Path(processing_dir) / path)
+
+    # skip products that have been removed in the meantime
+    return sorted(file for file in matches if file.exists())
@@ -4,7 +4,7 @@
 import logging
 from retrying import retry
 
-from ost.helpers import helpers as h
+from ost.helpers import helpers as h, gpt_profile
 from ost.helpers.settings import GPT_FILE, OST_ROOT
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
 
@@ -50,7 +50,7 @@ def speckle_filter(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -91,7 +91,7 @@ def linear_to_db(infile, outfile, logfile, config_dict):
     command = f"{GPT_FILE} LinearToFromdB -x -q {2*cpus} " f"-t '{str(outfile)}' {str(infile)}"
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -136,7 +136,7 @@ def terrain_flattening(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -220,7 +220,7 @@ def terrain_correction(infile, outfile, logfile, config_dict):
         raise ValueError("Geocoding method should be either 'terrain' or 'ellipsoid'.")
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -283,7 +283,7 @@ def ls_mask(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -347,7 +347,7 @@ def create_stack(
             f"-Poutput={out_stack}"
         )
 
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Successfully created multi-temporal stack")
@@ -400,7 +400,7 @@ def mt_speckle_filter(in_stack, out_stack, logfile, config_dict):
         f"-t '{out_stack}' '{in_stack}' "
     )
 
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Successfully applied multi-temporal speckle filtering")
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Project-wide spatial index of burst and track extents
+
+The common extents (min_bounds) and valid data extents of all bursts
+and tracks are collected into a single GeoPackage within the processing
+directory. Batch stages query this index instead of reading each of the
+many small extent files again and again.
+"""
+
+import logging
+from pathlib import Path
+from fnmatch import fnmatch
+
+import pandas as pd
+import geopandas as gpd
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".extent_index.gpkg"
+INDEX_LAYER = "extents"
+
+# extent kind and the file suffix it is stored with
+EXTENT_KINDS = {"min_bounds": ".min_bounds.json", "valid": ".valid.json"}
+
+
+def _index_file(processing_dir):
+    return Path(processing_dir) / INDEX_NAME
+
+
+def _read_extent(file):
+    """Read an extent file and dissolve it into a single geometry
+
+    :param file: path to the extent file
+    :return: shapely geometry in Lat/Lon or None
+    """
+
+    gdf = gpd.read_file(file)
+    gdf = gdf[~(gdf.geometry.is_empty | gdf.geometry.isna())]
+    if gdf.empty:
+        return None
+
+    if gdf.crs is not None:
+        gdf = gdf.to_crs("epsg:4326")
+
+    return gdf.geometry.unary_union
+
+
+def update_extent_index(processing_dir):
+    """Add new or changed extent files to the extent index
+
+    Only extent files that are not yet part of the index, or that have
+    been modified since they were indexed, are read.
+
+    :param processing_dir: the project's processing directory
+    :return: the updated index as GeoDataFrame
+    """
+
+    processing_dir = Path(processing_dir)
+    index_file = _index_file(processing_dir)
+
+    if index_file.exists():
+        index = gpd.read_file(index_file, layer=INDEX_LAYER)
+    else:
+        index = gpd.GeoDataFrame(
+            {"name": [], "kind": [], "mtime": []},
+            geometry=gpd.GeoSeries([], crs="epsg:4326"),
+        )
+
+    indexed = dict(zip(zip(index.name, index.kind), index.mtime))
+
+    new_rows, changed = [], set()
+    for kind, suffix in EXTENT_KINDS.items():
+        for file in processing_dir.glob(f"*/*{suffix}"):
+
+            name = file.name[: -len(suffix)]
+            mtime = file.stat().st_mtime
+            if indexed.get((name, kind)) == mtime:
+                continue
+
+            geometry = _read_extent(file)
+            if geometry is None:
+                continue
+
+            changed.add((name, kind))
+            new_rows.append({"name": name, "kind": kind, "mtime": mtime, "geometry": geometry})
+
+    if not new_rows:
+        return index
+
+    logger.info(f"Adding {len(new_rows)} extents to the extent index.")
+
+    # replace outdated entries
+    keep = [(name, kind) not in changed for name, kind in zip(index.name, index.kind)]
+    index = gpd.GeoDataFrame(
+        pd.concat([index[keep], gpd.GeoDataFrame(new_rows, crs="epsg:4326")], ignore_index=True),
+        crs="epsg:4326",
+    )
+
+    # write to a temporary file first, so readers never see a partial index
+    temp_file = index_file.with_name(f"{index_file.stem}.tmp.gpkg")
+    index.to_file(temp_file, layer=INDEX_LAYER, driver="GPKG")
+    temp_file.replace(index_file)
+
+    return index
+
+
+def query_extent_index(processing_dir, aoi, kind="min_bounds", pattern="*"):
+    """Get the names of all bursts/tracks whose extent intersects the AOI
+
+    :param processing_dir: the project's processing directory
+    :param aoi: shapely geometry in Lat/Lon
+    :param kind: either min_bounds or valid
+    :param pattern: unix shell-style pattern to filter the burst/track names
+    :return: list of burst/track names
+    """
+
+    index_file = _index_file(processing_dir)
+    if index_file.exists():
+        index = gpd.read_file(index_file, layer=INDEX_LAYER)
+    else:
+        index = update_extent_index(processing_dir)
+
+    index = index[(index.kind == kind) & index.name.apply(fnmatch, pat=pattern)]
+    if index.empty:
+        return []
+
+    # use the spatial index for the actual intersection
+    index = index.reset_index(drop=True)
+    hits = index.sindex.query(aoi, predicate="intersects")
+    return index.name.iloc[sorted(hits)].tolist()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Radiometric harmonization of mosaic layers from cached overlap samples
+
+All layers of a time-series or time-scan mosaic share the same footprints,
+so the overlaps between the input images are identical for every date and
+metric. The sample locations within those overlaps are therefore derived
+only once per input geometry and stored within the processing directory.
+For every layer, the values at these locations are read, and a gain and
+offset per image is estimated by least squares. The corrections are applied
+through VRTs, so that the mosaicking itself runs without any harmonization.
+"""
+
+import json
+import hashlib
+import logging
+import itertools
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from ost.helpers import raster as ras
+
+logger = logging.getLogger(__name__)
+
+# maximum number of sample points per pairwise overlap
+MAX_SAMPLES = 2500
+
+# minimum number of valid sample pairs for an overlap to be considered
+MIN_SAMPLES = 50
+
+# weight of the constraints keeping gains near 1 and offsets near 0
+REGULARIZATION = 1e-3
+
+
+def _geometry_key(files):
+    """Create a key describing the geometry of a set of input files
+
+    The key only depends on CRS, resolution and bounds of the files, so that
+    all layers of a mosaic with the same footprints share the same key.
+
+    :param files: list of raster files
+    :return: hex digest
+    """
+
+    footprints = []
+    for file in files:
+        with rasterio.open(file) as src:
+            footprints.append(
+                (
+                    src.crs.to_string(),
+                    tuple(np.round(src.res, 6)),
+                    tuple(np.round(src.bounds, 3)),
+                )
+            )
+
+    return hashlib.sha1(json.dumps(footprints).encode()).hexdigest()
+
+
+def _overlap_samples(files):
+    """Create a regular grid of sample points for each pairwise overlap
+
+    :param files: list of raster files
+    :return: list of dicts with the indices of the overlapping files
+             and the sample coordinates
+    """
+
+    bounds, res = [], []
+    for file in files:
+        with rasterio.open(file) as src:
+            bounds.append(src.bounds)
+            res.append(max(src.res))
+
+    overlaps = []
+    for i, j in itertools.combinations(range(len(files)), 2):
+
+        left = max(bounds[i].left, bounds[j].left)
+        bottom = max(bounds[i].bottom, bounds[j].bottom)
+        right = min(bounds[i].right, bounds[j].right)
+        top = min(bounds[i].top, bounds[j].top)
+
+        if left >= right or bottom >= top:
+            continue
+
+        # spacing so that we stay below the max number of samples,
+        # but never go below the pixel spacing
+        spacing = max(
+            np.sqrt((right - left) * (top - bottom) / MAX_SAMPLES),
+            max(res[i], res[j]),
+        )
+
+        xs = np.arange(left + spacing / 2, right, spacing)
+        ys = np.arange(bottom + spacing / 2, top, spacing)
+        if len(xs) == 0 or len(ys) == 0:
+            continue
+
+        xx, yy = np.meshgrid(xs, ys)
+        overlaps.append(
+            {
+                "pair": [i, j],
+                "points": np.column_stack([xx.ravel(), yy.ravel()]).round(3).tolist(),
+            }
+        )
+
+    return overlaps
+
+
+def get_overlap_samples(files, cache_dir):
+    """Load the overlap samples for a set of files, or create them
+
+    :param files: list of raster files
+    :param cache_dir: directory where the overlap samples are stored
+    :return: list of dicts with the indices of the overlapping files
+             and the sample coordinates
+    """
+
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{_geometry_key(files)}.json"
+
+    if cache_file.exists():
+        with open(cache_file, "r") as file:
+            return json.load(file)
+
+    logger.info("Deriving overlap samples for harmonization.")
+    overlaps = _overlap_samples(files)
+
+    # write to a temporary file first, so that concurrent
+    # mosaic jobs never read a partially written file
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_suffix(f".{np.random.randint(1e9)}.tmp")
+    with open(temp_file, "w") as file:
+        json.dump(overlaps, file)
+    temp_file.replace(cache_file)
+
+    return overlaps
+
+
+def _read_samples(file, points):
+    """Read the first band of a file at a list of coordinates
+
+    :param file: raster file
+    :param points: list of x/y coordinates
+    :return: 1-d array with invalid values set to nan
+    """
+
+    with rasterio.open(file) as src:
+        ndv = src.nodata if src.nodata is not None else 0
+        values = np.array([value[0] for value in src.sample(points, indexes=1)], dtype="float64")
+
+    values[values == ndv] = np.nan
+    return values
+
+
+def harmonization_coefficients(files, overlaps):
+    """Estimate a gain and offset per file from overlap samples
+
+    The first file serves as reference. For all others, gain and offset
+    are estimated so that the corrected values agree within the overlaps
+    in a least squares sense. Files without sufficient overlap keep gain 1
+    and offset 0.
+
+    :param files: list of raster files
+    :param overlaps: overlap samples as returned by get_overlap_samples
+    :return: list of (gain, offset) tuples in the order of files
+    """
+
+    n = len(files)
+    rows, rhs = [], []
+    for overlap in overlaps:
+        i, j = overlap["pair"]
+        values_i = _read_samples(files[i], overlap["points"])
+        values_j = _read_samples(files[j], overlap["points"])
+
+        valid = np.isfinite(values_i) & np.isfinite(values_j)
+        if valid.sum() < MIN_SAMPLES:
+            continue
+
+        # a_i * v_i + b_i - a_j * v_j - b_j = 0
+        block = np.zeros((valid.sum(), 2 * n))
+        block[:, 2 * i] = values_i[valid]
+        block[:, 2 * i + 1] = 1
+        block[:, 2 * j] = -values_j[valid]
+        block[:, 2 * j + 1] = -1
+
+        # normalise, so every overlap contributes equally
+        rows.append(block / np.sqrt(valid.sum()))
+        rhs.append(np.zeros(valid.sum()))
+
+    if not rows:
+        return [(1.0, 0.0)] * n
+
+    # keep gains close to 1 and offsets close to 0,
+    # and fix the reference image
+    scale = np.max([np.abs(row).max() for row in rows])
+    weights = np.full(2 * n, REGULARIZATION * scale)
+    weights[:2] = 1e3 * scale
+    rows.append(np.diag(weights))
+    rhs.append(weights * np.tile([1, 0], n))
+
+    solution = np.linalg.lstsq(np.vstack(rows), np.concatenate(rhs), rcond=None)[0]
+    return [(float(solution[2 * k]), float(solution[2 * k + 1])) for k in range(n)]
+
+
+def harmonize(filelist, out_dir, cache_dir):
+    """Create radiometrically harmonized VRTs of the mosaic inputs
+
+    :param filelist: OTB style (space separated) list of input files
+    :param out_dir: directory where the VRTs are written to
+    :param cache_dir: directory where the overlap samples are stored
+    :return: OTB style list of the harmonized VRTs
+    """
+
+    files = filelist.split(" ")
+    overlaps = get_overlap_samples(files, cache_dir)
+    coefficients = harmonization_coefficients(files, overlaps)
+
+    vrts = []
+    for i, (file, (gain, offset)) in enumerate(zip(files, coefficients)):
+        logger.debug(f"Harmonizing {file} with gain {gain:.4f} and offset {offset:.4f}.")
+        vrts.append(str(ras.create_complex_vrt([(file, gain, offset)], Path(out_dir) / f"{i:03d}.vrt")))
+
+    return " ".join(vrts)
+
+
+def harmonize_groups(groups, out_dir, cache_dir):
+    """Create VRTs of the mosaic inputs, harmonized per group of inputs
+
+    The inputs of each group, e.g. the bursts of a subswath, are referenced
+    within a single VRT, and gain and offset are estimated between these
+    group VRTs. Every input is then referenced with the correction of its
+    group, so that all inputs can be blended within a single mosaic.
+
+    :param groups: list of OTB style (space separated) lists of input files
+    :param out_dir: directory where the VRTs are written to
+    :param cache_dir: directory where the overlap samples are stored
+    :return: OTB style list of the harmonized VRTs
+    """
+
+    out_dir = Path(out_dir)
+    group_vrts = [
+        str(ras.create_complex_vrt([(file, 1, 0) for file in group.split(" ")], out_dir / f"group{i}.vrt"))
+        for i, group in enumerate(groups)
+    ]
+    overlaps = get_overlap_samples(group_vrts, cache_dir)
+    coefficients = harmonization_coefficients(group_vrts, overlaps)
+
+    vrts = []
+    for group, (gain, offset) in zip(groups, coefficients):
+        logger.debug(f"Harmonizing {group} with gain {gain:.4f} and offset {offset:.4f}.")
+        for file in group.split(" "):
+            vrt = ras.create_complex_vrt([(file, gain, offset)], out_dir / f"{len(vrts):03d}.vrt")
+            vrts.append(str(vrt))
+
+    return " ".join(vrts)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Ledger of the processing jobs of a project
+
+Each task of the batch processing, e.g. the backscatter layer of a burst
+at one date or the time-series of a product, is recorded in a SQLite
+database within the processing directory, with its inputs, the hash of
+its parameters, its status, outputs, number of attempts and duration.
+
+Tasks are identified by their path within the processing directory, i.e.
+the output directory and the name of the product. A task is completed if
+it is done with the parameters of the current run. For the ARD tasks,
+these are only the single_ARD parameters that affect their product, so
+that e.g. a change of the coherence parameters does not invalidate the
+backscatter products. Planning a resume is
+a single query for the completed tasks, so that completed work is skipped
+without checking the file system for every task.
+
+Tasks of projects that have been processed before the ledger existed are
+taken over from the hidden .processed files once, the first time they
+are looked up.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LEDGER_NAME = ".ledger.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+# status of a task
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+# single_ARD parameters that affect all ARD products
+ARD_COMMON = ["image_type", "resolution", "geocoding", "dem", "to_tif"]
+
+# single_ARD parameters that affect a single ARD product
+ARD_PRODUCTS = {
+    "bs": [
+        "product_type",
+        "polarisation",
+        "remove_border_noise",
+        "remove_speckle",
+        "speckle_filter",
+        "to_db",
+        "create_ls_mask",
+    ],
+    "pol": ["remove_pol_speckle", "pol_speckle_filter", "pol_estimator", "pol_window_size"],
+    "coh": [
+        "coherence_bands",
+        "coherence_azimuth",
+        "coherence_range",
+        "coherence_estimator",
+        "coherence_window",
+    ],
+}
+
+
+def _connect(processing_dir):
+
+    connection = sqlite3.connect(str(Path(processing_dir) / LEDGER_NAME), timeout=TIMEOUT)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "task TEXT PRIMARY KEY, inputs TEXT, parameters TEXT, status TEXT, outputs TEXT, "
+        "attempts INTEGER, started REAL, duration REAL, error TEXT)"
+    )
+    return connection
+
+
+def task_id(processing_dir, task):
+    """Get the id of a task from its path within the processing directory"""
+
+    try:
+        return Path(task).relative_to(processing_dir).as_posix()
+    except ValueError:
+        return Path(task).as_posix()
+
+
+def parameters_hash(parameters):
+    """Get the hash of the parameters of a task
+
+    :param parameters: json serialisable parameters, e.g. the single_ARD
+                       section of the project configuration
+    :return: hash as str
+    """
+
+    content = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+def ard_parameters(ard, task):
+    """Get the single_ARD parameters that affect the product of an ARD task
+
+    :param ard: the single_ARD section of the project configuration
+    :param task: path of the task, which ends with its product, i.e. bs, pol or coh
+    :return: dict of parameters
+    """
+
+    keys = ARD_COMMON + ARD_PRODUCTS[Path(task).name]
+    return {key: ard[key] for key in keys if key in ard}
+
+
+def start(processing_dir, task, inputs=None, parameters=None):
+    """Record the start of a task
+
+    :param processing_dir: the project's processing directory
+    :param task: path of the task within the processing directory
+    :param inputs: list of input files
+    :param parameters: parameters of the task
+    """
+
+    identifier = task_id(processing_dir, task)
+    inputs = json.dumps([str(file) for file in inputs or []])
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            updated = connection.execute(
+                "UPDATE jobs SET inputs = ?, parameters = ?, status = ?, outputs = NULL, "
+                "attempts = attempts + 1, started = ?, duration = NULL, error = NULL WHERE task = ?",
+                (inputs, parameters_hash(parameters), RUNNING, time.time(), identifier),
+            ).rowcount
+
+            if not updated:
+                connection.execute(
+                    "INSERT INTO jobs (task, inputs, parameters, status, attempts, started) "
+                    "VALUES (?, ?, ?, ?, 1, ?)",
+                    (identifier, inputs, parameters_hash(parameters), RUNNING, time.time()),
+                )
+    finally:
+        connection.close()
+
+
+def finish(processing_dir, task, outputs=None):
+    """Record a task as done
+
+    :param processing_dir: the project's processing directory
+    :param task: path of the task within the processing directory
+    :param outputs: list of output files
+    """
+
+    outputs = json.dumps([str(file) if file else None for file in outputs or []])
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, outputs = ?, duration = ? - started WHERE task = ?",
+                (DONE, outputs, time.time(), task_id(processing_dir, task)),
+            )
+    finally:
+        connection.close()
+
+
+def fail(processing_dir, tasks, error):
+    """Record the tasks of a failed job as failed, unless they are done
+
+    :param processing_dir: the project's processing directory
+    :param tasks: list of paths of the tasks within the processing directory
+    :param error: the error the job returned
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            connection.executemany(
+                "UPDATE jobs SET status = ?, error = ?, duration = ? - started "
+                "WHERE task = ? AND status = ?",
+                [
+                    (FAILED, str(error), time.time(), task_id(processing_dir, task), RUNNING)
+                    for task in tasks
+                ],
+            )
+    finally:
+        connection.close()
+
+
+def completed(processing_dir, ard=None, prefix=""):
+    """Get all completed ARD tasks
+
+    :param processing_dir: the project's processing directory
+    :param ard: the single_ARD parameters, only tasks done with the ones
+                that affect their product count as completed
+    :param prefix: only tasks whose id starts with prefix, e.g. a burst id
+    :return: dict of task ids and their list of outputs
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        rows = connection.execute(
+            "SELECT task, parameters, outputs FROM jobs WHERE status = ? AND substr(task, 1, ?) = ?",
+            (DONE, len(prefix), prefix),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    # hash of the parameters of each product
+    digests = {
+        product: parameters_hash(ard_parameters(ard, product)) if ard is not None else None
+        for product in ARD_PRODUCTS
+    }
+    return {
+        task: json.loads(outputs or "[]")
+        for task, task_parameters, outputs in rows
+        if Path(task).name in digests and digests[Path(task).name] in (None, task_parameters)
+    }
+
+
+def is_done(processing_dir, task, parameters=None, legacy=None, check_outputs=False):
+    """Check if a single task is completed
+
+    :param processing_dir: the project's processing directory
+    :param task: path of the task within the processing directory
+    :param parameters: the task only counts as completed if it is done
+                       with these parameters
+    :param legacy: hidden .processed file of the task from before the
+                   ledger, which is taken over if the task is not recorded
+    :param check_outputs: the task only counts as completed as long as its
+                          recorded outputs exist, e.g. for temporary
+                          products that are removed later on
+    :return: bool
+    """
+
+    identifier = task_id(processing_dir, task)
+
+    connection = _connect(processing_dir)
+    try:
+        row = connection.execute(
+            "SELECT status, parameters, outputs FROM jobs WHERE task = ?", (identifier,)
+        ).fetchone()
+
+        if row is None and legacy and Path(legacy).exists():
+            logger.debug(f"Taking over {legacy} into the job ledger.")
+            row = (DONE, parameters_hash(parameters), None)
+            with connection:
+                connection.execute(
+                    "INSERT INTO jobs (task, parameters, status, attempts) VALUES (?, ?, ?, 1)",
+                    (identifier, row[1], row[0]),
+                )
+    finally:
+        connection.close()
+
+    status, task_parameters, outputs = row or (None, None, None)
+    if status != DONE:
+        return False
+
+    if parameters is not None and task_parameters != parameters_hash(parameters):
+        return False
+
+    if not check_outputs:
+        return True
+
+    missing = [file for file in json.loads(outputs or "[]") if file and not Path(file).exists()]
+    if missing:
+        logger.debug(f"Outputs of {identifier} have been removed, e.g. {missing[0]}.")
+        return False
+
+    return True
+
+
+def reset(processing_dir, task):
+    """Remove a task from the ledger, so that it is processed again
+
+    :param processing_dir: the project's processing directory
+    :param task: path of the task within the processing directory
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            connection.execute("DELETE FROM jobs WHERE task = ?", (task_id(processing_dir, task),))
+    finally:
+        connection.close()
@@ -1,18 +1,21 @@
 # -*- coding: utf-8 -*-
 import json
-import shutil
 import logging
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import numpy as np
 import rasterio
-import rasterio.mask
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, from_bounds
 from retrying import retry
+from godale._concurrent import Executor
 from osgeo import gdal
 
 from ost.helpers import vector as vec
 from ost.helpers import helpers as h
+from ost.helpers import raster as ras
+from ost.generic import harmonization, extent_index, catalogue, ledger
 
 logger = logging.getLogger(__name__)
 
@@ -27,19 +30,314 @@ def create_timeseries_mosaic_vrt(list_of_args):
     )
 
 
-@retry(stop_max_attempt_number=3, wait_fixed=1)
-def mosaic(filelist, outfile, config_file, cut_to_aoi=None, harm=None):
+def _aoi_window(filelist, aoi):
+    """Get the AOI extent on the grid of the mosaic inputs
+
+    The AOI is reprojected to the CRS of the first input and intersected
+    with the union of all input bounds. The result is snapped to the pixel
+    grid of the first input, so that only this part needs to be resampled
+    during mosaicking.
+
+    :param filelist: OTB style (space separated) list of input files
+    :param aoi: AOI as WKT string in Lat/Lon
+    :return: tuple of upper-left x/y, width and height in pixels, pixel size
+             x/y and the AOI features in the mosaic's CRS,
+             or None if the AOI does not overlap the inputs
+    """
+
+    files = filelist.split(" ")
+    with rasterio.open(files[0]) as src:
+        crs = src.crs
+        res_x, res_y = src.res
+        left, bottom, right, top = src.bounds
+        # the grid origin to snap to
+        origin_x, origin_y = src.transform.c, src.transform.f
+
+    for file in files[1:]:
+        with rasterio.open(file) as src:
+            left, bottom = min(left, src.bounds.left), min(bottom, src.bounds.bottom)
+            right, top = max(right, src.bounds.right), max(top, src.bounds.top)
+
+    # get aoi in a way rasterio wants it
+    aoi_gdf = vec.wkt_to_gdf(aoi).to_crs(crs)
+    features = vec.gdf_to_json_geometry(aoi_gdf)
+    aoi_left, aoi_bottom, aoi_right, aoi_top = aoi_gdf.total_bounds
+
+    # intersect with input bounds
+    left, bottom = max(left, aoi_left), max(bottom, aoi_bottom)
+    right, top = min(right, aoi_right), min(top, aoi_top)
+    if left >= right or bottom >= top:
+        return None
+
+    # snap outwards to the pixel grid of the first input
+    left = origin_x + np.floor((left - origin_x) / res_x) * res_x
+    right = origin_x + np.ceil((right - origin_x) / res_x) * res_x
+    top = origin_y - np.floor((origin_y - top) / res_y) * res_y
+    bottom = origin_y - np.ceil((origin_y - bottom) / res_y) * res_y
+
+    width = int(np.round((right - left) / res_x))
+    height = int(np.round((top - bottom) / res_y))
+
+    return left, top, width, height, res_x, res_y, features
+
+
+def _mask_by_blocks(file, features):
+    """Set all pixels outside the features to no-data, block by block
+
+    The raster is updated in place and only blocks that are not fully
+    covered by the features get rewritten.
+
+    :param file: path to a GeoTiff
+    :param features: list of geojson-like geometries in the CRS of the file
+    """
+
+    with rasterio.open(file, "r+") as dest:
+        ndv = dest.nodata if dest.nodata is not None else 0
+        for _, window in dest.block_windows(1):
+
+            outside = geometry_mask(
+                features,
+                out_shape=(window.height, window.width),
+                transform=dest.window_transform(window),
+            )
+
+            # block fully within the aoi
+            if not outside.any():
+                continue
+
+            block = dest.read(window=window)
+            block[:, outside] = ndv
+            dest.write(block, window=window)
+
+
+def _task(outfile):
+    """Get the task of a mosaic within the job ledger and its legacy .processed file"""
+
+    name = outfile.name[:-4]
+    return outfile.parent / name, outfile.parent / f".{name}.processed"
+
+
+def is_processed(outfile, config_dict):
+    """Check if a mosaic has already been processed
+
+    Mosaics only count as processed as long as they exist, since the
+    temporary mosaics of acquisitions and tracks are removed once the
+    final mosaic is done.
+
+    :param outfile: output file of the mosaic
+    :param config_dict: an OST configuration dictionary
+    :return: bool
+    """
+
+    task, legacy = _task(outfile)
+    return ledger.is_done(
+        config_dict["processing_dir"], task, config_dict["processing"], legacy=legacy, check_outputs=True
+    )
+
+
+def virtual_mosaic(filelist, outfile, config_file, cut_to_aoi=None, harm=None):
+    """Create a mosaic as VRT, without writing any pixel data
+
+    Radiometric corrections from the harmonization are stored as scale and
+    offset of each source. The order of the file list defines the overlap
+    priority, with later files on top of earlier ones. If the mosaic is cut
+    to the AOI, the VRT is restricted to the AOI's extent, while pixels
+    outside the AOI polygon are only masked on materialisation.
+
+    :param filelist: OTB style (space separated) list of input files
+    :param outfile: output VRT
+    :param config_file: path to the project configuration file
+    :param cut_to_aoi: restrict mosaic to the AOI
+    :param harm: apply radiometric harmonization
+    """
+
+    with open(config_file, "r") as ard_file:
+        config_dict = json.load(ard_file)
+        processing_dir = config_dict["processing_dir"]
+        aoi = config_dict["aoi"]
+
+        if not harm:
+            harm = config_dict["processing"]["mosaic"]["harmonization"]
 
-    if (outfile.parent / f".{outfile.name[:-4]}.processed").exists():
+        if not cut_to_aoi:
+            cut_to_aoi = config_dict["processing"]["mosaic"]["cut_to_aoi"]
+
+    if is_processed(outfile, config_dict):
         logger.info(f"{outfile} already exists.")
         return
 
-    logger.info(f"Mosaicking file {outfile}.")
+    logger.info(f"Creating virtual mosaic {outfile}.")
+    files = filelist.split(" ")
+
+    # record the start of the task in the job ledger
+    task, _ = _task(outfile)
+    ledger.start(processing_dir, task, files, config_dict["processing"])
+
+    if harm:
+        cache_dir = Path(processing_dir) / "Mosaic" / ".harmonization"
+        overlaps = harmonization.get_overlap_samples(files, cache_dir)
+        coefficients = harmonization.harmonization_coefficients(files, overlaps)
+    else:
+        coefficients = [(1.0, 0.0)] * len(files)
+
+    extent = None
+    if cut_to_aoi:
+        window = _aoi_window(filelist, aoi)
+        if not window:
+            logger.info(f"AOI does not overlap with the input files of {outfile.name}.")
+            ledger.fail(processing_dir, [task], "AOI does not overlap with the input files")
+            return
+
+        extent = window[:4]
+
+    ras.create_complex_vrt(
+        [(file, gain, offset) for file, (gain, offset) in zip(files, coefficients)],
+        outfile,
+        extent=extent,
+    )
+
+    # record the task as done in the job ledger
+    ledger.finish(processing_dir, task, [outfile])
+
+
+def _intersect_bounds(bounds1, bounds2):
+    return (
+        max(bounds1[0], bounds2[0]),
+        max(bounds1[1], bounds2[1]),
+        min(bounds1[2], bounds2[2]),
+        min(bounds1[3], bounds2[3]),
+    )
+
+
+def materialize(infile, outfile, aoi=None, bounds=None):
+    """Write (a part of) a virtual mosaic to a GeoTiff
+
+    :param infile: the virtual mosaic
+    :param outfile: the output GeoTiff
+    :param aoi: optional AOI as WKT string in Lat/Lon to mask and crop to
+    :param bounds: optional tuple of left, bottom, right, top in the CRS
+                   of the mosaic, e.g. to materialise a single tile
+    :return: path to the output GeoTiff or None if there is no overlap
+    """
+
+    with rasterio.open(infile) as src:
+
+        left, bottom, right, top = src.bounds
+
+        features = None
+        if aoi:
+            aoi_gdf = vec.wkt_to_gdf(aoi).to_crs(src.crs)
+            features = vec.gdf_to_json_geometry(aoi_gdf)
+            bounds = _intersect_bounds(bounds, aoi_gdf.total_bounds) if bounds else aoi_gdf.total_bounds
+
+        if bounds is not None:
+            left, bottom, right, top = _intersect_bounds((left, bottom, right, top), bounds)
+
+        if left >= right or bottom >= top:
+            logger.info(f"Requested area does not overlap with {infile}.")
+            return None
+
+        # snap to full pixels
+        window = from_bounds(left, bottom, right, top, transform=src.transform)
+        col_off, row_off = int(np.floor(round(window.col_off, 6))), int(np.floor(round(window.row_off, 6)))
+        window = Window(
+            col_off,
+            row_off,
+            int(np.ceil(round(window.col_off + window.width, 6))) - col_off,
+            int(np.ceil(round(window.row_off + window.height, 6))) - row_off,
+        )
+
+        meta = src.meta.copy()
+        meta.update(
+            driver="GTiff",
+            width=window.width,
+            height=window.height,
+            transform=src.window_transform(window),
+            nodata=src.nodata if src.nodata is not None else 0,
+            tiled=True,
+            blockxsize=128,
+            blockysize=128,
+        )
+
+        with rasterio.open(outfile, "w", **meta) as dst:
+            for _, block in dst.block_windows(1):
+                src_block = Window(
+                    window.col_off + block.col_off,
+                    window.row_off + block.row_off,
+                    block.width,
+                    block.height,
+                )
+                dst.write(src.read(window=src_block), window=block)
+
+    if features:
+        _mask_by_blocks(outfile, features)
+
+    return outfile
+
+
+def gd_materialize(list_of_args):
+
+    infile, outfile, aoi = list_of_args
+    return materialize(infile, outfile, aoi)
+
+
+def export_mosaics(mosaic_dir, config_file, outdir=None):
+    """Materialize the virtual mosaic layers of a mosaic folder to GeoTiffs
+
+    The layer stacks (Timescan.vrt and *.Timeseries.vrt) are skipped, and
+    already exported layers are kept. If cut_to_aoi is set, the layers are
+    masked by the AOI polygon.
+
+    :param mosaic_dir: folder with the virtual mosaics, e.g. Mosaic/Timescan
+    :param config_file: path to the project configuration file
+    :param outdir: output folder, defaults to the mosaic folder
+    :return: list of exported GeoTiffs
+    """
+
+    with open(config_file, "r") as ard_file:
+        config_dict = json.load(ard_file)
+        aoi = config_dict["aoi"] if config_dict["processing"]["mosaic"]["cut_to_aoi"] else None
+
+    outdir = Path(outdir) if outdir else Path(mosaic_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    iter_list, outfiles = [], []
+    for infile in sorted(Path(mosaic_dir).glob("*.vrt")):
+
+        if infile.name == "Timescan.vrt" or infile.name.endswith(".Timeseries.vrt"):
+            continue
+
+        outfile = outdir / infile.with_suffix(".tif").name
+        if outfile.exists():
+            logger.info(f"{outfile.name} already exported.")
+            outfiles.append(outfile)
+            continue
+
+        logger.info(f"Exporting virtual mosaic {infile.name}.")
+        iter_list.append([infile, outfile, aoi])
+
+    # now we run with godale, which works also with 1 worker
+    executor = Executor(executor=config_dict["executor_type"], max_workers=config_dict["max_workers"])
+    for task in executor.as_completed(func=gd_materialize, iterable=iter_list):
+        outfile = task.result()
+        if outfile:
+            outfiles.append(outfile)
+
+    return sorted(outfiles)
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def mosaic(filelist, outfile, config_file, cut_to_aoi=None, harm=None):
+
+    # vrt output means virtual mosaics
+    if outfile.suffix == ".vrt":
+        return virtual_mosaic(filelist, outfile, config_file, cut_to_aoi, harm)
+
     with open(config_file, "r") as ard_file:
         config_dict = json.load(ard_file)
         temp_dir = config_dict["temp_dir"]
+        processing_dir = config_dict["processing_dir"]
         aoi = config_dict["aoi"]
-        epsg = config_dict["processing"]["single_ARD"]["dem"]["out_projection"]
 
         if not harm:
             harm = config_dict["processing"]["mosaic"]["harmonization"]
@@ -47,6 +345,16 @@ def mosaic(filelist, outfile, config_file, cut_to_aoi=None, harm=None):
         if not cut_to_aoi:
             cut_to_aoi = config_dict["processing"]["mosaic"]["cut_to_aoi"]
 
+    if is_processed(outfile, config_dict):
+        logger.info(f"{outfile} already exists.")
+        return
+
+    logger.info(f"Mosaicking file {outfile}.")
+
+    # record the start of the task in the job ledger
+    task, _ = _task(outfile)
+    ledger.start(processing_dir, task, filelist.split(" "), config_dict["processing"])
+
     logfile = outfile.parent / f"{str(outfile)[:-4]}.errLog"
 
     with TemporaryDirectory(prefix=f"{temp_dir}/") as temp:
@@ -58,72 +366,70 @@ def mosaic(filelist, outfile, config_file, cut_to_aoi=None, harm=None):
             dtype = src.meta["dtype"]
             dtype = "float" if dtype == "float32" else dtype
 
+        # apply gain and offset from the cached overlap samples, instead
+        # of letting OTB derive the statistics for each and every layer
+        if harm:
+            cache_dir = Path(processing_dir) / "Mosaic" / ".harmonization"
+            filelist = harmonization.harmonize(filelist, temp, cache_dir)
+
+        # restrict the output to the aoi, so that OTB only
+        # resamples and writes the part we actually keep
+        out_extent, out_name = "", str(outfile)
         if cut_to_aoi:
-            tempfile = (temp / outfile).name
-        else:
-            tempfile = outfile
 
-        harm = "band" if harm else "none"
+            window = _aoi_window(filelist, aoi)
+            if not window:
+                logger.info(f"AOI does not overlap with the input files of {outfile.name}.")
+                ledger.fail(processing_dir, [task], "AOI does not overlap with the input files")
+                return
+
+            left, top, width, height, res_x, res_y, features = window
+
+            # OTB expects the centre of the upper left pixel
+            out_extent = (
+                f"-output.ulx {left + res_x / 2} "
+                f"-output.uly {top - res_y / 2} "
+                f"-output.sizex {width} "
+                f"-output.sizey {height} "
+                f"-output.spacingx {res_x} "
+                f"-output.spacingy {-res_y} "
+            )
+            out_name = f"{outfile}?&gdal:co:TILED=YES&gdal:co:BLOCKXSIZE=128&gdal:co:BLOCKYSIZE=128"
 
         cmd = (
             f"otbcli_Mosaic -ram 8192  -progress 1 "
             f"-comp.feather large "
-            f"-harmo.method {harm} "
-            f"-harmo.cost rmse "
+            f"-harmo.method none "
             f"-tmpdir {str(temp)} "
-            f"-interpolator bco"
+            f"-interpolator bco "
+            f"{out_extent}"
             f" -il {filelist} "
-            f" -out {str(tempfile)} {dtype}"
+            f" -out '{out_name}' {dtype}"
         )
 
         return_code = h.run_command(cmd, logfile)
 
         if return_code != 0:
-            if tempfile.exists():
-                tempfile.unlink()
+            if outfile.exists():
+                outfile.unlink()
 
+            ledger.fail(processing_dir, [task], f"Mosaicking failed with {return_code}")
             return
 
+        # mask the remaining parts outside the aoi polygon
         if cut_to_aoi:
-
-            # get aoi in a way rasterio wants it
-            aoi_gdf = vec.wkt_to_gdf(aoi)
-            features = vec.gdf_to_json_geometry(aoi_gdf.to_crs(epsg=epsg))
-
-            # import raster and mask
-            with rasterio.open(tempfile) as src:
-                out_image, out_transform = rasterio.mask.mask(src, features, crop=True)
-                out_meta = src.meta.copy()
-                ndv = src.nodata
-                out_image = np.ma.masked_where(out_image == ndv, out_image)
-
-                out_meta.update(
-                    {
-                        "driver": "GTiff",
-                        "height": out_image.shape[1],
-                        "width": out_image.shape[2],
-                        "transform": out_transform,
-                        "tiled": True,
-                        "blockxsize": 128,
-                        "blockysize": 128,
-                    }
-                )
-
-                with rasterio.open(outfile, "w", **out_meta) as dest:
-                    dest.write(out_image.data)
-
-            # remove intermediate file
-            tempfile.unlink()
+            _mask_by_blocks(outfile, features)
 
         # check
         return_code = h.check_out_tiff(outfile)
         if return_code != 0:
             if outfile.exists():
                 outfile.unlink()
+
+            ledger.fail(processing_dir, [task], f"File check failed with {return_code}")
         else:
-            check_file = outfile.parent / f".{outfile.name[:-4]}.processed"
-            with open(str(check_file), "w") as file:
-                file.write("passed all tests \n")
+            # record the task as done in the job ledger
+            ledger.finish(processing_dir, task, [outfile])
 
 
 def gd_mosaic(list_of_args):
@@ -135,7 +441,6 @@ def gd_mosaic(list_of_args):
 def _burst_list(track, date, product, subswath, config_dict):
 
     from shapely.wkt import loads
-    import geopandas as gpd
 
     aoi = loads(config_dict["aoi"])
     processing_dir = Path(config_dict["processing_dir"])
@@ -144,34 +449,25 @@ def _burst_list(track, date, product, subswath, config_dict):
     search_last = f"*.{product}.tif" if "coh" in product else f"{product}.tif"
 
     # search for all bursts within subswath(s) in time-series
-    list_of_files = list(
-        processing_dir.glob(f"[A,D]{track}_{subswath}*/Timeseries/" f"*.{date}.{search_last}")
+    list_of_files = catalogue.glob(
+        processing_dir, f"[A,D]{track}_{subswath}*/Timeseries/*.{date}.{search_last}"
     )
 
     # search for timescans (in case timeseries not found)
     if not list_of_files:
 
-        list_of_files = list(
-            processing_dir.glob(f"[A,D]{track}_{subswath}*/Timescan/" f"*.{product}.{date}.tif")
+        list_of_files = catalogue.glob(
+            processing_dir, f"[A,D]{track}_{subswath}*/Timescan/*.{product}.{date}.tif"
         )
 
     if not list_of_files:
         return None
 
-    # get a list of all extent files to check for real AOI overlap
-    if config_dict["processing"]["time-series_ARD"]["apply_ls_mask"]:
-        list_of_extents = processing_dir.glob(f"*{track}_{subswath}*/*{track}*.valid.json")
-    else:
-        list_of_extents = processing_dir.glob(f"*{track}_{subswath}*/*{track}*.min_bounds.json")
-
-    list_of_actual_extents = []
-    for burst_extent in list_of_extents:
-
-        burst = gpd.read_file(burst_extent)
-        if any(burst.intersects(aoi)):
-
-            burst_name = Path(str(burst_extent).split(".")[-3]).name
-            list_of_actual_extents.append(burst_name)
+    # get all bursts that actually overlap with the AOI from the extent index
+    kind = "valid" if config_dict["processing"]["time-series_ARD"]["apply_ls_mask"] else "min_bounds"
+    list_of_actual_extents = extent_index.query_extent_index(
+        processing_dir, aoi, kind=kind, pattern=f"*{track}_{subswath}*"
+    )
 
     # filter the bursts for real AOI overlap
     list_of_files = [
@@ -184,47 +480,51 @@ def _burst_list(track, date, product, subswath, config_dict):
 
 
 def mosaic_slc_acquisition(track, date, product, outfile, config_file):
+    """Mosaic the bursts of an SLC acquisition
+
+    The bursts of the IW1 and IW2 subswaths, and the ones of the IW3
+    subswath, are harmonized to each other as two groups. Instead of
+    writing a pre-mosaic per group, each burst is only referenced as a VRT
+    carrying the correction of its group, and all bursts are blended with
+    feathering within a single OTB mosaic.
+
+    :param track: track of the acquisition
+    :param date: date of the acquisition
+    :param product: product, e.g. bs.VV
+    :param outfile: output file of the acquisition mosaic
+    :param config_file: path to the project configuration file
+    """
 
     # -------------------------------------
     # 1 load project config
     with open(config_file, "r") as ard_file:
         config_dict = json.load(ard_file)
-        temp_dir = Path(config_dict["temp_dir"])
+        temp_dir = config_dict["temp_dir"]
+        processing_dir = config_dict["processing_dir"]
+
+    if is_processed(outfile, config_dict):
+        logger.info(f"{outfile} already exists.")
+        return
 
     # create a list of bursts that actually overlap theAOI
     list_of_iw12 = _burst_list(track, date, product, "IW[1,2]", config_dict)
     list_of_iw3 = _burst_list(track, date, product, "IW3", config_dict)
+    groups = [files for files in [list_of_iw12, list_of_iw3] if files]
+    if not groups:
+        return
 
-    if list_of_iw12:
-        logger.info(
-            f"Pre-mosaicking {product} acquisition's IW1 and IW2 subswaths " f"from {track} taken at {date}."
-        )
-        temp_iw12 = temp_dir / f"{date}_{track}_{product}_IW1_2.tif"
-        mosaic(list_of_iw12, temp_iw12, config_file, harm=False)
-
-    if list_of_iw3:
-        logger.info(f"Pre-mosaicking {product} acquisition's IW3 subswath " f"from {track} taken at {date}.")
-        temp_iw3 = temp_dir / f"{date}_{track}_{product}_IW3.tif"
-        mosaic(list_of_iw3, temp_iw3, config_file, harm=False)
-
-    if list_of_iw12 and list_of_iw3:
-        mosaic(
-            " ".join([str(temp_iw12), str(temp_iw3)]),
-            outfile,
-            config_file,
-            False,
-            harm=True,
-        )
+    logger.info(f"Mosaicking {product} acquisition from {track} taken at {date}.")
 
-        temp_iw12.unlink()
-        temp_iw3.unlink()
-    elif list_of_iw12 and not list_of_iw3:
-        shutil.move(temp_iw12, outfile)
-    elif not list_of_iw12 and list_of_iw3:
-        shutil.move(temp_iw3, outfile)
-    else:
+    # virtual mosaics and single subswath groups reference the bursts directly
+    if outfile.suffix == ".vrt" or len(groups) == 1:
+        mosaic(" ".join(groups), outfile, config_file)
         return
 
+    with TemporaryDirectory(prefix=f"{temp_dir}/") as temp:
+        cache_dir = Path(processing_dir) / "Mosaic" / ".harmonization"
+        filelist = harmonization.harmonize_groups(groups, temp, cache_dir)
+        mosaic(filelist, outfile, config_file)
+
 
 def gd_mosaic_slc_acquisition(list_of_args):
 
@@ -0,0 +1,259 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Native multi-temporal speckle filter
+
+Implementation of the multi-temporal filter by Quegan & Yu (2001):
+
+    J_k = E[I_k] / N * sum_i(I_i / E[I_i])
+
+with E[I] being the local mean of each image as estimated by a spatial
+speckle filter. The stack is processed in tiles in parallel, with a halo
+around each tile for the spatial filter. The filtered tiles are directly
+converted and written to the final time-series layers, so there is no
+need for an intermediate filtered stack.
+"""
+
+import logging
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import fiona
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window, transform as window_transform
+from scipy import ndimage
+
+from ost.helpers import raster as ras
+
+logger = logging.getLogger(__name__)
+
+# spatial filters with a native implementation
+NATIVE_FILTERS = ["None", "Boxcar", "Median", "Lee"]
+
+TILE_SIZE = 512
+
+
+def _estimate_enl(infile):
+    """Estimate the equivalent number of looks of an intensity image
+
+    The ENL is taken as median of mean²/variance over 7x7 windows
+    of a decimated read of the image, which is dominated by
+    homogeneous areas.
+
+    :param infile: intensity image
+    :return: ENL
+    """
+
+    with rasterio.open(infile) as src:
+        out_shape = (min(src.height, 2048), min(src.width, 2048))
+        arr = src.read(1, out_shape=out_shape).astype("float64")
+
+    arr[arr == 0] = np.nan
+    mean = ndimage.uniform_filter(np.nan_to_num(arr), 7)
+    var = ndimage.uniform_filter(np.nan_to_num(arr) ** 2, 7) - mean**2
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        enl = mean**2 / var
+
+    enl = enl[np.isfinite(enl) & np.isfinite(arr) & (enl > 0)]
+    return float(np.median(enl)) if enl.size else 1.0
+
+
+def _local_mean(arr, speckle_dict, enl):
+    """Estimate the local mean of an intensity image by a spatial filter
+
+    :param arr: 2-d intensity array with nans as no-data
+    :param speckle_dict: the mt_speckle_filter parameters
+    :param enl: equivalent number of looks
+    :return: 2-d array of the local mean
+    """
+
+    size = (speckle_dict["filter_y_size"], speckle_dict["filter_x_size"])
+    valid = np.isfinite(arr)
+    data = np.where(valid, arr, 0)
+
+    if speckle_dict["filter"] == "None":
+        return arr
+
+    if speckle_dict["filter"] == "Median":
+        return np.where(valid, ndimage.median_filter(data, size=size), np.nan)
+
+    # normalised boxcar, ignoring no-data pixels
+    count = ndimage.uniform_filter(valid.astype("float64"), size)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = ndimage.uniform_filter(data, size) / count
+
+        if speckle_dict["filter"] == "Boxcar":
+            return np.where(valid, mean, np.nan)
+
+        # Lee filter
+        var = ndimage.uniform_filter(data**2, size) / count - mean**2
+        noise = 1 / enl
+        weight = (1 - noise * mean**2 / var) / (1 + noise)
+        weight = np.clip(np.nan_to_num(weight), 0, 1)
+
+    return np.where(valid, mean + weight * (data - mean), np.nan)
+
+
+def _filter_tile(stack, window, halo, speckle_dict, enl):
+    """Apply the multi-temporal filter to a single tile of the stack
+
+    :param stack: list of co-registered intensity images
+    :param window: the tile's window
+    :param halo: number of pixels added around the tile for the filter
+    :param speckle_dict: the mt_speckle_filter parameters
+    :param enl: equivalent number of looks
+    :return: window and 3-d array of the filtered tile
+    """
+
+    # add halo, within the image bounds
+    with rasterio.open(stack[0]) as src:
+        height, width = src.height, src.width
+
+    col_off = max(window.col_off - halo, 0)
+    row_off = max(window.row_off - halo, 0)
+    read_window = Window(
+        col_off,
+        row_off,
+        min(window.col_off + window.width + halo, width) - col_off,
+        min(window.row_off + window.height + halo, height) - row_off,
+    )
+
+    images = []
+    for file in stack:
+        with rasterio.open(file) as src:
+            arr = src.read(1, window=read_window).astype("float64")
+        arr[arr == 0] = np.nan
+        images.append(arr)
+
+    means = [_local_mean(arr, speckle_dict, enl) for arr in images]
+
+    # the normalised sum of all images
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        ratios = np.nanmean([arr / mean for arr, mean in zip(images, means)], axis=0)
+        filtered = np.array([mean * ratios for mean in means])
+
+    # crop the halo
+    row_start, col_start = window.row_off - row_off, window.col_off - col_off
+    row_stop, col_stop = row_start + window.height, col_start + window.width
+    filtered = filtered[:, row_start:row_stop, col_start:col_stop]
+
+    return window, filtered.astype("float32")
+
+
+def mt_speckle_to_tifs(
+    stack,
+    outfiles,
+    vector,
+    speckle_dict,
+    to_db=False,
+    datatype="float32",
+    min_value=0.000001,
+    max_value=1,
+    max_workers=1,
+):
+    """Apply the multi-temporal filter and write the time-series layers
+
+    The output is cropped and masked by the vector file, and converted the
+    same way as with ras.mask_by_shape.
+
+    :param stack: list of co-registered intensity images, one per date
+    :param outfiles: list of output GeoTiffs, one per date
+    :param vector: vector file to crop and mask the output to
+    :param speckle_dict: the mt_speckle_filter parameters
+    :param to_db: convert to dB
+    :param datatype: output datatype
+    :param min_value: minimum value for the conversion to integer
+    :param max_value: maximum value for the conversion to integer
+    :param max_workers: number of tiles to process in parallel
+    :return: list of output GeoTiffs
+    """
+
+    with fiona.open(vector, "r") as file:
+        features = [feature["geometry"] for feature in file if feature["geometry"]]
+
+    enl = speckle_dict["ENL"]
+    if speckle_dict["filter"] == "Lee" and speckle_dict["estimate_ENL"]:
+        enl = _estimate_enl(stack[0])
+        logger.debug(f"Estimated ENL: {enl:.2f}")
+
+    halo = max(speckle_dict["filter_x_size"], speckle_dict["filter_y_size"])
+
+    with rasterio.open(stack[0]) as src:
+        window = geometry_window(src, features)
+        transform = src.window_transform(window)
+        meta = src.meta.copy()
+
+    meta.update(
+        driver="GTiff",
+        height=window.height,
+        width=window.width,
+        transform=transform,
+        nodata=0,
+        dtype=datatype,
+        tiled=True,
+        blockxsize=128,
+        blockysize=128,
+    )
+
+    # check that block size is in range of image (for very small subsets)
+    if meta["blockysize"] > window.height:
+        del meta["blockysize"]
+
+    if meta["blockxsize"] > window.width:
+        del meta["blockxsize"]
+
+    tiles = [
+        Window(
+            window.col_off + col,
+            window.row_off + row,
+            min(TILE_SIZE, window.width - col),
+            min(TILE_SIZE, window.height - row),
+        )
+        for row in range(0, window.height, TILE_SIZE)
+        for col in range(0, window.width, TILE_SIZE)
+    ]
+
+    dests = [rasterio.open(outfile, "w", **meta) for outfile in outfiles]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tasks = [
+                executor.submit(_filter_tile, stack, tile, halo, speckle_dict, enl) for tile in tiles
+            ]
+
+            for task in as_completed(tasks):
+                tile, filtered = task.result()
+
+                # position within output and mask outside the vector
+                out_window = Window(
+                    tile.col_off - window.col_off, tile.row_off - window.row_off, tile.width, tile.height
+                )
+                outside = geometry_mask(
+                    features,
+                    out_shape=(tile.height, tile.width),
+                    transform=window_transform(out_window, transform),
+                )
+                filtered[:, outside] = np.nan
+
+                if to_db:
+                    filtered = ras.convert_to_db(filtered)
+
+                if datatype in ["uint8", "uint16"]:
+                    filtered = ras.scale_to_int(filtered, min_value, max_value, datatype)
+
+                for dest, arr in zip(dests, filtered):
+                    dest.write(np.nan_to_num(arr).astype(datatype), window=out_window, indexes=1)
+
+        # add some metadata to tif-file
+        for dest, file in zip(dests, stack):
+            dest.update_tags(1, BAND_NAME=file.stem)
+            dest.set_band_description(1, file.stem)
+    finally:
+        for dest in dests:
+            dest.close()
+
+    return outfiles
@@ -328,13 +328,7 @@ def mt_metrics(stack, out_prefix, metrics, rescale_to_datatype, to_power, outlie
                 if Path(f"{filename}.xml").exists():
                     Path(f"{filename}.xml").unlink()
 
-            return None, None, None, return_code
-
-    # write out that it's been processed
-    dirname = out_prefix.parent
-    check_file = dirname / f".{out_prefix.name}.processed"
-    with open(str(check_file), "w") as file:
-        file.write("passed all tests \n")
+            return out_prefix.parent.parent.name, out_prefix.name, None, return_code
 
     target = out_prefix.parent.parent.name
     return target, out_prefix.name, metrics, None
@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Native multi-temporal stacking of ARD products
+
+ARD products of the same burst/track are usually terrain corrected onto
+the same output grid already. In this case, there is no need for SNAP's
+Create-Stack, and each date is referenced as a VRT on a common extent.
+Only products that are not aligned to this grid are resampled.
+"""
+
+import logging
+from pathlib import Path
+from datetime import datetime as dt
+
+import numpy as np
+import rasterio
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling, transform_bounds
+from rasterio.transform import from_origin
+
+from ost.helpers import raster as ras
+
+logger = logging.getLogger(__name__)
+
+
+def _band_file(dim, pol=None, pattern=None):
+    """Get the image file of a single band from a DIMAP product
+
+    :param dim: path to the .dim file
+    :param pol: polarisation of the band
+    :param pattern: band name pattern (i.e. for H-A-Alpha bands)
+    :return: path to the band's .img file, or None if not unique
+    """
+
+    search = f"{pattern}*.img" if pattern else f"*{pol}*.img"
+    bands = list(Path(dim).with_suffix(".data").glob(search))
+    return bands[0] if len(bands) == 1 else None
+
+
+def _is_aligned(src, ref):
+    """Check if a raster is on the same grid as the reference
+
+    :param src: rasterio dataset
+    :param ref: dict with crs, res and origin of the reference grid
+    :return: bool
+    """
+
+    if src.crs != ref["crs"] or not np.allclose(src.res, ref["res"]):
+        return False
+
+    # the origin needs to be shifted by full pixels only
+    shift_x = (src.transform.c - ref["origin"][0]) / ref["res"][0]
+    shift_y = (ref["origin"][1] - src.transform.f) / ref["res"][1]
+    return np.allclose([shift_x, shift_y], np.round([shift_x, shift_y]), atol=1e-3)
+
+
+def native_stack(list_of_dims, out_dir, pol=None, pattern=None):
+    """Stack ARD products of different dates without SNAP
+
+    The common extent of all products is referenced for every date as a VRT.
+    Products that do not share the grid of the first product are resampled
+    to it with cubic interpolation.
+
+    :param list_of_dims: list of ARD products in BEAM-DIMAP format, each one
+                         within a directory named after the acquisition date
+    :param out_dir: directory where the per-date files are written to
+    :param pol: polarisation of the bands to stack
+    :param pattern: band name pattern (i.e. for H-A-Alpha bands)
+    :return: list of (date, file) tuples sorted by date, or None if the
+             products can not be stacked natively
+    """
+
+    out_dir = Path(out_dir)
+
+    bands = {}
+    for dim in list_of_dims:
+
+        # get date from directory name
+        try:
+            date = dt.strptime(Path(dim).parent.name, "%Y%m%d")
+        except ValueError:
+            return None
+
+        band = _band_file(dim, pol, pattern)
+        if not band or date in bands:
+            return None
+
+        bands[date] = band
+
+    # get reference grid and common extent from all products
+    aligned = {}
+    for date, band in sorted(bands.items()):
+        with rasterio.open(band) as src:
+
+            if not src.crs:
+                return None
+
+            if not aligned:
+                ref = {"crs": src.crs, "res": src.res, "origin": (src.transform.c, src.transform.f)}
+                left, bottom, right, top = src.bounds
+
+            aligned[date] = _is_aligned(src, ref)
+            src_bounds = (
+                src.bounds if aligned[date] else transform_bounds(src.crs, ref["crs"], *src.bounds)
+            )
+
+        left, bottom = max(left, src_bounds[0]), max(bottom, src_bounds[1])
+        right, top = min(right, src_bounds[2]), min(top, src_bounds[3])
+
+    if left >= right or bottom >= top:
+        return None
+
+    # snap the common extent inwards to the reference grid
+    res_x, res_y = ref["res"]
+    origin_x, origin_y = ref["origin"]
+    left = origin_x + np.ceil(np.round((left - origin_x) / res_x, 6)) * res_x
+    top = origin_y - np.ceil(np.round((origin_y - top) / res_y, 6)) * res_y
+    width = int(np.floor(np.round((right - left) / res_x, 6)))
+    height = int(np.floor(np.round((top - bottom) / res_y, 6)))
+
+    if not all(aligned.values()):
+        logger.debug(f"Resampling {list(aligned.values()).count(False)} products to the common grid.")
+
+    stack = []
+    for date, band in sorted(bands.items()):
+
+        outfile = out_dir / f"{band.stem}_{date.strftime('%d%b%Y')}"
+        if aligned[date]:
+            outfile = ras.create_complex_vrt(
+                [(band, 1, 0)], outfile.with_suffix(".vrt"), extent=(left, top, width, height)
+            )
+        else:
+            transform = from_origin(left, top, res_x, res_y)
+            outfile = _resample(band, outfile.with_suffix(".tif"), ref["crs"], transform, width, height)
+
+        stack.append((date.strftime("%y%m%d"), Path(outfile)))
+
+    return stack
+
+
+def _resample(infile, outfile, crs, transform, width, height):
+    """Resample a raster to a given grid, block by block
+
+    :param infile: the input raster
+    :param outfile: the output GeoTiff
+    :param crs: CRS of the target grid
+    :param transform: affine transform of the target grid
+    :param width: width of the target grid
+    :param height: height of the target grid
+    :return: path to the output GeoTiff
+    """
+
+    with rasterio.open(infile) as src:
+        ndv = src.nodata if src.nodata is not None else 0
+        with WarpedVRT(
+            src,
+            crs=crs,
+            transform=transform,
+            width=width,
+            height=height,
+            resampling=Resampling.cubic,
+            src_nodata=ndv,
+            nodata=ndv,
+        ) as vrt:
+
+            meta = vrt.meta.copy()
+            meta.update(driver="GTiff", tiled=True, blockxsize=256, blockysize=256)
+            with rasterio.open(outfile, "w", **meta) as dst:
+                for _, window in dst.block_windows(1):
+                    dst.write(vrt.read(window=window), window=window)
+
+    return outfile
@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent checkpoints of step-wise processing chains
+
+Each intermediate product of a chain is named after a key derived from
+the key of its input and the parameters of the step that creates it, with
+the first key derived from the chain's input files. A finished step is
+marked with a small file that references the key of its input. When the
+chain is run again, e.g. after a failure, all steps up to the last valid
+intermediate product are skipped. Once the final product is in place,
+the checkpoints are evicted.
+
+New products can be written to a separate working directory, e.g. a staged
+directory on a RAM disk. In that case only the last product of the chain
+(and its branches) is copied back to the persistent directory when the chain
+stops, so a rerun resumes from there.
+"""
+
+import json
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+from ost.helpers import helpers as h
+
+logger = logging.getLogger(__name__)
+
+# directory within the temp directory that holds the checkpoints
+CHECKPOINT_DIR = "checkpoints"
+
+
+def _hash(content):
+
+    content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+class Checkpoints:
+    """Checkpoints of a single processing chain
+
+    :param directory: persistent directory for the intermediate products
+    :param inputs: list of the chain's input files
+    :param work_dir: directory for new products, defaults to directory
+    """
+
+    def __init__(self, directory, inputs, work_dir=None):
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.work_dir = Path(work_dir) if work_dir else self.directory
+
+        # input files are identified by their name and size
+        self.key = _hash([(Path(file).name, h.product_size(file)) for file in inputs])
+        self._keys = {}
+
+        # committed products to copy back from the working directory
+        self._last, self._branches = None, []
+
+        # keys of all valid products and the steps before them
+        self._reached = set()
+        for marker in self.directory.glob("*.checkpoint"):
+            try:
+                with marker.open("r") as file:
+                    checkpoint = json.load(file)
+            # markers of interrupted runs
+            except ValueError:
+                continue
+
+            if h.check_out_dimap(self.directory / checkpoint["product"], test_stats=False) != 0:
+                continue
+
+            # branches are no input to later steps, so their own
+            # step can be skipped only
+            key = marker.stem
+            if checkpoint["branch"]:
+                self._reached.add(key)
+                continue
+
+            while key and key not in self._reached:
+                self._reached.add(key)
+                key = self._parent(key)
+
+        if self._reached:
+            logger.info("Resuming from checkpoints of a previous run.")
+
+    def _parent(self, key):
+
+        marker = self.directory / f"{key}.checkpoint"
+        if not marker.exists():
+            return None
+
+        with marker.open("r") as file:
+            return json.load(file)["parent"]
+
+    def branch(self, name, **parameters):
+        """Get the product of a step that branches off the chain
+
+        :param name: name of the step
+        :param parameters: parameters of the step
+        :return: product path without suffix
+        """
+
+        return self._product(name, parameters, branch=True)
+
+    def _product(self, name, parameters, branch):
+
+        key = _hash([self.key, name, parameters])
+
+        # valid products of previous runs are used in place
+        product = self.directory / f"{name}_{key}"
+        if key not in self._reached or not product.with_suffix(".dim").exists():
+            product = self.work_dir / f"{name}_{key}"
+
+        self._keys[product] = (key, self.key, branch)
+        return product
+
+    def step(self, name, **parameters):
+        """Get the product of the next step of the chain
+
+        :param name: name of the step
+        :param parameters: parameters of the step
+        :return: product path without suffix
+        """
+
+        product = self._product(name, parameters, branch=False)
+        self.key = self._keys[product][0]
+        return product
+
+    def reached(self, product):
+        """Check if a step can be skipped
+
+        :param product: product of the step
+        :return: True if the product or a later one is valid
+        """
+
+        return self._keys[product][0] in self._reached
+
+    def commit(self, *products):
+        """Mark steps as finished
+
+        :param products: products of the finished steps
+        """
+
+        for product in products:
+            key, parent, branch = self._keys[product]
+            with (self.directory / f"{key}.checkpoint").open("w") as file:
+                json.dump({"product": product.name, "parent": parent, "branch": branch}, file)
+
+            if branch:
+                self._branches.append(product)
+            else:
+                self._last = product
+
+    def persist(self):
+        """Copy the last product and its branches back to the persistent directory
+
+        Earlier products of the chain are not needed to resume, so they
+        remain in the working directory.
+        """
+
+        if self.work_dir == self.directory:
+            return
+
+        for product in [self._last, *self._branches]:
+            if not product or product.parent != self.work_dir:
+                continue
+
+            # nothing is left of products that were moved on already
+            for file in self.work_dir.glob(f"{product.name}.*"):
+                if file.is_dir():
+                    shutil.copytree(file, self.directory / file.name)
+                else:
+                    shutil.copy2(file, self.directory / file.name)
+
+    def evict(self):
+        """Remove all checkpoints of the chain"""
+
+        shutil.rmtree(self.directory, ignore_errors=True)
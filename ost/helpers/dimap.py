@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Creation of BEAM-DIMAP products from numpy
+
+Bands that are computed with numpy are written as a BEAM-DIMAP product
+that inherits the metadata, tie point grids and geocoding of the product
+they are derived from. This way, they can be passed on to SNAP operators,
+e.g. for terrain correction, like any product written by SNAP itself.
+"""
+
+import shutil
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from ost.helpers import envi
+
+logger = logging.getLogger(__name__)
+
+# elements that refer to the bands of the source product
+BAND_ELEMENTS = ["Image_Display", "Masks"]
+
+
+def _element(parent, tag, text=None, **attributes):
+
+    element = ET.SubElement(parent, tag, attributes)
+    if text is not None:
+        element.text = str(text)
+    return element
+
+
+def derive_product(source, outfile, bands, unit=""):
+    """Create a BEAM-DIMAP product with the metadata of another product
+
+    The bands are created as float32 images of the size of the source
+    product, filled with 0, which is also set as no-data value.
+
+    :param source: BEAM-DIMAP product without suffix, to take the metadata from
+    :param outfile: the new BEAM-DIMAP product without suffix
+    :param bands: list of band names
+    :param unit: physical unit of the bands
+    :return: dict of band names and their numpy.memmap, opened for writing
+    """
+
+    source, outfile = Path(source), Path(outfile)
+    tree = ET.parse(str(source.with_suffix(".dim")))
+    root = tree.getroot()
+
+    root.set("name", outfile.with_suffix(".dim").name)
+    root.find("Dataset_Id/DATASET_NAME").text = outfile.name
+
+    cols = int(root.findtext("Raster_Dimensions/NCOLS"))
+    rows = int(root.findtext("Raster_Dimensions/NROWS"))
+    root.find("Raster_Dimensions/NBANDS").text = str(len(bands))
+
+    for tag in BAND_ELEMENTS:
+        for element in root.findall(tag):
+            root.remove(element)
+
+    # tie point grids and vector data are taken over as they are
+    outfile.with_suffix(".data").mkdir(parents=True, exist_ok=True)
+    for directory in source.with_suffix(".data").iterdir():
+        if directory.is_dir():
+            shutil.copytree(str(directory), str(outfile.with_suffix(".data") / directory.name))
+
+    # data files go before the tie point grid files
+    data_access = root.find("Data_Access")
+    tie_points = data_access.findall("Tie_Point_Grid_File")
+    for element in data_access.findall("Data_File") + tie_points:
+        data_access.remove(element)
+
+    for element in tie_points:
+        path = element.find("TIE_POINT_GRID_FILE_PATH")
+        path.set("href", f"{outfile.name}.data/{path.get('href').split('/', 1)[-1]}")
+
+    interpretation = root.find("Image_Interpretation")
+    for element in interpretation.findall("Spectral_Band_Info"):
+        interpretation.remove(element)
+
+    arrays = {}
+    for index, band in enumerate(bands):
+
+        data_file = _element(data_access, "Data_File")
+        _element(data_file, "DATA_FILE_PATH", href=f"{outfile.name}.data/{band}.hdr")
+        _element(data_file, "BAND_INDEX", index)
+
+        info = _element(interpretation, "Spectral_Band_Info")
+        for tag, text in [
+            ("BAND_INDEX", index),
+            ("BAND_DESCRIPTION", ""),
+            ("BAND_NAME", band),
+            ("BAND_RASTER_WIDTH", cols),
+            ("BAND_RASTER_HEIGHT", rows),
+            ("DATA_TYPE", "float32"),
+            ("PHYSICAL_UNIT", unit),
+            ("SOLAR_FLUX", 0.0),
+            ("BAND_WAVELEN", 0.0),
+            ("BANDWIDTH", 0.0),
+            ("SCALING_FACTOR", 1.0),
+            ("SCALING_OFFSET", 0.0),
+            ("LOG10_SCALED", "false"),
+            ("NO_DATA_VALUE_USED", "true"),
+            ("NO_DATA_VALUE", 0.0),
+        ]:
+            _element(info, tag, text)
+
+        arrays[band] = envi.create_band(
+            outfile.with_suffix(".data") / f"{band}.img", rows, cols, "f4", band, ignore=0.0
+        )
+
+    data_access.extend(tie_points)
+    tree.write(str(outfile.with_suffix(".dim")), encoding="ISO-8859-1", xml_declaration=True)
+    logger.debug(f"Created product {outfile.name} with the metadata of {source.name}.")
+
+    return arrays
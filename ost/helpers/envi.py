@@ -0,0 +1,210 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Memory-mapped access to the ENVI bands of BEAM-DIMAP products
+
+The .img files within the .data directory of a BEAM-DIMAP product are raw
+ENVI binaries, described by their .hdr files. Mapping them as numpy arrays
+gives zero-copy access to single rows and columns without opening a GDAL
+dataset, and only the pages that are actually sliced are read from disk.
+"""
+
+import re
+import itertools
+from pathlib import Path
+
+import numpy as np
+
+# ENVI data type codes
+DTYPES = {
+    1: "u1",
+    2: "i2",
+    3: "i4",
+    4: "f4",
+    5: "f8",
+    6: "c8",
+    9: "c16",
+    12: "u2",
+    13: "u4",
+    14: "i8",
+    15: "u8",
+}
+
+# number of rows checked at once when testing for valid data
+BLOCK_ROWS = 1024
+
+
+def read_header(hdr_file):
+    """Parse an ENVI header file
+
+    :param hdr_file: the .hdr file
+    :return: dict of lowercase keys and their values as str
+    """
+
+    with open(str(hdr_file), "r") as file:
+        content = file.read()
+
+    if not content.startswith("ENVI"):
+        raise ValueError(f"{hdr_file} is not an ENVI header file.")
+
+    header = {}
+    # values are either single lines or enclosed in curly braces
+    for key, value in re.findall(r"^\s*([^=\n]+?)\s*=\s*(\{[^}]*\}|[^\n]*)", content, re.MULTILINE):
+        header[key.lower()] = value.strip("{} \t\n")
+
+    return header
+
+
+def open_band(img_file, mode="r"):
+    """Map an ENVI image as numpy array
+
+    Images with a single band are mapped as 2-d array of rows and columns,
+    images with several bands as 3-d array of bands, rows and columns.
+
+    :param img_file: the .img file
+    :param mode: memmap mode, i.e. "r" for reading and "r+" for updating
+    :return: numpy.memmap
+    """
+
+    img_file = Path(img_file)
+    header = read_header(img_file.with_suffix(".hdr"))
+
+    byte_order = ">" if int(header.get("byte order", 0)) == 1 else "<"
+    dtype = np.dtype(byte_order + DTYPES[int(header["data type"])])
+
+    bands, rows, cols = (int(header[key]) for key in ["bands", "lines", "samples"])
+    interleave = header.get("interleave", "bsq").lower()
+
+    shape = {
+        "bsq": (bands, rows, cols),
+        "bil": (rows, bands, cols),
+        "bip": (rows, cols, bands),
+    }[interleave]
+
+    array = np.memmap(
+        str(img_file), dtype=dtype, mode=mode, offset=int(header.get("header offset", 0)), shape=shape
+    )
+
+    if bands == 1:
+        return array.reshape(rows, cols)
+
+    # bring bands to the first axis
+    return array if interleave == "bsq" else np.moveaxis(array, -2 if interleave == "bil" else -1, 0)
+
+
+def open_complex(i_band):
+    """Map the i band of a complex image and its q band
+
+    :param i_band: the .img file of the i band, e.g. i_IW1_VV.img
+    :return: tuple of numpy.memmap of the i and q band
+    """
+
+    i_band = Path(i_band)
+    return open_band(i_band), open_band(i_band.with_name(f"q{i_band.name[1:]}"))
+
+
+def read_complex(bands, rows, cols):
+    """Read a window of a complex image as complex64 array
+
+    :param bands: i and q band as returned by open_complex
+    :param rows: slice of rows
+    :param cols: slice of columns
+    :return: 2-d numpy array
+    """
+
+    i_band, q_band = bands
+    array = np.empty((rows.stop - rows.start, cols.stop - cols.start), dtype="complex64")
+    array.real = i_band[rows, cols]
+    array.imag = q_band[rows, cols]
+    return array
+
+
+def tiles(shape, tile_rows, tile_cols):
+    """Get the slices of rows and columns of all tiles of an image
+
+    :param shape: number of rows and columns of the image
+    :param tile_rows: number of rows of a tile
+    :param tile_cols: number of columns of a tile
+    :return: list of (rows, columns) tuples of slices
+    """
+
+    return [
+        (slice(row, min(row + tile_rows, shape[0])), slice(col, min(col + tile_cols, shape[1])))
+        for row, col in itertools.product(range(0, shape[0], tile_rows), range(0, shape[1], tile_cols))
+    ]
+
+
+def create_band(img_file, rows, cols, dtype="f4", band_name=None, ignore=None):
+    """Create a single band ENVI image and map it as numpy array
+
+    The image is written in big endian byte order, like SNAP does.
+
+    :param img_file: the .img file
+    :param rows: number of rows
+    :param cols: number of columns
+    :param dtype: numpy data type, one of DTYPES
+    :param band_name: name of the band within the header
+    :param ignore: no-data value, if any
+    :return: numpy.memmap of rows and columns, initialised to 0
+    """
+
+    img_file = Path(img_file)
+    data_type = {value: key for key, value in DTYPES.items()}[np.dtype(dtype).str[1:]]
+
+    header = [
+        "ENVI",
+        f"samples = {cols}",
+        f"lines = {rows}",
+        "bands = 1",
+        "header offset = 0",
+        "file type = ENVI Standard",
+        f"data type = {data_type}",
+        "interleave = bsq",
+        "byte order = 1",
+    ]
+    if band_name:
+        header.append(f"band names = {{ {band_name} }}")
+    if ignore is not None:
+        header.append(f"data ignore value = {ignore}")
+
+    with open(str(img_file.with_suffix(".hdr")), "w") as file:
+        file.write("\n".join(header) + "\n")
+
+    return np.memmap(str(img_file), dtype=np.dtype(dtype).newbyteorder(">"), mode="w+", shape=(rows, cols))
+
+
+def ignore_value(img_file):
+    """Get the no-data value of an ENVI image, if any
+
+    :param img_file: the .img file
+    :return: no-data value as float, or None
+    """
+
+    value = read_header(Path(img_file).with_suffix(".hdr")).get("data ignore value")
+    return float(value) if value else None
+
+
+def has_valid_data(img_file):
+    """Check if an ENVI image holds any valid, non-zero value
+
+    The image is scanned block by block and the check stops at the first
+    valid value, so that usually only a small part of it is read.
+
+    :param img_file: the .img file
+    :return: bool
+    """
+
+    array = open_band(img_file)
+    ndv = ignore_value(img_file)
+
+    rows = array.shape[-2]
+    for row in range(0, rows, BLOCK_ROWS):
+        stop = row + BLOCK_ROWS
+        block = np.asarray(array[..., row:stop, :])
+        valid = np.isfinite(block) & (block != 0)
+        if ndv is not None:
+            valid &= block != ndv
+
+        if valid.any():
+            return True
+
+    return False
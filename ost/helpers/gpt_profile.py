@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Profiling and resource tuning of SNAP's gpt calls
+
+Every gpt call is timed and its CPU time and peak memory are recorded per
+operator (or graph) and input size in a SQLite database within the
+processing directory. Once there are enough profiles for an operator, they
+set the parallelism (-q), the tile cache (-c) and the maximum heap of the
+JVM for its subsequent calls, within the share of the node's memory that is
+available to a single worker.
+"""
+
+import os
+import re
+import sys
+import time
+import shlex
+import sqlite3
+import logging
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+from ost.helpers import helpers as h
+
+logger = logging.getLogger(__name__)
+
+PROFILES_NAME = ".gpt_profiles.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+# number of profiles needed before an operator is tuned,
+# and number of most recent profiles that are considered
+MIN_PROFILES = 3
+MAX_PROFILES = 50
+
+# share of the node's memory available to all workers together
+MEMORY_FRACTION = 0.8
+
+# margin on top of the expected peak memory, and bounds of the heap in MB
+HEADROOM = 1.25
+MIN_HEAP = 2048
+
+# share of the heap used for SNAP's tile cache
+CACHE_FRACTION = 0.5
+
+
+def _operator(tokens):
+    """Get the name of the operator or graph of a gpt call
+
+    For graphs, the name is made up from the operators within the graph,
+    so that graphs written for single products share the same profiles.
+
+    :param tokens: the split gpt command
+    :return: name of the operator
+    """
+
+    if not tokens[1].endswith(".xml"):
+        return tokens[1]
+
+    operators = []
+    for node in ET.parse(tokens[1]).getroot().iter("node"):
+        operator = node.findtext("operator")
+        if operator not in ["Read", "Write"] + operators:
+            operators.append(operator)
+
+    return "+".join(operators)
+
+
+def _input_size(tokens):
+    """Get the size of all input products of a gpt call
+
+    :param tokens: the split gpt command
+    :return: size in bytes
+    """
+
+    candidates = []
+    for i, token in enumerate(tokens[1:], start=1):
+
+        # skip target products
+        if tokens[i - 1] == "-t" or re.match(r"-P(output|target)=", token):
+            continue
+
+        if token.endswith(".xml"):
+            root = ET.parse(token).getroot()
+            candidates.extend(
+                node.findtext("parameters/file")
+                for node in root.iter("node")
+                if node.findtext("operator") == "Read"
+            )
+        else:
+            # strip parameter and source names
+            candidates.extend(re.sub(r"^-[PS]\w+=", "", token).split(","))
+
+    size = 0
+    for candidate in candidates:
+        if candidate and not candidate.startswith("-") and os.path.exists(candidate):
+            size += h.product_size(candidate)
+
+    return size
+
+
+def _connect(processing_dir):
+
+    connection = sqlite3.connect(str(Path(processing_dir) / PROFILES_NAME), timeout=TIMEOUT)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS profiles ("
+        "operator TEXT, input_size INTEGER, parallelism INTEGER, heap INTEGER, "
+        "wall_time REAL, cpu_time REAL, peak_rss INTEGER, timestamp REAL)"
+    )
+    return connection
+
+
+def _profiles(processing_dir, operator):
+    """Get the most recent profiles of an operator
+
+    :param processing_dir: the project's processing directory
+    :param operator: name of the operator
+    :return: 2-d array of input size, parallelism, wall time,
+             cpu time and peak rss
+    """
+
+    connection = _connect(processing_dir)
+    try:
+        rows = connection.execute(
+            "SELECT input_size, parallelism, wall_time, cpu_time, peak_rss FROM profiles "
+            "WHERE operator = ? ORDER BY timestamp DESC LIMIT ?",
+            (operator, MAX_PROFILES),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return np.array(rows, dtype="float64").reshape(-1, 5)
+
+
+def _memory_budget(config_dict):
+    """Get the memory available to a single worker in MB"""
+
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+    return int(memory * MEMORY_FRACTION / max(config_dict.get("max_workers", 1), 1))
+
+
+def tune(command, config_dict):
+    """Set parallelism, tile cache and heap of a gpt call from its profiles
+
+    :param command: the gpt command
+    :param config_dict: an OST configuration dictionary
+    :return: the tuned gpt command
+    """
+
+    processing_dir = config_dict.get("processing_dir")
+    budget = _memory_budget(config_dict)
+    if not processing_dir or not budget or os.name == "nt":
+        return command
+
+    tokens = shlex.split(command)
+    profiles = _profiles(processing_dir, _operator(tokens))
+    if len(profiles) < MIN_PROFILES:
+        return command
+
+    sizes, parallelism, wall, cpu, rss = profiles.T
+    cpus = config_dict["snap_cpu_parallelism"]
+
+    # peak memory scales with the input size, if known
+    size = _input_size(tokens)
+    if size and (sizes > 0).all():
+        expected = np.percentile(rss / sizes, 90) * size
+    else:
+        expected = np.percentile(rss, 90)
+
+    heap = int(np.clip(expected * HEADROOM / 2**20, MIN_HEAP, max(budget, MIN_HEAP)))
+    cache = int(heap * CACHE_FRACTION)
+
+    # operators that do not keep their threads busy get fewer of them
+    used_cores = np.median(cpu / np.maximum(wall, 1e-3))
+    threads = 2 * cpus
+    if used_cores < 0.5 * np.median(parallelism):
+        threads = int(np.clip(np.ceil(2 * used_cores), 1, 2 * cpus))
+
+    logger.debug(f"Running gpt with {threads} threads, {cache} MB tile cache and {heap} MB heap.")
+
+    command = re.sub(r"(\s)-q\s+\d+", rf"\g<1>-q {threads} -c {cache}M", command, count=1)
+    return command.replace(f"{tokens[0]} ", f"{tokens[0]} -J-Xmx{heap}M ", 1)
+
+
+def _run(command, logfile=None):
+    """Run a command and get its resource usage
+
+    :param command: the command
+    :param logfile: file where the error output is written to
+    :return: return code, wall time, cpu time and peak rss in bytes
+    """
+
+    start = time.time()
+
+    if os.name == "nt":
+        process = subprocess.Popen(command, stderr=subprocess.PIPE)
+    else:
+        process = subprocess.Popen(shlex.split(command), stderr=subprocess.PIPE)
+
+    stderr = process.stderr.read()
+    process.stderr.close()
+
+    cpu_time, peak_rss = None, None
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        cpu_time = usage.ru_utime + usage.ru_stime
+
+        # ru_maxrss is given in kilobytes on Linux, and in bytes on Mac
+        peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:
+        process.wait()
+
+    wall_time = time.time() - start
+
+    if process.returncode != 0 and logfile is not None:
+        with open(str(logfile), "w") as file:
+            for line in stderr.decode().splitlines():
+                file.write(f"{line}\n")
+
+    h.timer(start)
+    return process.returncode, wall_time, cpu_time, peak_rss
+
+
+def run(command, logfile, config_dict):
+    """Run a gpt command with tuned resources and record its profile
+
+    :param command: the gpt command
+    :param logfile: file where SNAP's error output is written to
+    :param config_dict: an OST configuration dictionary
+    :return: return code of gpt
+    """
+
+    processing_dir = config_dict.get("processing_dir")
+
+    tokens = shlex.split(command) if os.name != "nt" else command.split()
+    operator, size = _operator(tokens), _input_size(tokens)
+
+    command = tune(command, config_dict)
+    return_code, wall_time, cpu_time, peak_rss = _run(command, logfile)
+
+    # only successful runs are representative
+    if return_code != 0 or not processing_dir or cpu_time is None:
+        return return_code
+
+    threads = re.search(r"\s-q\s+(\d+)", command)
+    heap = re.search(r"-J-Xmx(\d+)M", command)
+
+    connection = _connect(processing_dir)
+    try:
+        with connection:
+            connection.execute(
+                "INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    operator,
+                    size,
+                    int(threads.group(1)) if threads else None,
+                    int(heap.group(1)) if heap else None,
+                    wall_time,
+                    cpu_time,
+                    peak_rss,
+                    time.time(),
+                ),
+            )
+    finally:
+        connection.close()
+
+    return return_code
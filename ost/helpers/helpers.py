@@ -17,6 +17,8 @@ from pathlib import Path
 from datetime import timedelta
 from osgeo import gdal
 
+from ost.helpers import envi
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,13 +35,22 @@ def timer(start):
     logger.debug(f"Time elapsed: {timedelta(seconds=elapsed)}")
 
 
-def remove_folder_content(folder):
+def remove_folder_content(folder, exclude=None):
     """A helper function that cleans the content of a folder
 
     :param folder:
+    :param exclude: names of files or directories directly within the
+                    folder that are kept
     """
 
+    exclude = exclude or []
     for root, dirs, files in os.walk(folder):
+
+        # do not descend into excluded directories
+        if root == str(folder):
+            files = [f for f in files if f not in exclude]
+            dirs[:] = [d for d in dirs if d not in exclude]
+
         for f in files:
             os.unlink(os.path.join(root, f))
         for d in dirs:
@@ -124,6 +135,26 @@ def move_dimap(infile_prefix, outfile_prefix, to_tif):
             shutil.move(infile_prefix.with_suffix(".dim"), outfile_prefix.with_suffix(".dim"))
 
 
+def product_size(path):
+    """Get the size of a product in bytes
+
+    For BEAM-DIMAP products, the size of the .data directory is included,
+    and for directories (e.g. SAFE) the size of all files within.
+
+    :param path: path to the product
+    :return: size in bytes
+    """
+
+    path = Path(path)
+    if path.suffix == ".dim" and path.with_suffix(".data").exists():
+        return path.stat().st_size + product_size(path.with_suffix(".data"))
+
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+    return path.stat().st_size
+
+
 def check_out_dimap(dimap_prefix, test_stats=True):
 
     # check if both dim and data exist, else return
@@ -147,8 +178,12 @@ def check_out_dimap(dimap_prefix, test_stats=True):
         if data_size < 8:
             return f"Data file {file} in {dimap_prefix}.data seem to small."
 
-        # test on statistics
-        if test_stats:
+        # test for valid data, directly on the ENVI binary if possible
+        if test_stats and file.with_suffix(".hdr").exists():
+            if not envi.has_valid_data(file):
+                return f"Data file {file.name} in {dimap_prefix}.data only " f"contains no data values."
+
+        elif test_stats:
 
             # open the file
             ds = gdal.Open(str(file))
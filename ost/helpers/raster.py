@@ -23,6 +23,7 @@ from scipy.interpolate import LinearNDInterpolator
 from shapely.geometry import shape, MultiPolygon
 
 from ost.helpers import helpers as h
+from ost.generic import catalogue
 
 
 def polygonize_ls(infile, outfile, driver="GeoJSON"):
@@ -387,6 +388,98 @@ def mask_by_shape(
             dest.set_band_description(1, str(infile.name)[:-4])
 
 
+# numpy to gdal datatype names for vrt creation
+GDAL_DTYPES = {
+    "uint8": "Byte",
+    "uint16": "UInt16",
+    "int16": "Int16",
+    "uint32": "UInt32",
+    "int32": "Int32",
+    "float32": "Float32",
+    "float64": "Float64",
+}
+
+
+def create_complex_vrt(sources, outfile, ndv=0, extent=None):
+    """Create a single band VRT with linear corrections per source
+
+    Each source is referenced as a ComplexSource carrying its own
+    scale ratio and offset, so the correction is applied by GDAL on
+    reading and no corrected copy of the data is written. All sources need
+    to share the same CRS. Unless given, the output extent is the union of
+    all sources on the pixel grid of the first source. Where sources overlap,
+    later sources in the list take precedence over earlier ones.
+
+    :param sources: list of (file, gain, offset) tuples
+    :param outfile: path to the output vrt
+    :param ndv: no-data value of sources and output
+    :param extent: optional tuple of upper-left x/y, width and height in
+                   pixels of the output on the grid of the first source
+    :return: path to the output vrt
+    """
+
+    from xml.sax.saxutils import escape
+
+    metas = []
+    for file, gain, offset in sources:
+        with rio.open(file) as src:
+            metas.append((str(file), gain, offset, src.bounds, src.res, src.width, src.height))
+
+            # take grid parameters from first source
+            if len(metas) == 1:
+                crs_wkt = src.crs.to_wkt()
+                dtype = GDAL_DTYPES[src.dtypes[0]]
+                res_x, res_y = src.res
+
+    left = min(meta[3].left for meta in metas)
+    top = max(meta[3].top for meta in metas)
+    right = max(meta[3].right for meta in metas)
+    bottom = min(meta[3].bottom for meta in metas)
+
+    width = int(np.ceil(np.round((right - left) / res_x, 6)))
+    height = int(np.ceil(np.round((top - bottom) / res_y, 6)))
+
+    if extent:
+        left, top, width, height = extent
+
+    source_xml = []
+    for file, gain, offset, bounds, res, src_width, src_height in metas:
+
+        # position and size of source within the output grid
+        x_off = (bounds.left - left) / res_x
+        y_off = (top - bounds.top) / res_y
+        x_size = src_width * res[0] / res_x
+        y_size = src_height * res[1] / res_y
+
+        source_xml.append(
+            f"    <ComplexSource>\n"
+            f'      <SourceFilename relativeToVRT="0">{escape(file)}</SourceFilename>\n'
+            f"      <SourceBand>1</SourceBand>\n"
+            f'      <SrcRect xOff="0" yOff="0" xSize="{src_width}" ySize="{src_height}" />\n'
+            f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{x_size}" ySize="{y_size}" />\n'
+            f"      <NODATA>{ndv}</NODATA>\n"
+            f"      <ScaleOffset>{offset}</ScaleOffset>\n"
+            f"      <ScaleRatio>{gain}</ScaleRatio>\n"
+            f"    </ComplexSource>\n"
+        )
+
+    vrt = (
+        f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">\n'
+        f"  <SRS>{escape(crs_wkt)}</SRS>\n"
+        f"  <GeoTransform>{left}, {res_x}, 0.0, {top}, 0.0, {-res_y}</GeoTransform>\n"
+        f'  <VRTRasterBand dataType="{dtype}" band="1">\n'
+        f"    <NoDataValue>{ndv}</NoDataValue>\n"
+        f"{''.join(source_xml)}"
+        f"  </VRTRasterBand>\n"
+        f"</VRTDataset>\n"
+    )
+
+    with open(outfile, "w") as file:
+        file.write(vrt)
+
+    return outfile
+
+
 def create_tscan_vrt(timescan_dir, config_file):
 
     # load ard parameters
@@ -424,24 +517,34 @@ def create_tscan_vrt(timescan_dir, config_file):
         metrics.remove("harmonics")
         metrics.extend(["amplitude", "phase", "residuals"])
 
-    i, outfiles = 0, []
+    i, outfiles, renamed = 0, [], []
     iteration = itertools.product(product_list, metrics)
     for product, metric in iteration:
 
         # get file and add number for outfile
         infile = timescan_dir / f"{product}.{metric}.tif"
 
+        # in case of virtual mosaics
+        if not infile.exists():
+            infile = infile.with_suffix(".vrt")
+
         # if there is no file sto the iteration
         if not infile.exists():
             continue
 
         i += 1
         # create namespace for output file and add to list for vrt creation
-        outfile = timescan_dir / f"{i:02d}.{product}.{metric}.tif"
+        outfile = timescan_dir / f"{i:02d}.{product}.{metric}{infile.suffix}"
         outfiles.append(str(outfile))
 
         # otherwise rename the file
         infile.replace(outfile)
+        renamed.append(infile)
+
+    # keep the catalogue in line with the renamed files
+    processing_dir = config_dict["processing_dir"]
+    catalogue.unregister(processing_dir, renamed)
+    catalogue.register(processing_dir, outfiles)
 
     # build vrt
     gdal.BuildVRT(
@@ -641,13 +744,13 @@ def combine_timeseries(processing_dir, config_dict, timescan=True):
     out_files, iter_list = [], []
     for product_type in PRODUCT_LIST:
 
-        filelist = list(processing_dir.glob(f"*/Timeseries/*{product_type}.tif"))
+        filelist = catalogue.glob(processing_dir, f"*/Timeseries/*{product_type}.tif")
 
         if len(filelist) > 1:
             datelist = sorted([file.name.split(".")[1] for file in filelist])
 
             for i, date in enumerate(datelist):
-                file = list(processing_dir.glob(f"*/Timeseries/*{date}*{product_type}.tif"))
+                file = catalogue.glob(processing_dir, f"*/Timeseries/*{date}*{product_type}.tif")
                 outfile = tseries_dir / f"{i+1:02d}.{date}.{product_type}.tif"
 
                 shutil.copy(file[0], str(outfile))
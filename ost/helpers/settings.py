@@ -67,6 +67,14 @@ def check_value(key, value, expected_type, choices=None):
     if key == "metrics":
         all(item in value for item in choices)
 
+    elif key == "coherence_baselines":
+        if not value or not all(item in choices for item in value):
+            raise ValueError(
+                "Configuration value for ARD parameter {} is wrong {}. "
+                "It should be a list of numbers of acquisitions between "
+                "{} and {}.".format(key, value, choices[0], choices[-1])
+            )
+
     elif choices:
         if value not in choices:
             raise ValueError(
@@ -218,6 +226,7 @@ config_check = dict(
         "to_db": {"type": bool},
         "to_tif": {"type": bool},
         "geocoding": {"type": str, "choices": ["terrain", "ellipsoid"]},
+        "fused_graph": {"type": bool},
         "remove_speckle": {"type": bool},
         "filter": {
             "type": str,
@@ -311,10 +320,17 @@ config_check = dict(
         },
         "coherence_azimuth": {"type": int, "choices": range(1, 100)},
         "coherence_range": {"type": int, "choices": range(1, 500)},
+        "coherence_estimator": {"type": str, "choices": ["native", "SNAP"]},
+        "coherence_window": {"type": str, "choices": ["boxcar", "gaussian"]},
+        "coherence_stack": {"type": bool},
+        "coherence_baselines": {"type": list, "choices": range(1, 100)},
         "production": {"type": bool},
         "H-A-Alpha": {"type": bool},
+        "pol_estimator": {"type": str, "choices": ["native", "SNAP"]},
+        "pol_window_size": {"type": int, "choices": range(1, 100)},
         "apply_ls_mask": {"type": bool},
         "remove_mt_speckle": {"type": bool},
+        "mt_speckle_estimator": {"type": str, "choices": ["native", "SNAP"]},
         "deseasonalize": {"type": bool},
         "dtype_output": {"type": str, "choices": ["float32", "uint8", "uint16"]},
         "metrics": {
@@ -333,6 +349,7 @@ config_check = dict(
         "remove_outliers": {"type": bool},
         "harmonization": {"type": bool},
         "cut_to_aoi": {"type": bool},
+        "virtual": {"type": bool},
     }
 )
 
@@ -0,0 +1,340 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Composition of SNAP processing graphs
+
+The graph fragments in ost/graphs hold the operator settings OST uses for
+the single processing steps. Instead of running each step as a separate gpt
+call, with a full intermediate product written to disk after every step,
+the required nodes are taken from the fragments and chained into a single
+graph. The whole processing chain then runs within one gpt call and the
+intermediate products stay in memory.
+"""
+
+import copy
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+from ost.helpers import helpers as h, gpt_profile
+from ost.helpers.settings import GPT_FILE, OST_ROOT
+from ost.helpers.errors import GPTRuntimeError, NotValidFileError
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+def _to_text(value):
+    """Convert a parameter value to its representation within a graph"""
+
+    if isinstance(value, bool):
+        return str(value).lower()
+
+    return "" if value is None else str(value)
+
+
+def dem_parameters(dem_dict, resolution):
+    """Get the values for the DEM related placeholders of the graph fragments
+
+    :param dem_dict: the dem section of the ARD parameters
+    :param resolution: output resolution in metres
+    :return: dict of placeholder values
+    """
+
+    # auto projections of snap
+    if 42001 <= dem_dict["out_projection"] <= 97002:
+        projection = f"AUTO:{dem_dict['out_projection']}"
+    # epsg codes
+    elif int(dem_dict["out_projection"]) == 4326:
+        projection = "WGS84(DD)"
+    else:
+        projection = f"EPSG:{dem_dict['out_projection']}"
+
+    return {
+        "dem": dem_dict["dem_name"],
+        "dem_name": dem_dict["dem_name"],
+        "dem_file": dem_dict["dem_file"],
+        "dem_nodata": dem_dict["dem_nodata"],
+        "dem_resampling": dem_dict["dem_resampling"],
+        "image_resampling": dem_dict["image_resampling"],
+        "egm_correction": dem_dict["egm_correction"],
+        "resol": resolution,
+        "projection": projection,
+    }
+
+
+def speckle_parameters(speckle_dict):
+    """Get the Speckle-Filter operator parameters from the ARD parameters
+
+    :param speckle_dict: the speckle_filter section of the ARD parameters
+    :return: dict of operator parameters
+    """
+
+    return {
+        "estimateENL": speckle_dict["estimate_ENL"],
+        "anSize": speckle_dict["pan_size"],
+        "dampingFactor": speckle_dict["damping"],
+        "enl": speckle_dict["ENL"],
+        "filter": speckle_dict["filter"],
+        "filterSizeX": speckle_dict["filter_x_size"],
+        "filterSizeY": speckle_dict["filter_y_size"],
+        "numLooksStr": speckle_dict["num_of_looks"],
+        "sigmaStr": speckle_dict["sigma"],
+        "targetWindowSizeStr": speckle_dict["target_window_size"],
+        "windowSize": speckle_dict["window_size"],
+    }
+
+
+def add_ls_mask(graph, source, outfile, ard):
+    """Add a Layover/Shadow mask branch to a graph
+
+    :param graph: the Graph to add the nodes to
+    :param source: id of the node in radar geometry to create the mask for
+    :param outfile: the Layover/Shadow mask product
+    :param ard: the single_ARD parameters
+    :return: id of the Write node
+    """
+
+    dem_params = dem_parameters(ard["dem"], ard["resolution"])
+    node = graph.add_fragment("S1_GRD2ARD/3_LSmap.xml", "SAR-Simulation", [source], dem_params)
+    node = graph.add_fragment("S1_GRD2ARD/3_LSmap.xml", "Terrain-Correction", [node], dem_params)
+    return graph.write(node, outfile, test_stats=False)
+
+
+def add_geocoding(graph, source, ard):
+    """Add a terrain or ellipsoid correction node to a graph
+
+    :param graph: the Graph to add the node to
+    :param source: id of the node to geocode
+    :param ard: the single_ARD parameters
+    :return: id of the geocoding node
+    """
+
+    # the same parameters the step-wise common.terrain_correction passes,
+    # all others are left at the SNAP defaults
+    dem_params = dem_parameters(ard["dem"], ard["resolution"])
+    parameters = dict(
+        demName=dem_params["dem"],
+        demResamplingMethod=dem_params["dem_resampling"],
+        externalDEMFile=dem_params["dem_file"],
+        externalDEMNoDataValue=dem_params["dem_nodata"],
+        externalDEMApplyEGM=dem_params["egm_correction"],
+        imgResamplingMethod=dem_params["image_resampling"],
+        pixelSpacingInMeter=dem_params["resol"],
+        alignToStandardGrid=True,
+        mapProjection=dem_params["projection"],
+    )
+
+    if ard["geocoding"] == "terrain":
+        return graph.add_node("Terrain-Correction", [source], **parameters)
+    elif ard["geocoding"] == "ellipsoid":
+        return graph.add_node("Ellipsoid-Correction-RD", [source], **parameters)
+    else:
+        raise ValueError("Geocoding method should be either 'terrain' or 'ellipsoid'.")
+
+
+class Graph:
+    """A SNAP graph assembled node by node
+
+    Nodes either come from the graph fragments in ost/graphs, with their
+    placeholders filled in, or are created from an operator name and its
+    parameters. Each node is added on top of its source nodes, and the ids
+    returned by the add methods are used to reference them.
+    """
+
+    def __init__(self):
+
+        self.root = ET.Element("graph", id="Graph")
+        ET.SubElement(self.root, "version").text = "1.0"
+
+        # written products and whether their statistics are checked
+        self.outputs = []
+
+    def _node_ids(self):
+        return [node.get("id") for node in self.root.iter("node")]
+
+    def _append(self, node, node_id, sources):
+
+        # make the node id unique within the graph
+        ids, unique_id, i = self._node_ids(), node_id, 1
+        while unique_id in ids:
+            i += 1
+            unique_id = f"{node_id}({i})"
+
+        node.set("id", unique_id)
+
+        # replace sources
+        for element in node.findall("sources"):
+            node.remove(element)
+
+        sources_element = ET.Element("sources")
+        for i, source in enumerate(sources or []):
+            tag = "sourceProduct" if i == 0 else f"sourceProduct.{i}"
+            ET.SubElement(sources_element, tag, refid=source)
+
+        node.insert(1, sources_element)
+        self.root.append(node)
+        return unique_id
+
+    @staticmethod
+    def _fragment_nodes(fragment):
+
+        fragment_root = ET.parse(OST_ROOT / "graphs" / fragment).getroot()
+        return {node.get("id"): node for node in fragment_root.findall("node")}
+
+    def _add_fragment_node(self, node, sources, placeholders, parameters):
+
+        node = copy.deepcopy(node)
+        placeholders = placeholders or {}
+
+        def substitute(match):
+            try:
+                return _to_text(placeholders[match.group(1)])
+            except KeyError:
+                raise ValueError(f"No value for parameter {match.group(1)} of {node.get('id')}.")
+
+        for element in node.iter():
+            if element.text and PLACEHOLDER.search(element.text):
+                element.text = PLACEHOLDER.sub(substitute, element.text)
+
+        self._set_parameters(node, parameters)
+        return self._append(node, node.get("id"), sources)
+
+    def add_fragment(self, fragment, operator_id, sources=None, placeholders=None, **parameters):
+        """Add a node from a graph fragment
+
+        :param fragment: path of the graph fragment relative to ost/graphs
+        :param operator_id: id of the node within the fragment
+        :param sources: list of source node ids
+        :param placeholders: values for the ${...} placeholders of the node
+        :param parameters: operator parameters overriding those of the fragment
+        :return: id of the node within the graph
+        """
+
+        nodes = self._fragment_nodes(fragment)
+        if operator_id not in nodes:
+            raise ValueError(f"No node {operator_id} within graph fragment {fragment}.")
+
+        return self._add_fragment_node(nodes[operator_id], sources, placeholders, parameters)
+
+    def add_chain(self, fragment, source, placeholders=None):
+        """Add all processing nodes of a linear graph fragment
+
+        The nodes between the Read and the Write node of the fragment are
+        added in their processing order, with the first one reading from
+        the given source node.
+
+        :param fragment: path of the graph fragment relative to ost/graphs
+        :param source: id of the source node for the chain
+        :param placeholders: values for the ${...} placeholders of the nodes
+        :return: id of the last node of the chain
+        """
+
+        nodes = self._fragment_nodes(fragment)
+
+        def source_of(node):
+            return node.find("sources")[0].get("refid")
+
+        # walk back from the Write node to the Read node
+        write = [node for node in nodes.values() if node.findtext("operator") == "Write"][0]
+        chain, node_id = [], source_of(write)
+        while nodes[node_id].findtext("operator") != "Read":
+            chain.insert(0, node_id)
+            node_id = source_of(nodes[node_id])
+
+        for node_id in chain:
+            source = self._add_fragment_node(nodes[node_id], [source], placeholders, {})
+
+        return source
+
+    def add_node(self, operator, sources=None, node_id=None, **parameters):
+        """Add a node from an operator name and its parameters
+
+        :param operator: name of the SNAP operator
+        :param sources: list of source node ids
+        :param node_id: id of the node, defaults to the operator name
+        :param parameters: operator parameters
+        :return: id of the node within the graph
+        """
+
+        node = ET.Element("node")
+        ET.SubElement(node, "operator").text = operator
+        ET.SubElement(node, "parameters", {"class": "com.bc.ceres.binding.dom.XppDomElement"})
+
+        self._set_parameters(node, parameters)
+        return self._append(node, node_id or operator, sources)
+
+    @staticmethod
+    def _set_parameters(node, parameters):
+
+        parameters_element = node.find("parameters")
+        for key, value in parameters.items():
+            element = parameters_element.find(key)
+            if element is None:
+                element = ET.SubElement(parameters_element, key)
+            element.text = _to_text(value)
+
+    def read(self, infile):
+        """Add a Read node
+
+        :param infile: the product to read
+        :return: id of the node within the graph
+        """
+
+        return self.add_node("Read", node_id="Read", file=infile)
+
+    def write(self, source, outfile, test_stats=True):
+        """Add a Write node for a BEAM-DIMAP product
+
+        :param source: id of the node to write
+        :param outfile: output product without suffix
+        :param test_stats: check the statistics of the written product
+        :return: id of the node within the graph
+        """
+
+        self.outputs.append((outfile, test_stats))
+        return self.add_node(
+            "Write", [source], node_id="Write", file=outfile.with_suffix(".dim"), formatName="BEAM-DIMAP"
+        )
+
+    def save(self, graph_file):
+        """Write the graph to an XML file
+
+        :param graph_file: path of the XML file
+        """
+
+        ET.ElementTree(self.root).write(graph_file)
+
+    def run(self, graph_file, logfile, config_dict):
+        """Run the graph within a single gpt call
+
+        :param graph_file: path where the graph XML is written to
+        :param logfile: file where SNAP's error output is written to
+        :param config_dict: an OST configuration dictionary
+        :return: list of the written products
+        """
+
+        cpus = config_dict["snap_cpu_parallelism"]
+
+        self.save(graph_file)
+        command = f"{GPT_FILE} {graph_file} -x -q {2*cpus}"
+
+        # run command and get return code
+        return_code = gpt_profile.run(command, logfile, config_dict)
+
+        # handle errors and logs
+        if return_code == 0:
+            logger.debug("Successfully processed graph.")
+        else:
+            raise GPTRuntimeError(
+                f"Processing graph exited with error {return_code}. "
+                f"See {logfile} for Snap's error message."
+            )
+
+        # do check routine
+        for outfile, test_stats in self.outputs:
+            return_code = h.check_out_dimap(outfile, test_stats=test_stats)
+            if return_code != 0:
+                raise NotValidFileError(f"Product did not pass file check: {return_code}")
+
+        return [str(outfile.with_suffix(".dim")) for outfile, _ in self.outputs]
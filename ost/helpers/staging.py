@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Staging of temporary products on a RAM disk
+
+Temporary directories for intermediate products are created on a RAM disk
+(tmpfs) if the expected size of the products fits within the configured
+quota, and in the project's temp directory otherwise. The space reserved
+by each job is tracked in a SQLite database on the RAM disk itself, so that
+concurrent workers on the same node share the quota. The actual usage of
+each job is recorded as well, and refines the expected size of subsequent
+jobs of the same kind.
+"""
+
+import os
+import shutil
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory, mkdtemp
+
+logger = logging.getLogger(__name__)
+
+RAM_DISK = Path("/dev/shm")
+LEDGER_NAME = ".staging.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+# expected size of the temporary products relative to the input size,
+# as long as there is no recorded usage for a kind of job
+DEFAULT_EXPANSION = 4
+
+# number of most recent usage records that are considered
+MAX_RECORDS = 50
+
+# seconds between two checks of the usage of a running job
+WATCH_INTERVAL = 5
+
+
+def _dir_size(directory):
+
+    size = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            try:
+                size += os.stat(os.path.join(root, file)).st_size
+            # files might be deleted by the job in the meantime
+            except FileNotFoundError:
+                pass
+
+    return size
+
+
+def _pid_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _connect(staging_root):
+
+    connection = sqlite3.connect(str(staging_root / LEDGER_NAME), timeout=TIMEOUT)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS reservations (directory TEXT PRIMARY KEY, pid INTEGER, size INTEGER)"
+    )
+    connection.execute("CREATE TABLE IF NOT EXISTS usage (kind TEXT, input_size INTEGER, used INTEGER)")
+    return connection
+
+
+def _expected_size(connection, kind, input_size):
+    """Get the expected size of the temporary products of a job
+
+    :param connection: sqlite3 connection to the ledger
+    :param kind: kind of job
+    :param input_size: size of the job's input in bytes
+    :return: size in bytes
+    """
+
+    rows = connection.execute(
+        "SELECT input_size, used FROM usage WHERE kind = ? AND input_size > 0 ORDER BY rowid DESC LIMIT ?",
+        (kind, MAX_RECORDS),
+    ).fetchall()
+
+    expansion = max([used / size for size, used in rows], default=DEFAULT_EXPANSION)
+    return int(input_size * expansion)
+
+
+def _reserve(staging_root, directory, quota, kind, input_size):
+    """Reserve space on the RAM disk for a job
+
+    :param staging_root: directory on the RAM disk for the temporary products
+    :param directory: the job's temporary directory
+    :param quota: maximum size of all temporary products on the RAM disk
+    :param kind: kind of job
+    :param input_size: size of the job's input in bytes
+    :return: reserved size in bytes, or None if the job does not fit
+    """
+
+    connection = _connect(staging_root)
+    try:
+        # an exclusive transaction, so concurrent workers reserve one at a time
+        connection.isolation_level = None
+        connection.execute("BEGIN EXCLUSIVE")
+
+        # release reservations of workers that died
+        for reserved_dir, pid in connection.execute("SELECT directory, pid FROM reservations").fetchall():
+            if not _pid_alive(pid) or not Path(reserved_dir).exists():
+                connection.execute("DELETE FROM reservations WHERE directory = ?", (reserved_dir,))
+
+        size = _expected_size(connection, kind, input_size)
+        reserved = connection.execute("SELECT COALESCE(SUM(size), 0) FROM reservations").fetchone()[0]
+        stats = os.statvfs(staging_root)
+
+        if reserved + size > quota or size > stats.f_bavail * stats.f_frsize:
+            connection.execute("COMMIT")
+            return None
+
+        connection.execute("INSERT INTO reservations VALUES (?, ?, ?)", (directory, os.getpid(), size))
+        connection.execute("COMMIT")
+        return size
+    finally:
+        connection.close()
+
+
+def _watch(staging_root, directory, reserved, stop, peak):
+    """Track the peak usage of a job and raise its reservation if exceeded
+
+    :param staging_root: directory on the RAM disk for the temporary products
+    :param directory: the job's temporary directory
+    :param reserved: reserved size in bytes
+    :param stop: threading.Event to stop watching
+    :param peak: list holding the peak usage in bytes
+    """
+
+    while not stop.wait(WATCH_INTERVAL):
+        peak[0] = max(peak[0], _dir_size(directory))
+
+        if peak[0] > reserved:
+            reserved = peak[0]
+            connection = _connect(staging_root)
+            try:
+                with connection:
+                    connection.execute(
+                        "UPDATE reservations SET size = ? WHERE directory = ?", (reserved, directory)
+                    )
+            finally:
+                connection.close()
+
+
+@contextmanager
+def staging_dir(config_dict, input_size=0, kind="default", temp_dir=None):
+    """Create a temporary directory for the intermediate products of a job
+
+    The directory is created on the RAM disk if the quota given by the
+    ram_disk_quota parameter (in GB) of the configuration allows for it,
+    and within the temp_dir otherwise.
+
+    :param config_dict: an OST configuration dictionary
+    :param input_size: size of the job's input in bytes
+    :param kind: kind of job, used to estimate the expected size of
+                 the temporary products from previous jobs
+    :param temp_dir: directory to spill to, defaults to the temp_dir
+                     of the configuration
+    :return: path to the temporary directory as str
+    """
+
+    quota = config_dict.get("ram_disk_quota") or 0
+
+    size = None
+    if quota > 0 and hasattr(os, "getuid") and RAM_DISK.exists():
+        staging_root = RAM_DISK / f"ost-{os.getuid()}"
+        staging_root.mkdir(exist_ok=True)
+
+        temp = mkdtemp(prefix=f"{staging_root}/")
+        size = _reserve(staging_root, temp, quota * 2**30, kind, input_size)
+        if size is None:
+            os.rmdir(temp)
+
+    # spill to the temp directory on disk
+    if size is None:
+        with TemporaryDirectory(prefix=f"{temp_dir or config_dict['temp_dir']}/") as temp:
+            yield temp
+        return
+
+    logger.debug(f"Staging temporary products of {kind} on the RAM disk ({size / 2**20:.0f} MB reserved).")
+
+    stop, peak = threading.Event(), [0]
+    watcher = threading.Thread(target=_watch, args=(staging_root, temp, size, stop, peak), daemon=True)
+    watcher.start()
+
+    try:
+        yield temp
+    finally:
+        stop.set()
+        watcher.join()
+        peak[0] = max(peak[0], _dir_size(temp))
+        shutil.rmtree(temp, ignore_errors=True)
+
+        connection = _connect(staging_root)
+        try:
+            with connection:
+                connection.execute("DELETE FROM reservations WHERE directory = ?", (temp,))
+                connection.execute("INSERT INTO usage VALUES (?, ?, ?)", (kind, input_size, peak[0]))
+        finally:
+            connection.close()
+
+    if peak[0] > size:
+        logger.debug(f"Temporary products of {kind} used {peak[0] / 2**20:.0f} MB, more than reserved.")
@@ -19,9 +19,20 @@ import pandas as pd
 from godale._concurrent import Executor
 
 from ost.helpers import raster as ras, helpers as h
+from ost.helpers.errors import DownloadError
+from ost.s1 import download, burst_cache
+from ost.s1.s1scene import Sentinel1Scene as S1Scene
 from ost.s1.burst_inventory import prepare_burst_inventory
-from ost.s1.burst_to_ard import burst_to_ard
-from ost.generic import ard_to_ts, ts_extent, ts_ls_mask, timescan, mosaic
+from ost.s1.burst_to_ard import (
+    burst_to_ard,
+    burst_imports,
+    burst_outputs,
+    burst_tasks,
+    pending_products,
+    coherence_stack_to_ard,
+    stack_imports,
+)
+from ost.generic import ard_to_ts, ts_extent, ts_ls_mask, timescan, mosaic, extent_index, catalogue, ledger
 
 # set up logger
 logger = logging.getLogger(__name__)
@@ -43,7 +54,147 @@ PRODUCT_LIST = [
 ]
 
 
-def bursts_to_ards(burst_gdf, config_file):
+def _download_order(burst_gdf, config_dict):
+    """Order scenes and bursts for streamed download and processing
+
+    :param burst_gdf: an OST burst inventory
+    :param config_dict: an OST configuration dictionary
+    :return: list of scene ids to download, and list of (bid, date)
+             tuples of the bursts in processing order
+    """
+
+    download_dir = Path(config_dict["download_dir"])
+    data_mount = Path(config_dict["data_mount"])
+    coherence = config_dict["processing"]["single_ARD"]["coherence"]
+
+    # scenes needed per burst, i.e. master and slave scene for coherence
+    jobs = {}
+    for bid, bursts in burst_gdf.groupby("bid"):
+        bursts = bursts.sort_values("Date")
+        scenes = bursts.SceneID.tolist()
+        for i, date in enumerate(bursts.Date):
+            stop = i + 2 if coherence else i + 1
+            jobs[(bid, date)] = set(scenes[i:stop])
+
+    available = {
+        scene for scene in burst_gdf.SceneID.unique() if S1Scene(scene).get_path(download_dir, data_mount)
+    }
+
+    keys = list(jobs)
+    scene_order, job_order = download.download_order([jobs[key] for key in keys], available)
+    return scene_order, [keys[i] for i in job_order]
+
+
+def stream_download(burst_gdf, inventory_df, config_file, mirror, concurrent=2, uname=None, pword=None):
+    """Download SLC products in the background in processing order
+
+    Scenes that complete the inputs of most bursts come first, so that
+    a streaming bursts_to_ards can start on them right away.
+
+    :param burst_gdf: an OST burst inventory
+    :param inventory_df: OST inventory dataframe with the scenes of the bursts
+    :param config_file: path to the project config file
+    :param mirror: number of data repository, see download_sentinel1
+    :param concurrent: number of parallel downloads
+    :param uname: username for respective data repository
+    :param pword: password for respective data repository
+    :return: the download process
+    """
+
+    with open(config_file, "r") as file:
+        config_dict = json.load(file)
+
+    scene_order, _ = _download_order(burst_gdf, config_dict)
+    download_df = inventory_df.set_index("identifier", drop=False).loc[scene_order]
+
+    return download.stream_sentinel1(
+        download_df, Path(config_dict["download_dir"]), mirror, concurrent, uname, pword
+    )
+
+
+def _burst_to_ard_streamed(burst, config_file):
+    """Wait for the master and slave scene of a burst before processing it"""
+
+    _, row = burst
+    with open(config_file, "r") as file:
+        config_dict = json.load(file)
+
+    files = [row.file_location]
+    if config_dict["processing"]["single_ARD"]["coherence"] and pd.notnull(row.slave_file):
+        files.append(row.slave_file)
+
+    try:
+        download.wait_for_download(files, config_dict["download_dir"])
+    except DownloadError as error:
+        logger.info(error)
+        return row.bid, row.Date, None, None, None, None, error
+
+    return burst_to_ard(burst, config_file)
+
+
+def _locality_groups(proc_inventory, max_workers):
+    """Group the burst jobs by their scene and subswath
+
+    The bursts of a scene and subswath are processed one after the other
+    by the same worker, so that the scene is read while it is still in the
+    page cache. Groups keep the order of the inventory. As long as there
+    are fewer groups than workers, the largest group is split in halves.
+
+    :param proc_inventory: a prepared OST burst inventory in processing order
+    :param max_workers: number of parallel workers
+    :return: list of GeoDataFrames with the bursts of each group
+    """
+
+    groups = [
+        group.sort_values("BurstNr", kind="mergesort")
+        for _, group in proc_inventory.groupby(["SceneID", "SwathID"], sort=False)
+    ]
+
+    while 0 < len(groups) < max_workers:
+        largest = max(range(len(groups)), key=lambda i: len(groups[i]))
+        group = groups[largest]
+        if len(group) < 2:
+            break
+
+        half = len(group) // 2
+        groups[largest] = group.iloc[:half]
+        groups.insert(largest + 1, group.iloc[half:])
+
+    return groups
+
+
+def _bursts_to_ard(bursts, config_file, streaming=False):
+    """Process the bursts of a group one after the other"""
+
+    process = _burst_to_ard_streamed if streaming else burst_to_ard
+    return [process(burst, config_file) for burst in bursts.iterrows()]
+
+
+def _worker_config(config_file, config_dict, max_workers):
+    """Get the config file the burst jobs read, with the effective number of workers
+
+    The jobs budget the memory of their gpt calls by the number of
+    concurrent jobs, so a raised number of workers is written to a copy of
+    the project config within the temporary directory.
+
+    :param config_file: path to the project config file
+    :param config_dict: an OST configuration dictionary
+    :param max_workers: the number of concurrent burst jobs
+    :return: path to the config file
+    """
+
+    if max_workers == config_dict["max_workers"]:
+        return config_file
+
+    worker_config = Path(config_dict["temp_dir"]) / "burst_config.json"
+    worker_config.parent.mkdir(parents=True, exist_ok=True)
+    with open(worker_config, "w") as file:
+        json.dump(dict(config_dict, max_workers=max_workers), file, indent=4)
+
+    return worker_config
+
+
+def bursts_to_ards(burst_gdf, config_file, streaming=False):
     """Batch processing from single bursts to ARD format
 
     This function handles the burst processing based on a OST burst inventory
@@ -57,6 +208,9 @@ def bursts_to_ards(burst_gdf, config_file):
     :param executor_type: executer type for parallel processing with godale,
                           defaults to multiprocessing
     :param max_workers: number of parallel burst processing jobs to start
+    :param streaming: the scenes are still being downloaded by
+                      stream_download, and each burst is processed as
+                      soon as its scenes are downloaded
     :return:
     """
 
@@ -73,11 +227,76 @@ def bursts_to_ards(burst_gdf, config_file):
         executor_type = config_dict["executor_type"]
         max_workers = config_dict["max_workers"]
 
+    if streaming:
+        download_dir = Path(config_dict["download_dir"])
+
+        # point to where the scenes will be downloaded to
+        proc_inventory["file_location"] = [
+            path if pd.notnull(path) else S1Scene(scene).download_path(download_dir)
+            for path, scene in zip(proc_inventory.file_location, proc_inventory.SceneID)
+        ]
+        proc_inventory["slave_file"] = [
+            path if pd.notnull(path) or pd.isnull(scene) else S1Scene(scene).download_path(download_dir)
+            for path, scene in zip(proc_inventory.slave_file, proc_inventory.slave_scene_id)
+        ]
+
+        # process in the order the bursts' scenes are downloaded
+        _, burst_order = _download_order(burst_gdf, config_dict)
+        rank = {key: i for i, key in enumerate(burst_order)}
+        proc_inventory = proc_inventory.iloc[
+            sorted(
+                range(len(proc_inventory)),
+                key=lambda i: rank.get((proc_inventory.bid.iloc[i], proc_inventory.Date.iloc[i]), 0),
+            )
+        ]
+    else:
+        # process scene after scene, so that the slave imports of one
+        # date are still in the burst cache as master imports of the next
+        proc_inventory = proc_inventory.sort_values(["Date", "SceneID", "SwathID"], kind="mergesort")
+
+    # completed tasks of previous runs, from a single query of the job ledger
+    processing_dir = Path(config_dict["processing_dir"])
+    ard = config_dict["processing"]["single_ARD"]
+    completed = ledger.completed(processing_dir, ard)
+
+    # bursts whose products are all completed are not run again
+    done = pd.Series(
+        [not pending_products(burst, config_dict, completed) for _, burst in proc_inventory.iterrows()],
+        index=proc_inventory.index,
+        dtype=bool,
+    )
+    done_inventory, proc_inventory = proc_inventory[done], proc_inventory[~done]
+    if len(done_inventory):
+        logger.info(f"Skipping {len(done_inventory)} burst(s) that have already been processed.")
+
+    # register the imports of all bursts, so that imports shared by the
+    # master and slave of two jobs are kept until both are done
+    claims = [
+        claim
+        for _, burst in proc_inventory.iterrows()
+        for claim in burst_imports(burst, config_dict, completed)
+    ]
+
+    # in stack mode, the stack of each burst reuses the imports of the
+    # backscatter and polarimetric jobs, so they are kept for it as well
+    if ard["coherence"] and ard.get("coherence_stack", False):
+        all_bursts = pd.concat([done_inventory, proc_inventory])
+        claims.extend(
+            claim
+            for _, bursts in all_bursts.groupby("bid")
+            for claim in stack_imports(bursts, config_dict, completed)
+        )
+
+    burst_cache.register(claims, config_dict)
+
     # we update max_workers in case we have less snap_cpu_parallelism
     # then cpus available
     if max_workers == 1 and config_dict["snap_cpu_parallelism"] < os.cpu_count():
         max_workers = int(os.cpu_count() / config_dict["snap_cpu_parallelism"])
 
+    # the jobs read the effective number of workers for their memory budget
+    worker_config = _worker_config(config_file, config_dict, max_workers)
+
     # now we run with godale, which works also with 1 worker
     out_dict = {
         "burst": [],
@@ -88,24 +307,62 @@ def bursts_to_ards(burst_gdf, config_file):
         "out_coh": [],
         "error": [],
     }
-    executor = Executor(executor=executor_type, max_workers=max_workers)
-    for task in executor.as_completed(
-        func=burst_to_ard,
-        iterable=proc_inventory.iterrows(),
-        fargs=(
-            [
-                str(config_file),
-            ]
-        ),
-    ):
-        burst, date, out_bs, out_ls, out_pol, out_coh, error = task.result()
-        out_dict["burst"].append(burst)
-        out_dict["acq_date"].append(date)
+
+    # products of the skipped bursts
+    for _, burst in done_inventory.iterrows():
+        out_bs, out_ls, out_pol, out_coh = burst_outputs(burst, config_dict, burst_tasks(burst, config_dict))
+        out_dict["burst"].append(burst.bid)
+        out_dict["acq_date"].append(burst.Date)
         out_dict["out_bs"].append(out_bs)
         out_dict["out_ls"].append(out_ls)
         out_dict["out_pol"].append(out_pol)
         out_dict["out_coh"].append(out_coh)
-        out_dict["error"].append(error)
+        out_dict["error"].append(None)
+
+    # bursts of the same scene and subswath run back to back on one worker
+    executor = Executor(executor=executor_type, max_workers=max_workers)
+    for task in executor.as_completed(
+        func=_bursts_to_ard,
+        iterable=_locality_groups(proc_inventory, max_workers),
+        fargs=([str(worker_config), streaming]),
+    ):
+        for burst, date, out_bs, out_ls, out_pol, out_coh, error in task.result():
+
+            # add the burst's ARD products to the catalogue
+            if out_bs or out_pol or out_coh:
+                catalogue.register_dir(processing_dir, processing_dir / burst / date)
+
+            out_dict["burst"].append(burst)
+            out_dict["acq_date"].append(date)
+            out_dict["out_bs"].append(out_bs)
+            out_dict["out_ls"].append(out_ls)
+            out_dict["out_pol"].append(out_pol)
+            out_dict["out_coh"].append(out_coh)
+            out_dict["error"].append(error)
+
+    # in stack mode, the coherence of each burst is processed from a
+    # single co-registered stack of all its dates
+    if ard["coherence"] and ard.get("coherence_stack", False):
+
+        logger.info("Processing the multi-baseline coherence of all bursts.")
+        index = {key: i for i, key in enumerate(zip(out_dict["burst"], out_dict["acq_date"]))}
+        for task in executor.as_completed(
+            func=coherence_stack_to_ard,
+            iterable=[bursts for _, bursts in all_bursts.groupby("bid")],
+            fargs=([str(worker_config)]),
+        ):
+            for burst, date, out_coh, error in task.result():
+
+                # add the coherence products to the catalogue
+                if out_coh:
+                    catalogue.register_dir(processing_dir, processing_dir / burst / date)
+
+                if (burst, date) not in index:
+                    continue
+
+                out_dict["out_coh"][index[burst, date]] = out_coh
+                if error and not out_dict["error"][index[burst, date]]:
+                    out_dict["error"][index[burst, date]] = error
 
     return pd.DataFrame.from_dict(out_dict)
 
@@ -307,8 +564,6 @@ def _create_timeseries(burst_gdf, config_file):
     iter_list = []
     for burst in burst_gdf.bid.unique():
 
-        burst_dir = Path(processing_dir) / burst
-
         # for pr, pol in itertools.product(dict_of_product_types.items(), pols):
         for pr, pol in itertools.product(list_of_product_types, pols):
 
@@ -317,17 +572,19 @@ def _create_timeseries(burst_gdf, config_file):
 
             # take care of H-A-Alpha naming for file search
             if pol in ["Alpha", "Entropy", "Anisotropy"] and product == "pol":
-                list_of_files = sorted(list(burst_dir.glob(f"20*/*data*/*{pol}*img")))
+                list_of_files = catalogue.glob(processing_dir, f"{burst}/20*/*data*/*{pol}*img")
             else:
                 # see if there is actually any imagery for this
                 # combination of product and polarisation
-                list_of_files = sorted(list(burst_dir.glob(f"20*/*data*/*{product_name}*{pol}*img")))
+                list_of_files = catalogue.glob(
+                    processing_dir, f"{burst}/20*/*data*/*{product_name}*{pol}*img"
+                )
 
             if len(list_of_files) <= 1:
                 continue
 
             # create list of dims if polarisation is present
-            list_of_dims = sorted(str(dim) for dim in list(burst_dir.glob(f"20*/*{product}*dim")))
+            list_of_dims = [str(dim) for dim in catalogue.glob(processing_dir, f"{burst}/20*/*{product}*dim")]
 
             iter_list.append([list_of_dims, burst, product, pol])
 
@@ -352,6 +609,11 @@ def _create_timeseries(burst_gdf, config_file):
         ),
     ):
         burst, list_of_dims, out_files, out_vrt, product, error = task.result()
+
+        # add the time-series layers to the catalogue
+        if isinstance(out_files, list):
+            catalogue.register(processing_dir, out_files)
+
         out_dict["burst"].append(burst)
         out_dict["list_of_dims"].append(list_of_dims)
         out_dict["out_files"].append(out_files)
@@ -369,7 +631,8 @@ def ards_to_timeseries(burst_gdf, config_file):
 
     # load ard parameters
     with open(config_file, "r") as ard_file:
-        ard_params = json.load(ard_file)["processing"]
+        config_dict = json.load(ard_file)
+        ard_params = config_dict["processing"]
         ard = ard_params["single_ARD"]
         ard_mt = ard_params["time-series_ARD"]
 
@@ -380,6 +643,9 @@ def ards_to_timeseries(burst_gdf, config_file):
     if ard["create_ls_mask"] or ard_mt["apply_ls_mask"]:
         _create_mt_ls_mask(burst_gdf, config_file)
 
+    # add the new extents to the project's extent index
+    extent_index.update_extent_index(config_dict["processing_dir"])
+
     # finally create time-series
     df = _create_timeseries(burst_gdf, config_file)
     return df
@@ -422,8 +688,12 @@ def timeseries_to_timescan(burst_gdf, config_file):
 
         for product in PRODUCT_LIST:
 
+            # parameters the timescans depend on, for the job ledger
+            parameters = [ledger.ard_parameters(ard, product.split(".")[0]), ard_mt, ard_tscan]
+
             # check if already processed
-            if (timescan_dir / f".{product}.processed").exists():
+            task, legacy = timescan_dir / product, timescan_dir / f".{product}.processed"
+            if ledger.is_done(processing_dir, task, parameters, legacy=legacy):
                 logger.debug(f"Timescans for burst {burst} already processed.")
                 continue
 
@@ -435,12 +705,15 @@ def timeseries_to_timescan(burst_gdf, config_file):
                 continue
 
             # datelist for harmonics
-            scenelist = list(burst_dir.glob(f"Timeseries/*{product}*tif"))
+            scenelist = catalogue.glob(processing_dir, f"{burst}/Timeseries/*{product}*tif")
             datelist = [file.name.split(".")[1][:6] for file in sorted(scenelist)]
 
             # define timescan prefix
             timescan_prefix = timescan_dir / product
 
+            # record the start of the task in the job ledger
+            ledger.start(processing_dir, task, [timeseries], parameters)
+
             # get rescaling and db right (backscatter vs. coh/pol)
             if "bs." in str(timescan_prefix):
                 to_power, rescale = to_db, dtype_conversion
@@ -468,6 +741,17 @@ def timeseries_to_timescan(burst_gdf, config_file):
     out_dict = {"burst": [], "prefix": [], "metrics": [], "error": []}
     for task in executor.as_completed(func=timescan.gd_mt_metrics, iterable=iter_list):
         burst, prefix, metrics, error = task.result()
+
+        # add the timescan layers to the catalogue, and record the task
+        # in the job ledger
+        timescan_dir = Path(processing_dir) / burst / "Timescan"
+        if not error:
+            out_files = [timescan_dir / f"{prefix}.{metric}.tif" for metric in metrics]
+            catalogue.register(processing_dir, out_files)
+            ledger.finish(processing_dir, timescan_dir / prefix, out_files)
+        else:
+            ledger.fail(processing_dir, [timescan_dir / prefix], error)
+
         out_dict["burst"].append(burst)
         out_dict["prefix"].append(prefix)
         out_dict["metrics"].append(metrics)
@@ -500,13 +784,21 @@ def mosaic_timeseries(burst_inventory, config_file):
     with open(config_file, "r") as ard_file:
         config_dict = json.load(ard_file)
         processing_dir = Path(config_dict["processing_dir"])
+        virtual = config_dict["processing"]["mosaic"].get("virtual", False)
 
     # create output folder
     ts_dir = processing_dir / "Mosaic" / "Timeseries"
     ts_dir.mkdir(parents=True, exist_ok=True)
 
-    temp_mosaic = processing_dir / "Mosaic" / "temp"
+    # virtual mosaics reference the acquisition mosaics, so we keep them
+    if virtual:
+        temp_mosaic, suffix = ts_dir / "acquisitions", ".vrt"
+    else:
+        temp_mosaic, suffix = processing_dir / "Mosaic" / "temp", ".tif"
     temp_mosaic.mkdir(parents=True, exist_ok=True)
+
+    # make sure the extent index is complete before querying it in parallel
+    extent_index.update_extent_index(processing_dir)
     # -------------------------------------
     # 2 create iterable
     # loop through each product
@@ -525,11 +817,11 @@ def mosaic_timeseries(burst_inventory, config_file):
                     # we do the try, since for the last date
                     # there is no dates[i+1] for coherence
                     try:
-                        temp_acq = temp_mosaic / f"{i}.{date}.{dates[i + 1]}.{track}.{product}.tif"
+                        temp_acq = temp_mosaic / f"{i}.{date}.{dates[i + 1]}.{track}.{product}{suffix}"
                     except IndexError:
                         temp_acq = None
                 else:
-                    temp_acq = temp_mosaic / f"{i}.{date}.{track}.{product}.tif"
+                    temp_acq = temp_mosaic / f"{i}.{date}.{track}.{product}{suffix}"
 
                 if temp_acq:
                     iter_list.append([track, date, product, temp_acq, config_file])
@@ -537,7 +829,7 @@ def mosaic_timeseries(burst_inventory, config_file):
     # now we run with godale, which works also with 1 worker
     executor = Executor(executor=config_dict["executor_type"], max_workers=config_dict["max_workers"])
 
-    # run vrt creation
+    # each acquisition is a single mosaic, so all of them run as one task graph
     for task in executor.as_completed(func=mosaic.gd_mosaic_slc_acquisition, iterable=iter_list):
         task.result()
 
@@ -548,7 +840,7 @@ def mosaic_timeseries(burst_inventory, config_file):
         outfiles = []
         for i in range(len(dates)):
 
-            list_of_files = list(temp_mosaic.glob(f"{i}.*{product}.tif"))
+            list_of_files = list(temp_mosaic.glob(f"{i}.*{product}{suffix}"))
 
             if not list_of_files:
                 continue
@@ -566,7 +858,7 @@ def mosaic_timeseries(burst_inventory, config_file):
 
             # create namespace for output file
             if start == end:
-                outfile = ts_dir / f"{i + 1:02d}.{start}.{product}.tif"
+                outfile = ts_dir / f"{i + 1:02d}.{start}.{product}{suffix}"
 
                 # with the above operation, the list automatically
                 # turns into string, so we can call directly list_of_files
@@ -575,12 +867,9 @@ def mosaic_timeseries(burst_inventory, config_file):
                 continue
 
             else:
-                outfile = ts_dir / f"{i + 1:02d}.{start}-{end}.{product}.tif"
-
-            # create namespace for check_file
-            check_file = outfile.parent / f".{outfile.name[:-4]}.processed"
+                outfile = ts_dir / f"{i + 1:02d}.{start}-{end}.{product}{suffix}"
 
-            if check_file.exists():
+            if mosaic.is_processed(outfile, config_dict):
                 logger.info(f"Mosaic layer {outfile} already processed.")
                 continue
 
@@ -602,7 +891,8 @@ def mosaic_timeseries(burst_inventory, config_file):
         task.result()
 
     # remove temp folder
-    h.remove_folder_content(temp_mosaic)
+    if not virtual:
+        h.remove_folder_content(temp_mosaic)
 
 
 def mosaic_timescan(burst_inventory, config_file):
@@ -623,6 +913,7 @@ def mosaic_timescan(burst_inventory, config_file):
         config_dict = json.load(ard_file)
         processing_dir = Path(config_dict["processing_dir"])
         metrics = config_dict["processing"]["time-scan_ARD"]["metrics"]
+        virtual = config_dict["processing"]["mosaic"].get("virtual", False)
 
     if "harmonics" in metrics:
         metrics.remove("harmonics")
@@ -636,8 +927,15 @@ def mosaic_timescan(burst_inventory, config_file):
     ts_dir = processing_dir / "Mosaic" / "Timescan"
     ts_dir.mkdir(parents=True, exist_ok=True)
 
-    temp_mosaic = processing_dir / "Mosaic" / "temp"
+    # virtual mosaics reference the track mosaics, so we keep them
+    if virtual:
+        temp_mosaic, suffix = ts_dir / "tracks", ".vrt"
+    else:
+        temp_mosaic, suffix = processing_dir / "Mosaic" / "temp", ".tif"
     temp_mosaic.mkdir(parents=True, exist_ok=True)
+
+    # make sure the extent index is complete before querying it in parallel
+    extent_index.update_extent_index(processing_dir)
     # -------------------------------------
     # 2 create iterable
     # loop through each product
@@ -646,12 +944,12 @@ def mosaic_timescan(burst_inventory, config_file):
 
         for track in burst_inventory.Track.unique():
 
-            filelist = list(processing_dir.glob(f"[A,D]{track}_IW*/Timescan/*{product}.{metric}.tif"))
+            filelist = catalogue.glob(processing_dir, f"[A,D]{track}_IW*/Timescan/*{product}.{metric}.tif")
 
             if not len(filelist) >= 1:
                 continue
 
-            temp_acq = temp_mosaic / f"{track}.{product}.{metric}.tif"
+            temp_acq = temp_mosaic / f"{track}.{product}.{metric}{suffix}"
 
             if temp_acq:
                 iter_list.append([track, metric, product, temp_acq, config_file])
@@ -659,14 +957,14 @@ def mosaic_timescan(burst_inventory, config_file):
     # now we run with godale, which works also with 1 worker
     executor = Executor(executor=config_dict["executor_type"], max_workers=config_dict["max_workers"])
 
-    # run vrt creation
+    # each acquisition is a single mosaic, so all of them run as one task graph
     for task in executor.as_completed(func=mosaic.gd_mosaic_slc_acquisition, iterable=iter_list):
         task.result()
 
     iter_list = []
     for product, metric in itertools.product(PRODUCT_LIST, metrics):
 
-        list_of_files = list(temp_mosaic.glob(f"*{product}.{metric}.tif"))
+        list_of_files = list(temp_mosaic.glob(f"*{product}.{metric}{suffix}"))
 
         if not list_of_files:
             continue
@@ -675,10 +973,9 @@ def mosaic_timescan(burst_inventory, config_file):
         list_of_files = " ".join([str(file) for file in list_of_files])
 
         # create namespace for outfile
-        outfile = ts_dir / f"{product}.{metric}.tif"
-        check_file = outfile.parent / f".{outfile.name[:-4]}.processed"
+        outfile = ts_dir / f"{product}.{metric}{suffix}"
 
-        if check_file.exists():
+        if mosaic.is_processed(outfile, config_dict):
             logger.info(f"Mosaic layer {outfile.name} already processed.")
             continue
 
@@ -696,7 +993,8 @@ def mosaic_timescan(burst_inventory, config_file):
     ras.create_tscan_vrt(ts_dir, config_file)
 
     # remove temp folder
-    h.remove_folder_content(temp_mosaic)
+    if not virtual:
+        h.remove_folder_content(temp_mosaic)
 
 
 def mosaic_timescan_old(config_file):
@@ -731,9 +1029,8 @@ def mosaic_timescan_old(config_file):
         filelist = " ".join([str(file) for file in filelist])
 
         outfile = tscan_dir / f"{product}.{metric}.tif"
-        check_file = outfile.parent / f".{outfile.name[:-4]}.processed"
 
-        if check_file.exists():
+        if mosaic.is_processed(outfile, config_dict):
             logger.info(f"Mosaic layer {outfile.name} already processed.")
             continue
 
@@ -0,0 +1,223 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Shared cache of imported bursts
+
+For coherence, the slave burst of a job is the master burst of the job of
+the next date. Imported bursts are therefore kept in a cache within the
+temp directory, keyed by scene, subswath, burst number and the import
+parameters, and are shared by all jobs that use them.
+
+Before the jobs are started, each of them is registered as consumer of the
+imports it needs in a SQLite ledger within the cache. A job releases its
+imports once it is done, and an import is deleted as soon as all of its
+consumers have released it.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+
+from ost.helpers import helpers as h
+from ost.s1 import slc_wrappers as slc, safe_cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "burst_cache"
+LEDGER_NAME = ".burst_cache.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+# seconds between two checks of an import that is run by another job
+WAIT_INTERVAL = 5
+
+
+def _pid_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _cache_dir(config_dict):
+
+    cache_dir = Path(config_dict["temp_dir"]) / CACHE_NAME
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _connect(cache_dir):
+
+    connection = sqlite3.connect(str(cache_dir / LEDGER_NAME), timeout=TIMEOUT)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS imports (name TEXT PRIMARY KEY, pid INTEGER, done INTEGER)"
+    )
+    connection.execute("CREATE TABLE IF NOT EXISTS consumers (name TEXT, consumer TEXT)")
+    return connection
+
+
+def import_name(scene_id, swath, burst_nr, config_dict):
+    """Get the name of the cached import of a burst
+
+    :param scene_id: Sentinel-1 scene identifier
+    :param swath: subswath of the burst
+    :param burst_nr: number of the burst within the subswath
+    :param config_dict: an OST configuration dictionary
+    :return: name of the imported product
+    """
+
+    # parameters of slc.burst_import
+    ard = config_dict["processing"]["single_ARD"]
+    parameters = [
+        ard["polarisation"],
+        ard["coherence"] and ard["coherence_bands"],
+        config_dict["subset"] and config_dict.get("aoi"),
+    ]
+    digest = hashlib.sha1(json.dumps(parameters).encode()).hexdigest()[:8]
+
+    return f"{scene_id}_{swath}_{int(burst_nr)}_{digest}"
+
+
+def register(claims, config_dict):
+    """Register jobs as consumers of the imports they need
+
+    Registrations of previous runs are replaced.
+
+    :param claims: list of (consumer, import name) tuples
+    :param config_dict: an OST configuration dictionary
+    """
+
+    connection = _connect(_cache_dir(config_dict))
+    try:
+        with connection:
+            connection.execute("DELETE FROM consumers")
+            connection.executemany(
+                "INSERT INTO consumers VALUES (?, ?)", [(name, consumer) for consumer, name in claims]
+            )
+    finally:
+        connection.close()
+
+
+def _acquire(cache_dir, name, consumer):
+    """Claim an import and check if it needs to be run
+
+    Waits while the import is run by another job.
+
+    :return: True if the import needs to be run by the calling job
+    """
+
+    while True:
+        connection = _connect(cache_dir)
+        try:
+            connection.isolation_level = None
+            connection.execute("BEGIN EXCLUSIVE")
+
+            # jobs that were not registered claim the import themselves
+            if not connection.execute(
+                "SELECT 1 FROM consumers WHERE name = ? AND consumer = ?", (name, consumer)
+            ).fetchone():
+                connection.execute("INSERT INTO consumers VALUES (?, ?)", (name, consumer))
+
+            row = connection.execute("SELECT pid, done FROM imports WHERE name = ?", (name,)).fetchone()
+            if row and row[1] and (cache_dir / f"{name}.dim").exists():
+                connection.execute("COMMIT")
+                return False
+
+            if not row or row[1] or not _pid_alive(row[0]):
+                connection.execute("INSERT OR REPLACE INTO imports VALUES (?, ?, 0)", (name, os.getpid()))
+                connection.execute("COMMIT")
+                return True
+
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+        time.sleep(WAIT_INTERVAL)
+
+
+def _finish(cache_dir, name, done):
+
+    connection = _connect(cache_dir)
+    try:
+        with connection:
+            if done:
+                connection.execute("UPDATE imports SET done = 1 WHERE name = ?", (name,))
+            else:
+                connection.execute("DELETE FROM imports WHERE name = ?", (name,))
+    finally:
+        connection.close()
+
+
+def cached_import(infile, swath, burst_nr, consumer, logfile, config_dict):
+    """Get the import of a burst from the cache, or import it
+
+    :param infile: Sentinel-1 SLC product in zip or SAFE format
+    :param swath: subswath of the burst
+    :param burst_nr: number of the burst within the subswath
+    :param consumer: identifier of the job that uses the import
+    :param logfile: file where SNAP's error output is written to
+    :param config_dict: an OST configuration dictionary
+    :return: path to the imported burst without suffix
+    """
+
+    cache_dir = _cache_dir(config_dict)
+    name = import_name(Path(infile).stem, swath, burst_nr, config_dict)
+    product = cache_dir / name
+
+    if not _acquire(cache_dir, name, consumer):
+        logger.debug(f"Using cached import of burst {burst_nr} from {Path(infile).name}.")
+        return product
+
+    try:
+        with safe_cache.extracted([infile], config_dict, [swath]) as (scene,):
+            slc.burst_import(scene, product, logfile, swath, burst_nr, config_dict)
+    except BaseException:
+        if product.with_suffix(".dim").exists():
+            h.delete_dimap(product)
+
+        _finish(cache_dir, name, done=False)
+        raise
+
+    _finish(cache_dir, name, done=True)
+    return product
+
+
+def release(consumer, config_dict):
+    """Release all imports of a job
+
+    Imports that have no other consumers are deleted.
+
+    :param consumer: identifier of the job
+    :param config_dict: an OST configuration dictionary
+    """
+
+    cache_dir = _cache_dir(config_dict)
+    connection = _connect(cache_dir)
+    try:
+        connection.isolation_level = None
+        connection.execute("BEGIN EXCLUSIVE")
+
+        names = connection.execute("SELECT name FROM consumers WHERE consumer = ?", (consumer,)).fetchall()
+        connection.execute("DELETE FROM consumers WHERE consumer = ?", (consumer,))
+
+        for name, in names:
+            if connection.execute("SELECT 1 FROM consumers WHERE name = ?", (name,)).fetchone():
+                continue
+
+            logger.debug(f"Removing import {name}, as it is not needed anymore.")
+            if (cache_dir / f"{name}.dim").exists():
+                h.delete_dimap(cache_dir / name)
+            connection.execute("DELETE FROM imports WHERE name = ?", (name,))
+
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
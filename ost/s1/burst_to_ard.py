@@ -3,20 +3,52 @@
 
 import json
 import logging
+import itertools
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from datetime import datetime as dt
 
 import numpy as np
-import rasterio
+import pandas as pd
 
-from ost.helpers import helpers as h
-from ost.s1 import slc_wrappers as slc
-from ost.generic import common_wrappers as common
+from ost.helpers import helpers as h, envi, staging, dimap
+from ost.s1 import slc_wrappers as slc, burst_cache, coherence as coh, polarimetry
+from ost.generic import common_wrappers as common, ledger
 from ost.helpers import raster as ras
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
 
 logger = logging.getLogger(__name__)
 
+# date format within SNAP's band names
+SNAP_DATEFORMAT = "%d%b%Y"
+
+
+def _nans_to_zero(dimap):
+    """Set nans of all bands of a BEAM-DIMAP product to 0
+
+    :param dimap: product without suffix
+    """
+
+    for infile in list(dimap.with_suffix(".data").glob("*.img")):
+
+        # update the nans in place
+        array = envi.open_band(infile, mode="r+")
+        array[np.isnan(array)] = 0
+        array.flush()
+        del array
+
+
+def _native_decomposition(ard):
+    """Check if the H-A-Alpha decomposition is done by ost.s1.polarimetry
+
+    The polarimetric speckle filters are only available within SNAP, and
+    configurations without the pol_estimator key stay with SNAP as well.
+
+    :param ard: the single_ARD parameters
+    :return: bool
+    """
+
+    return ard.get("pol_estimator", "SNAP") == "native" and not ard["remove_pol_speckle"]
+
 
 def create_polarimetric_layers(import_file, out_dir, burst_prefix, config_dict):
     """Pipeline for Dual-polarimetric decomposition
@@ -28,8 +60,12 @@ def create_polarimetric_layers(import_file, out_dir, burst_prefix, config_dict):
     :return:
     """
 
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+
     # temp dir for intermediate files
-    with TemporaryDirectory(prefix=f"{config_dict['temp_dir']}/") as temp:
+    input_size = h.product_size(Path(import_file).with_suffix(".dim"))
+    with staging.staging_dir(config_dict, input_size, "burst_polarimetric") as temp:
         temp = Path(temp)
         # -------------------------------------------------------
         # 1 Polarimetric Decomposition
@@ -42,8 +78,11 @@ def create_polarimetric_layers(import_file, out_dir, burst_prefix, config_dict):
 
         # run polarimetric decomposition
         try:
-            slc.ha_alpha(import_file, out_haa, haa_log, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
+            if _native_decomposition(ard):
+                polarimetry.decompose(import_file, out_haa, config_dict)
+            else:
+                slc.ha_alpha(import_file, out_haa, haa_log, config_dict)
+        except (GPTRuntimeError, NotValidFileError, ValueError) as error:
             logger.info(error)
             return None, error
         # -------------------------------------------------------
@@ -55,38 +94,31 @@ def create_polarimetric_layers(import_file, out_dir, burst_prefix, config_dict):
         # create namespace for geocoding log
         haa_tc_log = out_dir / f"{burst_prefix}_haa_tc.err_log"
 
-        # run geocoding
+        # run geocoding, the native decomposition is still to be debursted
         try:
-            common.terrain_correction(out_haa.with_suffix(".dim"), out_htc, haa_tc_log, config_dict)
+            if _native_decomposition(ard):
+                slc.deburst_geocoding(out_haa.with_suffix(".dim"), out_htc, haa_tc_log, config_dict)
+            else:
+                common.terrain_correction(out_haa.with_suffix(".dim"), out_htc, haa_tc_log, config_dict)
         except (GPTRuntimeError, NotValidFileError) as error:
             logger.info(error)
             return None, error
 
         # set nans to 0 (issue from SNAP for polarimetric layers)
-        for infile in list(out_htc.with_suffix(".data").glob("*.img")):
-
-            with rasterio.open(str(infile), "r") as src:
-                meta = src.meta.copy()
-                array = src.read()
-                array[np.isnan(array)] = 0
-
-            with rasterio.open(str(infile), "w", **meta) as dest:
-                dest.write(array)
+        _nans_to_zero(out_htc)
 
         # ---------------------------------------------------------------------
         # 5 Create an outline
         ras.image_bounds(out_htc.with_suffix(".data"))
 
         # move to final destination
-        ard = config_dict["processing"]["single_ARD"]
         h.move_dimap(out_htc, out_dir / f"{burst_prefix}_pol", ard["to_tif"])
 
-        # write out check file for tracking that it is processed
-        with (out_dir / ".pol.processed").open("w+") as file:
-            file.write("passed all tests \n")
-
         dim_file = out_dir / f"{burst_prefix}_pol.dim"
 
+        # record the task as done in the job ledger
+        ledger.finish(config_dict["processing_dir"], out_dir / "pol", [dim_file])
+
         return (str(dim_file), None)
 
 
@@ -104,7 +136,8 @@ def create_backscatter_layers(import_file, out_dir, burst_prefix, config_dict):
     ard = config_dict["processing"]["single_ARD"]
 
     # temp dir for intermediate files
-    with TemporaryDirectory(prefix=f"{config_dict['temp_dir']}/") as temp:
+    input_size = h.product_size(Path(import_file).with_suffix(".dim"))
+    with staging.staging_dir(config_dict, input_size, "burst_backscatter") as temp:
 
         temp = Path(temp)
         # ---------------------------------------------------------------------
@@ -224,15 +257,112 @@ def create_backscatter_layers(import_file, out_dir, burst_prefix, config_dict):
         # move final backscatter product to actual output directory
         h.move_dimap(out_tc, out_dir / f"{burst_prefix}_bs", ard["to_tif"])
 
-        # write out check file for tracking that it is processed
-        with (out_dir / ".bs.processed").open("w+") as file:
-            file.write("passed all tests \n")
+        out_bs = str((out_dir / f"{burst_prefix}_bs").with_suffix(".dim"))
 
-        return (
-            str((out_dir / f"{burst_prefix}_bs").with_suffix(".dim")),
-            str(out_ls),
-            None,
-        )
+        # record the task as done in the job ledger
+        ledger.finish(config_dict["processing_dir"], out_dir / "bs", [out_bs, out_ls])
+
+        return (out_bs, str(out_ls), None)
+
+
+def create_fused_layers(import_file, out_dir, burst_prefix, config_dict, backscatter, polarimetric):
+    """Pipeline for backscatter and polarimetric processing in a single graph
+
+    :param import_file:
+    :param out_dir:
+    :param burst_prefix:
+    :param config_dict:
+    :param backscatter: create the backscatter layers
+    :param polarimetric: create the polarimetric layers
+    :return:
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+
+    # temp dir for intermediate files
+    input_size = h.product_size(Path(import_file).with_suffix(".dim"))
+    with staging.staging_dir(config_dict, input_size, "burst_fused") as temp:
+
+        temp = Path(temp)
+        # ---------------------------------------------------------------------
+        # 1 Backscatter and polarimetric processing
+
+        # create namespaces for temporary geocoded products and ls mask
+        out_tc = temp / f"{burst_prefix}_bs" if backscatter else None
+        ls_mask = temp / f"{burst_prefix}_ls_mask"
+        out_htc = temp / f"{burst_prefix}_pol" if polarimetric else None
+
+        # create namespace for processing log
+        logfile = out_dir / f"{burst_prefix}_ard.err_log"
+
+        # the native decomposition goes into the graph for geocoding
+        out_haa = None
+        if polarimetric and _native_decomposition(ard):
+            out_haa = temp / f"{burst_prefix}_h"
+            try:
+                polarimetry.decompose(import_file, out_haa, config_dict)
+            except ValueError as error:
+                logger.info(error)
+                return None, None, None, error
+
+        # run the processing graph
+        try:
+            slc.fused_ard(
+                import_file,
+                out_tc,
+                ls_mask,
+                out_htc,
+                logfile,
+                config_dict,
+                out_haa.with_suffix(".dim") if out_haa else None,
+            )
+        except (GPTRuntimeError, NotValidFileError) as error:
+            logger.info(error)
+            return None, None, None, error
+
+        # ---------------------------------------------------------------------
+        # 2 Polarimetric layers
+        out_pol = None  # set to none for final return statement
+        if polarimetric:
+
+            # set nans to 0 (issue from SNAP for polarimetric layers)
+            _nans_to_zero(out_htc)
+
+            # create an outline and move to final destination
+            ras.image_bounds(out_htc.with_suffix(".data"))
+            h.move_dimap(out_htc, out_dir / f"{burst_prefix}_pol", ard["to_tif"])
+
+            out_pol = str(out_dir / f"{burst_prefix}_pol.dim")
+
+            # record the task as done in the job ledger
+            ledger.finish(config_dict["processing_dir"], out_dir / "pol", [out_pol])
+
+        # ---------------------------------------------------------------------
+        # 3 Backscatter layers
+        out_bs, out_ls = None, None  # set to none for final return statement
+        if backscatter:
+
+            # create an outline
+            ras.image_bounds(out_tc.with_suffix(".data"))
+
+            # polygonize ls mask and move to product folder
+            if ard["create_ls_mask"] is True:
+                ls_raster = list(ls_mask.with_suffix(".data").glob("*img"))[0]
+                ras.polygonize_ls(ls_raster, ls_mask.with_suffix(".json"))
+
+                out_ls = out_tc.with_suffix(".data").joinpath(ls_mask.name).with_suffix(".json")
+                ls_mask.with_suffix(".json").rename(out_ls)
+
+            # move final backscatter product to actual output directory
+            h.move_dimap(out_tc, out_dir / f"{burst_prefix}_bs", ard["to_tif"])
+
+            out_bs = str((out_dir / f"{burst_prefix}_bs").with_suffix(".dim"))
+
+            # record the task as done in the job ledger
+            ledger.finish(config_dict["processing_dir"], out_dir / "bs", [out_bs, out_ls])
+
+        return out_bs, str(out_ls) if out_ls else None, out_pol, None
 
 
 def create_coherence_layers(master_import, slave_import, out_dir, master_prefix, config_dict):
@@ -250,72 +380,134 @@ def create_coherence_layers(master_import, slave_import, out_dir, master_prefix,
     # get relevant config parameters
     ard = config_dict["processing"]["single_ARD"]
 
-    with TemporaryDirectory(prefix=f"{config_dict['temp_dir']}/") as temp:
+    input_size = sum(h.product_size(Path(file).with_suffix(".dim")) for file in [master_import, slave_import])
+    with staging.staging_dir(config_dict, input_size, "burst_coherence") as temp:
 
         temp = Path(temp)
-        # ---------------------------------------------------------------
-        # 1 Co-registration
-        # create namespace for temporary co-registered stack
-        out_coreg = temp / f"{master_prefix}_coreg"
+        # co-registration by SNAP, and coherence estimation with numpy
+        # (configurations without the coherence_estimator key stay with SNAP)
+        if ard.get("coherence_estimator", "SNAP") == "native":
 
-        # create namespace for co-registration log
-        coreg_log = out_dir / f"{master_prefix}_coreg.err_log"
+            # create namespace for temporary co-registered stack
+            out_coreg = temp / f"{master_prefix}_coreg"
 
-        # run co-registration
-        try:
-            slc.coreg(master_import, slave_import, out_coreg, coreg_log, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
-            logger.info(error)
+            # create namespace for co-registration log
+            coreg_log = out_dir / f"{master_prefix}_coreg.err_log"
+
+            # run co-registration
+            try:
+                slc.coreg(master_import, slave_import, out_coreg, coreg_log, config_dict)
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                h.delete_dimap(out_coreg)
+                return None, error
+
+            # estimate the coherence
+            out_coh = temp / f"{master_prefix}_coherence"
+            try:
+                coh.estimate(out_coreg, out_coh, config_dict)
+            except ValueError as error:
+                logger.info(error)
+                return None, error
+
+            # remove coreg tmp files
             h.delete_dimap(out_coreg)
 
-            # remove imports
-            h.delete_dimap(master_import)
-            return None, error
+            # create namespace for temporary geocoded product
+            out_tc = temp / f"{master_prefix}_coh"
 
-        # remove imports
-        h.delete_dimap(master_import)
-        h.delete_dimap(slave_import)
+            # create namespace for geocoding log
+            tc_log = out_dir / f"{master_prefix}_coh_tc.err_log"
 
-        # ---------------------------------------------------------------
-        # 2 Coherence calculation
+            # deburst and geocode
+            try:
+                slc.deburst_geocoding(
+                    out_coh.with_suffix(".dim"),
+                    out_tc,
+                    tc_log,
+                    config_dict,
+                    ard["coherence_bands"].replace(" ", ""),
+                )
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                return None, error
 
-        # create namespace for temporary coherence product
-        out_coh = temp / f"{master_prefix}_coherence"
+            # remove tmp files
+            h.delete_dimap(out_coh)
 
-        # create namespace for coherence log
-        coh_log = out_dir / f"{master_prefix}_coh.err_log"
+        # co-registration, coherence estimation and geocoding in one graph
+        elif ard.get("fused_graph", False):
 
-        # run coherence estimation
-        try:
-            slc.coherence(out_coreg.with_suffix(".dim"), out_coh, coh_log, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
-            logger.info(error)
-            return None, error
+            # create namespace for temporary geocoded product
+            out_tc = temp / f"{master_prefix}_coh"
 
-        # remove coreg tmp files
-        h.delete_dimap(out_coreg)
+            # create namespace for processing log
+            coh_log = out_dir / f"{master_prefix}_coh.err_log"
 
-        # ---------------------------------------------------------------
-        # 3 Geocoding
+            # run the processing graph
+            try:
+                slc.fused_coherence(master_import, slave_import, out_tc, coh_log, config_dict)
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                return None, error
 
-        # create namespace for temporary geocoded roduct
-        out_tc = temp / f"{master_prefix}_coh"
+        else:
+            # -----------------------------------------------------------
+            # 1 Co-registration
+            # create namespace for temporary co-registered stack
+            out_coreg = temp / f"{master_prefix}_coreg"
 
-        # create namespace for geocoded log
-        tc_log = out_dir / f"{master_prefix}_coh_tc.err_log"
+            # create namespace for co-registration log
+            coreg_log = out_dir / f"{master_prefix}_coreg.err_log"
 
-        # run geocoding
-        try:
-            common.terrain_correction(out_coh.with_suffix(".dim"), out_tc, tc_log, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
-            logger.info(error)
-            return None, error
+            # run co-registration
+            try:
+                slc.coreg(master_import, slave_import, out_coreg, coreg_log, config_dict)
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                h.delete_dimap(out_coreg)
+                return None, error
 
-        # ---------------------------------------------------------------
-        # 4 Checks and Clean-up
+            # -----------------------------------------------------------
+            # 2 Coherence calculation
 
-        # remove tmp files
-        h.delete_dimap(out_coh)
+            # create namespace for temporary coherence product
+            out_coh = temp / f"{master_prefix}_coherence"
+
+            # create namespace for coherence log
+            coh_log = out_dir / f"{master_prefix}_coh.err_log"
+
+            # run coherence estimation
+            try:
+                slc.coherence(out_coreg.with_suffix(".dim"), out_coh, coh_log, config_dict)
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                return None, error
+
+            # remove coreg tmp files
+            h.delete_dimap(out_coreg)
+
+            # -----------------------------------------------------------
+            # 3 Geocoding
+
+            # create namespace for temporary geocoded roduct
+            out_tc = temp / f"{master_prefix}_coh"
+
+            # create namespace for geocoded log
+            tc_log = out_dir / f"{master_prefix}_coh_tc.err_log"
+
+            # run geocoding
+            try:
+                common.terrain_correction(out_coh.with_suffix(".dim"), out_tc, tc_log, config_dict)
+            except (GPTRuntimeError, NotValidFileError) as error:
+                logger.info(error)
+                return None, error
+
+            # -----------------------------------------------------------
+            # 4 Checks and Clean-up
+
+            # remove tmp files
+            h.delete_dimap(out_coh)
 
         # ---------------------------------------------------------------------
         # 5 Create an outline
@@ -324,175 +516,525 @@ def create_coherence_layers(master_import, slave_import, out_dir, master_prefix,
         # move to final destination
         h.move_dimap(out_tc, out_dir / f"{master_prefix}_coh", ard["to_tif"])
 
-        # write out check file for tracking that it is processed
-        with (out_dir / ".coh.processed").open("w+") as file:
-            file.write("passed all tests \n")
-
         dim_file = out_dir / f"{master_prefix}_coh.dim"
-        return (str(dim_file), None)
 
+        # record the task as done in the job ledger
+        ledger.finish(config_dict["processing_dir"], out_dir / "coh", [dim_file])
 
-def burst_to_ard(burst, config_file):
+        return (str(dim_file), None)
 
-    # this is a godale thing
-    if isinstance(burst, tuple):
-        i, burst = burst
 
-    # load relevant config parameters
-    with open(config_file, "r") as file:
-        config_dict = json.load(file)
-        ard = config_dict["processing"]["single_ARD"]
-        temp_dir = Path(config_dict["temp_dir"])
+def create_coherence_stack(imports, reference, products, log_dir, config_dict):
+    """Pipeline for multi-baseline coherence from a single co-registered stack
 
-    # creation of out_directory
-    out_dir = Path(burst.out_directory)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    All bursts are co-registered to the reference burst at once, and the
+    coherence of all pairs is estimated and geocoded together. The result
+    is split into a product per pair.
 
-    # existence of processed files
-    pol_file = (out_dir / ".pol.processed").exists()
-    bs_file = (out_dir / ".bs.processed").exists()
-    coh_file = (out_dir / ".coh.processed").exists()
+    :param imports: dict of dates and imported bursts
+    :param reference: date of the reference burst
+    :param products: dict of (first date, second date) tuples and the
+                     corresponding product paths without suffix
+    :param log_dir: directory for the log files
+    :param config_dict: an OST configuration dictionary
+    :return: dict of (first date, second date) tuples and the products,
+             and error
+    """
 
-    # set all return values initially to None
-    out_bs, out_ls, out_pol, out_coh = None, None, None, None
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+    prefix = Path(imports[reference]).stem
 
-    # check if we need to produce coherence
-    if ard["coherence"]:
-        # we check if there is actually a slave file or
-        # if it is the end of the time-series
-        coherence = True if burst.slave_file else False
-    else:
-        coherence = False
+    def snap_date(date):
+        return dt.strptime(date, "%Y%m%d").strftime(SNAP_DATEFORMAT)
 
-    # get info on master from GeoSeries
-    master_prefix = burst["master_prefix"]
-    master_file = burst["file_location"]
-    master_burst_nr = burst["BurstNr"]
-    swath = burst["SwathID"]
-
-    logger.info(f"Processing burst {burst.bid} acquired at {burst.Date}")
-    # check if somethings already processed
-    if (
-        (ard["H-A-Alpha"] and not pol_file)
-        or (ard["backscatter"] and not bs_file)
-        or (coherence and not coh_file)
-    ):
+    input_size = sum(h.product_size(Path(file).with_suffix(".dim")) for file in imports.values())
+    with staging.staging_dir(config_dict, 2 * input_size, "burst_coherence_stack") as temp:
 
+        temp = Path(temp)
         # ---------------------------------------------------------------------
-        # 1 Master import
-        # create namespace for master import
-        master_import = temp_dir / f"{master_prefix}_import"
+        # 1 Co-registration of all dates to the reference
 
-        if not master_import.with_suffix(".dim").exists():
+        out_coreg = temp / f"{prefix}_coreg"
+        coreg_log = log_dir / f"{prefix}_coreg_stack.err_log"
 
-            # create namespace for log file
-            import_log = out_dir / f"{master_prefix}_import.err_log"
+        slaves = [imports[date].with_suffix(".dim") for date in sorted(imports) if date != reference]
+        try:
+            slc.coreg_stack(imports[reference].with_suffix(".dim"), slaves, out_coreg, coreg_log, config_dict)
+        except (GPTRuntimeError, NotValidFileError) as error:
+            logger.info(error)
+            return {}, error
 
-            # run import
-            try:
-                slc.burst_import(
-                    master_file,
-                    master_import,
-                    import_log,
-                    swath,
-                    master_burst_nr,
-                    config_dict,
-                )
-            except (GPTRuntimeError, NotValidFileError) as error:
-                if master_import.with_suffix(".dim").exists():
-                    h.delete_dimap(master_import)
+        # ---------------------------------------------------------------------
+        # 2 Coherence of all pairs
+        out_coh = temp / f"{prefix}_coherence"
+        pairs = coh.stack_pairs(
+            out_coreg,
+            ard["coherence_bands"].replace(" ", "").split(","),
+            [(snap_date(first), snap_date(second)) for first, second in products],
+        )
+        try:
+            coh.estimate(out_coreg, out_coh, config_dict, pairs=pairs)
+        except ValueError as error:
+            logger.info(error)
+            return {}, error
 
-                logger.info(error)
-                return burst.bid, burst.Date, None, None, None, None, error
+        # remove coreg tmp files
+        h.delete_dimap(out_coreg)
 
         # ---------------------------------------------------------------------
-        # 2 Product Generation
-        if ard["H-A-Alpha"] and not pol_file:
-            out_pol, error = create_polarimetric_layers(
-                master_import.with_suffix(".dim"), out_dir, master_prefix, config_dict
+        # 3 Deburst and geocoding of all pairs at once
+        out_tc = temp / f"{prefix}_coh"
+        tc_log = log_dir / f"{prefix}_coh_stack_tc.err_log"
+        try:
+            slc.deburst_geocoding(
+                out_coh.with_suffix(".dim"),
+                out_tc,
+                tc_log,
+                config_dict,
+                ard["coherence_bands"].replace(" ", ""),
             )
-        elif ard["H-A-Alpha"] and pol_file:
-            # construct namespace for existing pol layer
-            out_pol = str(out_dir / f"{master_prefix}_pol.dim")
+        except (GPTRuntimeError, NotValidFileError) as error:
+            logger.info(error)
+            return {}, error
+
+        # remove tmp files
+        h.delete_dimap(out_coh)
 
-        if ard["backscatter"] and not bs_file:
-            out_bs, out_ls, error = create_backscatter_layers(
-                master_import.with_suffix(".dim"), out_dir, master_prefix, config_dict
+        # ---------------------------------------------------------------------
+        # 4 Split into a product per pair
+        out_files = {}
+        for (first, second), product in products.items():
+
+            bands = sorted(
+                out_tc.with_suffix(".data").glob(f"coh_*_{snap_date(first)}_{snap_date(second)}.img")
             )
-        elif ard["backscatter"] and bs_file:
-            out_bs = str(out_dir / f"{master_prefix}_bs.dim")
+            if not bands:
+                logger.info(f"No coherence of {first} and {second} within {out_tc.name}.")
+                continue
+
+            out_pair = temp / product.name
+            arrays = dimap.derive_product(out_tc, out_pair, [band.stem for band in bands])
+            for band in bands:
+                arrays[band.stem][:] = envi.open_band(band)
+                arrays[band.stem].flush()
+            del arrays
+
+            # create an outline and move to final destination
+            ras.image_bounds(out_pair.with_suffix(".data"))
+            product.parent.mkdir(parents=True, exist_ok=True)
+            h.move_dimap(out_pair, product, ard["to_tif"])
 
-            if ard["create_ls_mask"] and bs_file:
-                out_ls = str(out_dir / f"{master_prefix}_LS.dim")
+            out_files[first, second] = str(product.with_suffix(".dim"))
 
-        if coherence and not coh_file:
+            # record the task as done in the job ledger
+            ledger.finish(config_dict["processing_dir"], product.parent / "coh", [out_files[first, second]])
 
-            # get info on slave from GeoSeries
-            slave_prefix = burst["slave_prefix"]
-            slave_file = burst["slave_file"]
-            slave_burst_nr = burst["slave_burst_nr"]
+        return out_files, None
 
-            with TemporaryDirectory(prefix=f"{str(temp_dir)}/") as temp:
 
-                # convert temp to Path object
-                temp = Path(temp)
+def baseline_dir(out_dir, baseline):
+    """Get the directory of the coherence products of a temporal baseline
 
-                # import slave burst
-                slave_import = temp / f"{slave_prefix}_import"
-                import_log = out_dir / f"{slave_prefix}_import.err_log"
+    Products of the next date are placed in the output directory of the
+    burst's date itself, the ones of longer baselines within a
+    subdirectory, so that the time-series processing is not mixed up.
 
+    :param out_dir: output directory of the burst's date
+    :param baseline: temporal baseline in number of acquisitions
+    :return: directory of the products
+    """
+
+    return Path(out_dir) if baseline == 1 else Path(out_dir) / f"baseline_{baseline}"
+
+
+def stack_consumer(bid):
+    """Get the identifier of the coherence stack job of a burst in the burst cache"""
+
+    return f"{bid}_coherence_stack"
+
+
+def stack_pairs(bursts, config_dict, completed=None):
+    """Get the pairs of dates of a burst's coherence stack
+
+    :param bursts: rows of a prepared OST burst inventory, with all dates of
+                   a single burst, sorted by date
+    :param config_dict: an OST configuration dictionary
+    :param completed: completed tasks as returned by ledger.completed,
+                      queried for the burst if not given
+    :return: dicts of the products of all pairs, and of the ones that
+             still need to be processed
+    """
+
+    ard = config_dict["processing"]["single_ARD"]
+    processing_dir = Path(config_dict["processing_dir"])
+    dates = bursts.Date.tolist()
+
+    if completed is None:
+        prefix = f"{ledger.task_id(processing_dir, processing_dir / bursts.bid.values[0])}/"
+        completed = ledger.completed(processing_dir, ard, prefix=prefix)
+
+    coh_parameters = ledger.ard_parameters(ard, "coh")
+
+    products, todo = {}, {}
+    for i, k in itertools.product(range(len(dates)), sorted(set(ard.get("coherence_baselines", [1])))):
+        if i + k >= len(dates):
+            continue
+
+        out_dir = baseline_dir(bursts.out_directory.values[i], k)
+        product = out_dir / f"{bursts.master_prefix.values[i]}_coh"
+        products[dates[i], dates[i + k]] = product
+        if ledger.task_id(processing_dir, out_dir / "coh") not in completed and not ledger.is_done(
+            processing_dir, out_dir / "coh", coh_parameters, legacy=out_dir / ".coh.processed"
+        ):
+            todo[dates[i], dates[i + k]] = product
+
+    return products, todo
+
+
+def stack_imports(bursts, config_dict, completed=None):
+    """Get the imports the coherence stack job of a burst needs from the burst cache
+
+    :param bursts: rows of a prepared OST burst inventory, with all dates of
+                   a single burst
+    :param config_dict: an OST configuration dictionary
+    :param completed: completed tasks as returned by ledger.completed
+    :return: list of (consumer, import name) tuples
+    """
+
+    bursts = bursts.sort_values("Date", kind="mergesort")
+    _, todo = stack_pairs(bursts, config_dict, completed)
+
+    return [
+        (
+            stack_consumer(burst.bid),
+            burst_cache.import_name(burst.SceneID, burst.SwathID, burst.BurstNr, config_dict),
+        )
+        for burst in bursts.itertuples()
+        if any(burst.Date in pair for pair in todo)
+    ]
+
+
+def coherence_stack_to_ard(bursts, config_file):
+    """Create the multi-baseline coherence layers of a burst
+
+    Instead of co-registering each pair of consecutive dates on its own,
+    all dates are co-registered to the middle one at once. The coherence is
+    then estimated for the temporal baselines of the coherence_baselines
+    parameter, e.g. [1, 2, 3] for the next three acquisitions.
+
+    :param bursts: rows of a prepared OST burst inventory, with all dates of
+                   a single burst
+    :param config_file: path to the project config file
+    :return: list of (bid, date, coherence product, error) tuples, with the
+             product of the shortest baseline of each date
+    """
+
+    # load relevant config parameters
+    with open(config_file, "r") as file:
+        config_dict = json.load(file)
+        ard = config_dict["processing"]["single_ARD"]
+        processing_dir = Path(config_dict["processing_dir"])
+
+    bursts = bursts.sort_values("Date", kind="mergesort")
+    bid, dates = bursts.bid.values[0], bursts.Date.tolist()
+    log_dir = processing_dir / bid
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # tasks of the burst that are completed, from a single query of the ledger
+    prefix = f"{ledger.task_id(processing_dir, log_dir)}/"
+    completed = ledger.completed(processing_dir, ard, prefix=prefix)
+
+    # products of all pairs, and the ones that still need to be processed
+    products, todo = stack_pairs(bursts, config_dict, completed)
+
+    errors = {}
+    if todo:
+        logger.info(f"Processing the coherence of {len(todo)} pair(s) of burst {bid} from a single stack.")
+
+        # record the start of the tasks in the job ledger
+        files = dict(zip(dates, bursts.file_location))
+        coh_parameters = ledger.ard_parameters(ard, "coh")
+        for (first, second), product in todo.items():
+            inputs = [files[first], files[second]]
+            ledger.start(processing_dir, product.parent / "coh", inputs, coh_parameters)
+
+        # get the imports of all dates that are needed from the burst cache,
+        # which are released again whatever happens
+        consumer = stack_consumer(bid)
+        try:
+            imports = {}
+            for burst in bursts.itertuples():
+                if not any(burst.Date in pair for pair in todo):
+                    continue
+
+                import_log = log_dir / f"{burst.master_prefix}_import.err_log"
                 try:
-                    slc.burst_import(
-                        slave_file,
-                        slave_import,
-                        import_log,
-                        swath,
-                        slave_burst_nr,
-                        config_dict,
+                    imports[burst.Date] = burst_cache.cached_import(
+                        burst.file_location, burst.SwathID, burst.BurstNr, consumer, import_log, config_dict
                     )
                 except (GPTRuntimeError, NotValidFileError) as error:
-                    if slave_import.with_suffix(".dim").exists():
-                        h.delete_dimap(slave_import)
-
                     logger.info(error)
-                    return burst.bid, burst.Date, None, None, None, None, error
-
-                out_coh, error = create_coherence_layers(
-                    master_import.with_suffix(".dim"),
-                    slave_import.with_suffix(".dim"),
-                    out_dir,
-                    master_prefix,
+                    errors[burst.Date] = error
+
+            # pairs with a failed import are skipped
+            for pair, product in todo.items():
+                failed = errors.keys() & set(pair)
+                if failed:
+                    ledger.fail(processing_dir, [product.parent / "coh"], errors[failed.pop()])
+
+            todo = {pair: product for pair, product in todo.items() if not errors.keys() & set(pair)}
+
+            if todo:
+                needed = sorted({date for pair in todo for date in pair})
+                _, error = create_coherence_stack(
+                    {date: imports[date] for date in needed},
+                    needed[len(needed) // 2],
+                    todo,
+                    log_dir,
                     config_dict,
                 )
+                if error:
+                    ledger.fail(processing_dir, [product.parent / "coh" for product in todo.values()], error)
+                    for first, _ in todo:
+                        errors.setdefault(first, error)
+        finally:
+            burst_cache.release(consumer, config_dict)
+        completed = ledger.completed(processing_dir, ard, prefix=prefix)
 
-                # remove master import
-                h.delete_dimap(master_import)
+    # products of the shortest baseline of each date
+    out_coh = {}
+    for (first, _), product in products.items():
+        if first not in out_coh and ledger.task_id(processing_dir, product.parent / "coh") in completed:
+            out_coh[first] = str(product.with_suffix(".dim"))
 
-        elif coherence and coh_file:
-            out_coh = str(out_dir / f"{master_prefix}_coh.dim")
+    return [(bid, date, out_coh.get(date), errors.get(date)) for date in dates]
 
-            # remove master import
-            h.delete_dimap(master_import)
-        else:
-            # remove master import
-            h.delete_dimap(master_import)
 
-    # in case everything has been already processed,
-    # we re-construct the out names for proper return value
-    else:
-        if ard["H-A-Alpha"] and pol_file:
-            out_pol = str(out_dir / f"{master_prefix}_pol.dim")
+def burst_tasks(burst, config_dict):
+    """Get the tasks of a burst job within the job ledger
+
+    :param burst: row of a prepared OST burst inventory
+    :param config_dict: an OST configuration dictionary
+    :return: dict of the job's products, i.e. bs, pol and coh, and their tasks
+    """
+
+    ard = config_dict["processing"]["single_ARD"]
+    out_dir = Path(burst.out_directory)
+
+    products = []
+    if ard["backscatter"]:
+        products.append("bs")
 
-        if ard["backscatter"] and bs_file:
-            out_bs = str(out_dir / f"{master_prefix}_bs.dim")
+    if ard["H-A-Alpha"]:
+        products.append("pol")
+
+    # coherence is processed for all dates of the burst at once in stack
+    # mode, and there is no slave at the end of the time-series
+    if ard["coherence"] and not ard.get("coherence_stack", False) and pd.notnull(burst.slave_file):
+        products.append("coh")
+
+    return {product: out_dir / product for product in products}
+
+
+def pending_products(burst, config_dict, completed=None):
+    """Get the products of a burst job that still need to be processed
+
+    :param burst: row of a prepared OST burst inventory
+    :param config_dict: an OST configuration dictionary
+    :param completed: completed tasks as returned by ledger.completed,
+                      queried for the burst's date if not given
+    :return: list of products
+    """
+
+    ard = config_dict["processing"]["single_ARD"]
+    processing_dir = config_dict["processing_dir"]
+
+    if completed is None:
+        prefix = f"{ledger.task_id(processing_dir, burst.out_directory)}/"
+        completed = ledger.completed(processing_dir, ard, prefix=prefix)
+
+    return [
+        product
+        for product, task in burst_tasks(burst, config_dict).items()
+        if ledger.task_id(processing_dir, task) not in completed
+        and not ledger.is_done(
+            processing_dir,
+            task,
+            ledger.ard_parameters(ard, product),
+            legacy=task.parent / f".{product}.processed",
+        )
+    ]
+
+
+def burst_outputs(burst, config_dict, products):
+    """Get the paths of the processed products of a burst job
+
+    :param burst: row of a prepared OST burst inventory
+    :param config_dict: an OST configuration dictionary
+    :param products: list of the processed products, i.e. bs, pol and coh
+    :return: backscatter, layover/shadow mask, polarimetric and coherence product
+    """
+
+    ard = config_dict["processing"]["single_ARD"]
+    out_dir, prefix = Path(burst.out_directory), burst.master_prefix
+
+    out_bs = str(out_dir / f"{prefix}_bs.dim") if "bs" in products else None
+    out_ls = str(out_dir / f"{prefix}_LS.dim") if "bs" in products and ard["create_ls_mask"] else None
+    out_pol = str(out_dir / f"{prefix}_pol.dim") if "pol" in products else None
+    out_coh = str(out_dir / f"{prefix}_coh.dim") if "coh" in products else None
+
+    return out_bs, out_ls, out_pol, out_coh
+
+
+def burst_imports(burst, config_dict, completed=None):
+    """Get the imports a burst job needs from the burst cache
+
+    :param burst: row of a prepared OST burst inventory
+    :param config_dict: an OST configuration dictionary
+    :param completed: completed tasks as returned by ledger.completed
+    :return: list of (consumer, import name) tuples
+    """
+
+    pending = pending_products(burst, config_dict, completed)
+
+    claims = []
+    if pending:
+        name = burst_cache.import_name(burst.SceneID, burst.SwathID, burst.BurstNr, config_dict)
+        claims.append((burst.master_prefix, name))
+
+    if "coh" in pending:
+        name = burst_cache.import_name(burst.slave_scene_id, burst.SwathID, burst.slave_burst_nr, config_dict)
+        claims.append((burst.master_prefix, name))
+
+    return claims
+
+
+def burst_to_ard(burst, config_file):
+
+    # this is a godale thing
+    if isinstance(burst, tuple):
+        i, burst = burst
+
+    # load relevant config parameters
+    with open(config_file, "r") as file:
+        config_dict = json.load(file)
+        ard = config_dict["processing"]["single_ARD"]
+        processing_dir = config_dict["processing_dir"]
+
+    # creation of out_directory
+    out_dir = Path(burst.out_directory)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # products that still need to be processed, according to the job ledger
+    tasks = burst_tasks(burst, config_dict)
+    pending = pending_products(burst, config_dict)
+
+    # return values of the products that have already been processed
+    out_bs, out_ls, out_pol, out_coh = burst_outputs(
+        burst, config_dict, [product for product in tasks if product not in pending]
+    )
+    if not pending:
+        return burst.bid, burst.Date, out_bs, out_ls, out_pol, out_coh, None
+
+    # get info on master from GeoSeries
+    master_prefix = burst["master_prefix"]
+    master_file = burst["file_location"]
+    master_burst_nr = burst["BurstNr"]
+    swath = burst["SwathID"]
+
+    logger.info(f"Processing burst {burst.bid} acquired at {burst.Date}")
+
+    # record the start of the tasks in the job ledger
+    for product in pending:
+        inputs = [master_file, burst["slave_file"]] if product == "coh" else [master_file]
+        ledger.start(processing_dir, tasks[product], inputs, ledger.ard_parameters(ard, product))
+
+    # ---------------------------------------------------------------------
+    # 1 Master import
+
+    # create namespace for log file
+    import_log = out_dir / f"{master_prefix}_import.err_log"
+
+    # get the import from the burst cache, shared with the job
+    # that uses the burst as slave
+    try:
+        master_import = burst_cache.cached_import(
+            master_file, swath, master_burst_nr, master_prefix, import_log, config_dict
+        )
+    except (GPTRuntimeError, NotValidFileError) as error:
+        logger.info(error)
+        ledger.fail(processing_dir, [tasks[product] for product in pending], error)
+        burst_cache.release(master_prefix, config_dict)
+        return burst.bid, burst.Date, None, None, None, None, error
+
+    # ---------------------------------------------------------------------
+    # 2 Product Generation
+    # (configurations without the fused_graph key keep the single graphs per product)
+    fused = ard.get("fused_graph", False)
+    pol_todo, bs_todo = "pol" in pending, "bs" in pending
+    errors = []
+
+    # backscatter and polarimetric layers from a single processing graph
+    if fused and (pol_todo or bs_todo):
+        fused_bs, fused_ls, fused_pol, error = create_fused_layers(
+            master_import.with_suffix(".dim"), out_dir, master_prefix, config_dict, bs_todo, pol_todo
+        )
+        out_bs, out_ls = (fused_bs, fused_ls) if bs_todo else (out_bs, out_ls)
+        out_pol = fused_pol if pol_todo else out_pol
+        errors.append(error)
+
+    if pol_todo and not fused:
+        out_pol, error = create_polarimetric_layers(
+            master_import.with_suffix(".dim"), out_dir, master_prefix, config_dict
+        )
+        errors.append(error)
+
+    if bs_todo and not fused:
+        out_bs, out_ls, error = create_backscatter_layers(
+            master_import.with_suffix(".dim"), out_dir, master_prefix, config_dict
+        )
+        errors.append(error)
+
+    if "coh" in pending:
+
+        # get info on slave from GeoSeries
+        slave_prefix = burst["slave_prefix"]
+        slave_file = burst["slave_file"]
+        slave_burst_nr = burst["slave_burst_nr"]
+
+        # get the slave import from the burst cache, shared with
+        # the job that uses the burst as master
+        import_log = out_dir / f"{slave_prefix}_import.err_log"
+        try:
+            slave_import = burst_cache.cached_import(
+                slave_file, swath, slave_burst_nr, master_prefix, import_log, config_dict
+            )
+        except (GPTRuntimeError, NotValidFileError) as error:
+            logger.info(error)
+            ledger.fail(processing_dir, [tasks[product] for product in pending], error)
+            burst_cache.release(master_prefix, config_dict)
+            return burst.bid, burst.Date, None, None, None, None, error
+
+        out_coh, error = create_coherence_layers(
+            master_import.with_suffix(".dim"),
+            slave_import.with_suffix(".dim"),
+            out_dir,
+            master_prefix,
+            config_dict,
+        )
+        errors.append(error)
 
-        if ard["create_ls_mask"] and bs_file:
-            out_ls = str(out_dir / f"{master_prefix}_LS.dim")
+    # release the imports, which are deleted once
+    # no other job needs them anymore
+    burst_cache.release(master_prefix, config_dict)
 
-        if coherence and coh_file:
-            out_coh = str(out_dir / f"{master_prefix}_coh.dim")
+    # tasks that have not been finished are recorded as failed
+    error = next((error for error in errors if error), None)
+    if error:
+        ledger.fail(processing_dir, [tasks[product] for product in pending], error)
 
-    return burst.bid, burst.Date, out_bs, out_ls, out_pol, out_coh, None
+    return burst.bid, burst.Date, out_bs, out_ls, out_pol, out_coh, error
 
 
 if __name__ == "__main__":
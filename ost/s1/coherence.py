@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Native estimation of the interferometric coherence
+
+The coherence of co-registered complex bursts is estimated with numpy,
+instead of SNAP's Coherence operator, directly on the bands of the
+co-registered product. The bursts are processed in tiles, which run in
+parallel. Each tile is read with a margin of two windows, so that the
+tiles fit together without seams.
+
+Within the estimation window, the fringes of the flat earth phase (and of
+large-scale topography) would bias the coherence low. They are
+approximated by the dominant fringe frequency of the interferogram of each
+tile and removed, as long as that frequency stands out from the noise.
+"""
+
+import re
+import time
+import logging
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+from ost.helpers import helpers as h, envi, dimap
+
+logger = logging.getLogger(__name__)
+
+# size of the tiles in rows and columns
+TILE_ROWS = 512
+TILE_COLS = 2048
+
+# maximum fringe frequency in cycles per pixel, and power of the spectral
+# peak relative to the mean power above which fringes are removed
+MAX_FRINGE = 0.1
+MIN_PEAK_RATIO = 20
+
+# estimation windows, with the standard deviation of the gaussian
+# window set to the one of a boxcar of the same size
+WINDOWS = {
+    "boxcar": lambda array, size: ndimage.uniform_filter(array, size),
+    "gaussian": lambda array, size: ndimage.gaussian_filter(array, np.divide(size, np.sqrt(12))),
+}
+
+# i band of a co-registered stack, e.g. i_IW1_VV_slv2_13Jan2020
+STACK_BAND = re.compile(r"i_(\w+?)_(?:mst|slv\d*)_(\d{2}[A-Za-z]{3}\d{4})$")
+
+
+def _fringe_frequency(interferogram):
+    """Get the dominant fringe frequency of an interferogram
+
+    :param interferogram: 2-d complex array
+    :return: frequency in rows and columns in cycles per pixel,
+             or 0, 0 if there are no significant fringes
+    """
+
+    power = np.abs(np.fft.fft2(interferogram)) ** 2
+    mean = power.mean()
+
+    # only fringe frequencies that can be expected
+    freq_rows, freq_cols = np.fft.fftfreq(power.shape[0]), np.fft.fftfreq(power.shape[1])
+    power[np.abs(freq_rows) > MAX_FRINGE, :] = 0
+    power[:, np.abs(freq_cols) > MAX_FRINGE] = 0
+
+    row, col = np.unravel_index(np.argmax(power), power.shape)
+    if power[row, col] < MIN_PEAK_RATIO * mean:
+        return 0, 0
+
+    return freq_rows[row], freq_cols[col]
+
+
+def _tile_coherence(first, second, tile, shape, window, smooth):
+    """Estimate the coherence of one tile
+
+    :param first: memmaps of the i and q bands of the first image
+    :param second: memmaps of the i and q bands of the second image
+    :param tile: slices of the tile's rows and columns
+    :param shape: number of rows and columns of the images
+    :param window: size of the estimation window in rows and columns
+    :param smooth: function that averages an array within the window
+    :return: coherence of the tile
+    """
+
+    # read with margins, as far as the image goes
+    rows, cols = (
+        slice(max(part.start - 2 * size, 0), min(part.stop + 2 * size, length))
+        for part, size, length in zip(tile, window, shape)
+    )
+
+    first, second = envi.read_complex(first, rows, cols), envi.read_complex(second, rows, cols)
+    interferogram = first * np.conj(second)
+
+    # remove the dominant fringes
+    freq_rows, freq_cols = _fringe_frequency(interferogram)
+    if freq_rows or freq_cols:
+        interferogram *= np.outer(
+            np.exp(-2j * np.pi * freq_rows * np.arange(interferogram.shape[0])),
+            np.exp(-2j * np.pi * freq_cols * np.arange(interferogram.shape[1])),
+        )
+
+    numerator = np.hypot(smooth(interferogram.real), smooth(interferogram.imag))
+    denominator = np.sqrt(smooth(np.abs(first) ** 2) * smooth(np.abs(second) ** 2))
+    coherence = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+    # cut the margins
+    core = tuple(
+        slice(part.start - margin.start, part.stop - margin.start) for part, margin in zip(tile, (rows, cols))
+    )
+    return np.clip(coherence[core], 0, 1)
+
+
+def image_pairs(coreg, polarisations):
+    """Get the master and slave image pairs of a co-registered product
+
+    Band names follow SNAP's Back-Geocoding, i.e. i_IW1_VV_mst_01Jan2020
+    for the master and i_IW1_VV_slv1_13Jan2020 for the slaves.
+
+    :param coreg: co-registered product without suffix
+    :param polarisations: list of polarisations
+    :return: list of (coherence band name, master i band, slave i band)
+    """
+
+    data_dir = Path(coreg).with_suffix(".data")
+
+    pairs = []
+    for master in sorted(data_dir.glob("i_*_mst_*.img")):
+        prefix, master_date = master.stem[2:].rsplit("_mst_", 1)
+        if prefix.split("_")[-1] not in polarisations:
+            continue
+
+        for slave in sorted(data_dir.glob(f"i_{prefix}_slv*_*.img")):
+            slave_date = slave.stem.rsplit("_", 1)[-1]
+            pairs.append((f"coh_{prefix}_{master_date}_{slave_date}", master, slave))
+
+    return pairs
+
+
+def stack_pairs(coreg, polarisations, date_pairs):
+    """Get image pairs of arbitrary dates of a co-registered stack
+
+    Within a stack, master and slave bands are taken alike, so that the
+    coherence can be estimated between any two of its dates.
+
+    :param coreg: co-registered stack without suffix
+    :param polarisations: list of polarisations
+    :param date_pairs: list of (first date, second date) tuples, with dates
+                       as within the band names, e.g. 01Jan2020
+    :return: list of (coherence band name, first i band, second i band)
+    """
+
+    images = {}
+    for image in Path(coreg).with_suffix(".data").glob("i_*.img"):
+        match = STACK_BAND.match(image.stem)
+        if match and match.group(1).split("_")[-1] in polarisations:
+            images[match.group(1), match.group(2)] = image
+
+    pairs = []
+    for prefix in sorted({prefix for prefix, _ in images}):
+        for first, second in date_pairs:
+            if (prefix, first) in images and (prefix, second) in images:
+                pairs.append(
+                    (f"coh_{prefix}_{first}_{second}", images[prefix, first], images[prefix, second])
+                )
+
+    return pairs
+
+
+def estimate(coreg, outfile, config_dict, pairs=None):
+    """Estimate the coherence of a co-registered product
+
+    The coherence product keeps the metadata of the co-registered product,
+    so it can be debursted and terrain corrected by SNAP.
+
+    :param coreg: co-registered BEAM-DIMAP product without suffix
+    :param outfile: the coherence product without suffix
+    :param config_dict: an OST configuration dictionary
+    :param pairs: list of (coherence band name, first i band, second i band),
+                  defaults to all master and slave pairs of the product
+    :return: path to the coherence product
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+    window = (ard["coherence_azimuth"], ard["coherence_range"])
+    smooth = partial(WINDOWS[ard.get("coherence_window", "boxcar")], size=window)
+
+    if pairs is None:
+        pairs = image_pairs(coreg, ard["coherence_bands"].replace(" ", "").split(","))
+
+    if not pairs:
+        raise ValueError(f"No co-registered images of the coherence bands found in {coreg}.")
+
+    logger.debug(f"Estimating the coherence of {len(pairs)} image pair(s) with a {window} window.")
+    currtime = time.time()
+
+    bands = dimap.derive_product(coreg, outfile, [name for name, _, _ in pairs])
+
+    with ThreadPoolExecutor(max_workers=config_dict["snap_cpu_parallelism"]) as executor:
+        for name, first, second in pairs:
+
+            first, second = envi.open_complex(first), envi.open_complex(second)
+            shape = first[0].shape
+
+            tiles = envi.tiles(shape, TILE_ROWS, TILE_COLS)
+            tile_coherence = partial(
+                _tile_coherence, first, second, shape=shape, window=window, smooth=smooth
+            )
+            for tile, coherence in zip(tiles, executor.map(tile_coherence, tiles)):
+                bands[name][tile] = coherence
+
+            bands[name].flush()
+
+    logger.debug(h.timer(currtime))
+    return str(Path(outfile).with_suffix(".dim"))
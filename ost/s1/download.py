@@ -9,16 +9,26 @@ vertex as well as PEPS from CNES.
 
 """
 
+import os
+import time
 import getpass
 import logging
+import multiprocessing
 from pathlib import Path
 
 from ost.s1.s1scene import Sentinel1Scene as S1Scene
 from ost.helpers import helpers as h
 from ost.helpers import scihub, peps, asf, onda  # , asf_wget
+from ost.helpers.errors import DownloadError
 
 logger = logging.getLogger(__name__)
 
+# marker of a running background download, holding its process id
+STREAMING_FLAG = ".downloading"
+
+# seconds between two checks for downloaded scenes
+WAIT_INTERVAL = 30
+
 
 def restore_download_dir(input_directory, download_dir):
     """Create the OST download directory structure from downloaded files
@@ -152,3 +162,120 @@ def download_sentinel1(inventory_df, download_dir, mirror=None, concurrent=2, un
     # elif int(mirror) == 5:    # ASF WGET
     #    asf_wget.batch_download(inventory_df, download_dir,
     #                            uname, pword, concurrent)
+
+
+def download_order(jobs, available):
+    """Order the scenes to download so that they unblock processing early
+
+    Scenes are picked one by one, preferring the scene that completes the
+    inputs of most processing jobs, and then the scene that is needed by
+    most of the jobs that are still incomplete.
+
+    :param jobs: list of sets of scene ids, one set per processing job
+    :param available: set of scene ids that are available already
+    :return: list of scene ids to download, and list of job indices in
+             the order their inputs become complete
+    """
+
+    missing = [set(job) - set(available) for job in jobs]
+
+    # jobs per scene
+    scene_jobs = {}
+    for i, job in enumerate(missing):
+        for scene in job:
+            scene_jobs.setdefault(scene, []).append(i)
+
+    job_order = [i for i, job in enumerate(missing) if not job]
+    scene_order = []
+    while scene_jobs:
+
+        # jobs completed, and jobs that need the scene
+        scene = max(
+            scene_jobs,
+            key=lambda scene: (
+                sum(len(missing[i]) == 1 for i in scene_jobs[scene]),
+                len(scene_jobs[scene]),
+            ),
+        )
+
+        scene_order.append(scene)
+        for i in scene_jobs.pop(scene):
+            missing[i].discard(scene)
+            if not missing[i]:
+                job_order.append(i)
+
+    return scene_order, job_order
+
+
+def _stream(inventory_df, download_dir, mirror, concurrent, uname, pword):
+
+    try:
+        download_sentinel1(inventory_df, download_dir, mirror, concurrent, uname, pword)
+    finally:
+        try:
+            (Path(download_dir) / STREAMING_FLAG).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def stream_sentinel1(inventory_df, download_dir, mirror, concurrent=2, uname=None, pword=None):
+    """Download Sentinel-1 products in the background
+
+    The products are downloaded in the order of the inventory, while the
+    processing of downloaded products can start. Processing jobs wait for
+    their products with wait_for_download.
+
+    :param inventory_df: OST inventory dataframe in download order
+    :type inventory_df: GeoDataFrame
+    :param download_dir: high-level download directory
+    :type download_dir: Path
+    :param mirror: number of data repository, see download_sentinel1
+    :type mirror: int
+    :param concurrent: number of parallel downloads
+    :type concurrent: int
+    :param uname: username for respective data repository
+    :type uname: str
+    :param pword: password for respective data repository
+    :type pword: str
+    :return: the download process
+    """
+
+    # there is no prompt for the credentials within the background process
+    if not mirror or not uname or not pword:
+        raise ValueError("Streaming download needs the mirror, username and password.")
+
+    process = multiprocessing.Process(
+        target=_stream, args=(inventory_df, download_dir, mirror, concurrent, uname, pword)
+    )
+    process.start()
+
+    with (Path(download_dir) / STREAMING_FLAG).open("w") as file:
+        file.write(str(process.pid))
+
+    return process
+
+
+def wait_for_download(files, download_dir):
+    """Wait until products of a background download are downloaded
+
+    :param files: list of download paths of the products
+    :param download_dir: high-level download directory
+    :type download_dir: Path
+    """
+
+    flag = Path(download_dir) / STREAMING_FLAG
+    while not all(Path(file).with_suffix(".downloaded").exists() for file in files):
+
+        try:
+            pid = int(flag.read_text())
+            os.kill(pid, 0)
+        except (FileNotFoundError, ValueError, ProcessLookupError):
+            # the download stopped, check once more in case it just finished
+            if all(Path(file).with_suffix(".downloaded").exists() for file in files):
+                break
+
+            raise DownloadError(f"Download of {[Path(file).name for file in files]} failed.")
+        except PermissionError:
+            pass
+
+        time.sleep(WAIT_INTERVAL)
@@ -15,13 +15,17 @@ from pathlib import Path
 from godale._concurrent import Executor
 
 from ost import Sentinel1Scene
-from ost.s1 import grd_to_ard
+from ost.s1 import grd_to_ard, download
 from ost.helpers import raster as ras
+from ost.helpers.errors import DownloadError
 from ost.generic import ts_extent
 from ost.generic import ts_ls_mask
 from ost.generic import ard_to_ts
 from ost.generic import timescan
 from ost.generic import mosaic
+from ost.generic import extent_index
+from ost.generic import catalogue
+from ost.generic import ledger
 
 logger = logging.getLogger(__name__)
 
@@ -85,23 +89,115 @@ def create_processed_df(inventory_df, list_of_scenes, outfile, out_ls, error):
     return df
 
 
-def grd_to_ard_batch(inventory_df, config_file):
+def _download_order(inventory_df, download_dir, data_mount):
+    """Order scenes and acquisitions for streamed download and processing
+
+    :param inventory_df: OST inventory dataframe
+    :param download_dir: high-level download directory
+    :param data_mount: directory of a mounted data archive
+    :return: list of scene ids to download, and list of acquisitions
+             as lists of scene ids in processing order
+    """
+
+    acquisitions = list(_create_processing_dict(inventory_df).values())
+    available = {
+        scene
+        for scene in inventory_df["identifier"]
+        if Sentinel1Scene(scene).get_path(download_dir, data_mount)
+    }
+
+    scene_order, job_order = download.download_order(acquisitions, available)
+    return scene_order, [acquisitions[i] for i in job_order]
+
+
+def stream_download(inventory_df, config_file, mirror, concurrent=2, uname=None, pword=None):
+    """Download GRD products in the background in processing order
+
+    Scenes that complete the frames of an acquisition come first, so
+    that a streaming grd_to_ard_batch can start on them right away.
+
+    :param inventory_df: OST inventory dataframe
+    :param config_file: path to the project config file
+    :param mirror: number of data repository, see download_sentinel1
+    :param concurrent: number of parallel downloads
+    :param uname: username for respective data repository
+    :param pword: password for respective data repository
+    :return: the download process
+    """
+
+    with open(config_file, "r") as file:
+        config_dict = json.load(file)
+        download_dir = Path(config_dict["download_dir"])
+        data_mount = Path(config_dict["data_mount"])
+
+    scene_order, _ = _download_order(inventory_df, download_dir, data_mount)
+    download_df = inventory_df.set_index("identifier", drop=False).loc[scene_order]
+
+    return download.stream_sentinel1(download_df, download_dir, mirror, concurrent, uname, pword)
+
+
+def _grd_to_ard_streamed(filelist, config_file):
+    """Wait for the frames of an acquisition before processing it"""
+
+    with open(config_file, "r") as file:
+        download_dir = json.load(file)["download_dir"]
+
+    try:
+        download.wait_for_download(filelist, download_dir)
+    except DownloadError as error:
+        logger.info(error)
+        return filelist, None, None, error
+
+    return grd_to_ard.grd_to_ard(filelist, config_file)
+
+
+def grd_to_ard_batch(inventory_df, config_file, streaming=False):
+    """Batch processing of GRD acquisitions to ARD
+
+    :param inventory_df: OST inventory dataframe
+    :param config_file: path to the project config file
+    :param streaming: the scenes are still being downloaded by
+                      stream_download, and each acquisition is processed
+                      as soon as all its frames are downloaded
+    :return: dataframe with the processing results
+    """
 
     # load relevant config parameters
     with open(config_file, "r") as file:
         config_dict = json.load(file)
         download_dir = Path(config_dict["download_dir"])
         data_mount = Path(config_dict["data_mount"])
+        processing_dir = config_dict["processing_dir"]
 
     # where all frames are grouped into acquisitions
-    processing_dict = _create_processing_dict(inventory_df)
+    if streaming:
+        _, acquisitions = _download_order(inventory_df, download_dir, data_mount)
+    else:
+        acquisitions = _create_processing_dict(inventory_df).values()
+
     processing_df = pd.DataFrame(columns=["identifier", "outfile", "out_ls", "error"])
 
-    iter_list = []
-    for _, list_of_scenes in processing_dict.items():
+    # completed acquisitions of previous runs, from a single query of the job ledger
+    completed = ledger.completed(processing_dir, config_dict["processing"]["single_ARD"])
 
-        # get the paths to the file
-        scene_paths = [Sentinel1Scene(scene).get_path(download_dir, data_mount) for scene in list_of_scenes]
+    iter_list = []
+    for list_of_scenes in acquisitions:
+
+        # get the paths to the file, or where it will be downloaded to
+        scene_paths = []
+        for scene in list_of_scenes:
+            s1scene = Sentinel1Scene(scene)
+            path = s1scene.get_path(download_dir, data_mount)
+            scene_paths.append(path if path or not streaming else s1scene.download_path(download_dir))
+
+        # acquisitions that are completed are not run again
+        task_id = ledger.task_id(processing_dir, grd_to_ard.ard_task(list_of_scenes, processing_dir))
+        outputs = completed.get(task_id)
+        if outputs:
+            logger.debug(f"Acquisition of {list_of_scenes[0]} already processed.")
+            temp_df = create_processed_df(inventory_df, list_of_scenes, outputs[0], outputs[1], None)
+            processing_df = pd.concat([processing_df, temp_df])
+            continue
 
         iter_list.append(scene_paths)
 
@@ -109,7 +205,7 @@ def grd_to_ard_batch(inventory_df, config_file):
     executor = Executor(executor=config_dict["executor_type"], max_workers=config_dict["max_workers"])
 
     for task in executor.as_completed(
-        func=grd_to_ard.grd_to_ard,
+        func=_grd_to_ard_streamed if streaming else grd_to_ard.grd_to_ard,
         iterable=iter_list,
         fargs=(
             [
@@ -120,6 +216,14 @@ def grd_to_ard_batch(inventory_df, config_file):
 
         list_of_scenes, outfile, out_ls, error = task.result()
 
+        # record the failure in the job ledger
+        if error:
+            ledger.fail(processing_dir, [grd_to_ard.ard_task(list_of_scenes, processing_dir)], error)
+
+        # add the acquisition's ARD products to the catalogue
+        if outfile:
+            catalogue.register_dir(processing_dir, Path(outfile).parent)
+
         # return the info of processing as dataframe
         temp_df = create_processed_df(inventory_df, list_of_scenes, outfile, out_ls, error)
 
@@ -142,6 +246,9 @@ def ards_to_timeseries(inventory_df, config_file):
     if ard["create_ls_mask"] or ard_mt["apply_ls_mask"]:
         _create_mt_ls_mask(inventory_df, config_file)
 
+    # add the new extents to the project's extent index
+    extent_index.update_extent_index(config_dict["processing_dir"])
+
     # finally create time-series
     _create_timeseries(inventory_df, config_file)
 
@@ -338,19 +445,16 @@ def _create_timeseries(inventory_df, config_file):
     iter_list = []
     for track in inventory_df.relativeorbit.unique():
 
-        # get the burst directory
-        track_dir = processing_dir / track
-
         for pol in ["VV", "VH", "HH", "HV"]:
 
             # see if there is actually any imagery in thi polarisation
-            list_of_files = sorted(str(file) for file in list(track_dir.glob(f"20*/*data*/*ma0*{pol}*img")))
+            list_of_files = catalogue.glob(processing_dir, f"{track}/20*/*data*/*ma0*{pol}*img")
 
             if len(list_of_files) <= 1:
                 continue
 
             # create list of dims if polarisation is present
-            list_of_dims = sorted(str(dim) for dim in list(track_dir.glob("20*/*bs*dim")))
+            list_of_dims = [str(dim) for dim in catalogue.glob(processing_dir, f"{track}/20*/*bs*dim")]
 
             iter_list.append([list_of_dims, track, "bs", pol])
 
@@ -374,6 +478,11 @@ def _create_timeseries(inventory_df, config_file):
         ),
     ):
         track, list_of_dims, out_files, out_vrt, product, error = task.result()
+
+        # add the time-series layers to the catalogue
+        if isinstance(out_files, list):
+            catalogue.register(processing_dir, out_files)
+
         out_dict["track"].append(track)
         out_dict["list_of_dims"].append(list_of_dims)
         out_dict["out_files"].append(out_files)
@@ -401,6 +510,9 @@ def timeseries_to_timescan(inventory_df, config_file):
 
     dtype_conversion = True if ard_mt["dtype_output"] != "float32" else False
 
+    # parameters the timescans depend on, for the job ledger
+    parameters = [ledger.ard_parameters(ard, "bs"), ard_mt, ard_tscan]
+
     iter_list, vrt_iter_list = [], []
     for track in inventory_df.relativeorbit.unique():
 
@@ -413,7 +525,8 @@ def timeseries_to_timescan(inventory_df, config_file):
         # loop thorugh each polarization
         for polar in ["VV", "VH", "HH", "HV"]:
 
-            if (timescan_dir / f".bs.{polar}.processed").exists():
+            task, legacy = timescan_dir / f"bs.{polar}", timescan_dir / f".bs.{polar}.processed"
+            if ledger.is_done(processing_dir, task, parameters, legacy=legacy):
                 logger.info(f"Timescans for track {track} already processed.")
                 continue
 
@@ -424,7 +537,7 @@ def timeseries_to_timescan(inventory_df, config_file):
                 continue
 
             # create a datelist for harmonics
-            scene_list = list(track_dir.glob(f"Timeseries/*bs.{polar}.tif"))
+            scene_list = catalogue.glob(processing_dir, f"{track}/Timeseries/*bs.{polar}.tif")
 
             # create a datelist for harmonics calculation
             datelist = []
@@ -434,6 +547,9 @@ def timeseries_to_timescan(inventory_df, config_file):
             # define timescan prefix
             timescan_prefix = timescan_dir / f"bs.{polar}"
 
+            # record the start of the task in the job ledger
+            ledger.start(processing_dir, task, [time_series], parameters)
+
             iter_list.append(
                 [
                     time_series,
@@ -455,6 +571,16 @@ def timeseries_to_timescan(inventory_df, config_file):
     out_dict = {"track": [], "prefix": [], "metrics": [], "error": []}
     for task in executor.as_completed(func=timescan.gd_mt_metrics, iterable=iter_list):
         burst, prefix, metrics, error = task.result()
+
+        # add the timescan layers to the catalogue, and record the task
+        # in the job ledger
+        if not error:
+            out_files = [processing_dir / burst / "Timescan" / f"{prefix}.{metric}.tif" for metric in metrics]
+            catalogue.register(processing_dir, out_files)
+            ledger.finish(processing_dir, processing_dir / burst / "Timescan" / prefix, out_files)
+        else:
+            ledger.fail(processing_dir, [processing_dir / burst / "Timescan" / prefix], error)
+
         out_dict["track"].append(burst)
         out_dict["prefix"].append(prefix)
         out_dict["metrics"].append(metrics)
@@ -488,6 +614,7 @@ def mosaic_timeseries(inventory_df, config_file):
     with open(config_file, "r") as ard_file:
         config_dict = json.load(ard_file)
         processing_dir = Path(config_dict["processing_dir"])
+        suffix = ".vrt" if config_dict["processing"]["mosaic"].get("virtual", False) else ".tif"
 
     # create output folder
     ts_dir = processing_dir / "Mosaic" / "Timeseries"
@@ -498,7 +625,7 @@ def mosaic_timeseries(inventory_df, config_file):
     for p in ["VV", "VH", "HH", "HV"]:
 
         tracks = inventory_df.relativeorbit.unique()
-        nr_of_ts = len(list((processing_dir / f"{tracks[0]}" / "Timeseries").glob(f"*.{p}.tif")))
+        nr_of_ts = len(catalogue.glob(processing_dir, f"{tracks[0]}/Timeseries/*.{p}.tif"))
 
         if not nr_of_ts >= 1:
             continue
@@ -506,7 +633,7 @@ def mosaic_timeseries(inventory_df, config_file):
         outfiles = []
         for i in range(1, nr_of_ts + 1):
 
-            filelist = list(processing_dir.glob(f"*/Timeseries/{i:02d}.*.{p}.tif"))
+            filelist = catalogue.glob(processing_dir, f"*/Timeseries/{i:02d}.*.{p}.tif")
             filelist = [str(file) for file in filelist if "Mosaic" not in str(file)]
 
             # create
@@ -518,15 +645,13 @@ def mosaic_timeseries(inventory_df, config_file):
             start, end = sorted(datelist)[0], sorted(datelist)[-1]
 
             if start == end:
-                outfile = ts_dir / f"{i:02d}.{start}.bs.{p}.tif"
+                outfile = ts_dir / f"{i:02d}.{start}.bs.{p}{suffix}"
             else:
-                outfile = ts_dir / f"{i:02d}.{start}-{end}.bs.{p}.tif"
-
-            check_file = outfile.parent / f".{outfile.stem}.processed"
+                outfile = ts_dir / f"{i:02d}.{start}-{end}.bs.{p}{suffix}"
 
             outfiles.append(outfile)
 
-            if check_file.exists():
+            if mosaic.is_processed(outfile, config_dict):
                 logger.info(f"Mosaic layer {outfile.name} already processed.")
                 continue
 
@@ -554,6 +679,7 @@ def mosaic_timescan(config_file):
         config_dict = json.load(ard_file)
         processing_dir = Path(config_dict["processing_dir"])
         metrics = config_dict["processing"]["time-scan_ARD"]["metrics"]
+        suffix = ".vrt" if config_dict["processing"]["mosaic"].get("virtual", False) else ".tif"
 
     if "harmonics" in metrics:
         metrics.remove("harmonics")
@@ -572,7 +698,7 @@ def mosaic_timescan(config_file):
     for polar, metric in itertools.product(["VV", "HH", "VH", "HV"], metrics):
 
         # create a list of files based on polarisation and metric
-        filelist = list(processing_dir.glob(f"*/Timescan/*bs.{polar}.{metric}.tif"))
+        filelist = catalogue.glob(processing_dir, f"*/Timescan/*bs.{polar}.{metric}.tif")
 
         # break loop if there are no files
         if not len(filelist) >= 2:
@@ -580,10 +706,9 @@ def mosaic_timescan(config_file):
 
         # get number
         filelist = " ".join([str(file) for file in filelist])
-        outfile = tscan_dir / f"bs.{polar}.{metric}.tif"
-        check_file = outfile.parent / f".{outfile.stem}.processed"
+        outfile = tscan_dir / f"bs.{polar}.{metric}{suffix}"
 
-        if check_file.exists():
+        if mosaic.is_processed(outfile, config_dict):
             logger.info(f"Mosaic layer {outfile.name} already processed.")
             continue
 
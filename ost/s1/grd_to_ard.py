@@ -2,21 +2,109 @@
 # -*- coding: utf-8 -*-
 
 import json
+import shutil
 import logging
+import zipfile
 import rasterio
 
-# import zipfile
 import numpy as np
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from contextlib import ExitStack
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
-from ost.generic import common_wrappers as common
-from ost.helpers import helpers as h, raster as ras
+from shapely import affinity
+from shapely.ops import unary_union
+from shapely.wkt import loads
+
+from ost.generic import common_wrappers as common, ledger
+from ost.helpers import helpers as h, raster as ras, staging
+from ost.helpers.checkpoint import Checkpoints, CHECKPOINT_DIR
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
-from ost.s1 import grd_wrappers as grd
+from ost.s1 import grd_wrappers as grd, safe_cache
 
 logger = logging.getLogger(__name__)
 
+# safety buffer around the AOI for the subset at import, and share of the
+# frames' footprint above which the frames are not subset at all
+SUBSET_BUFFER = 0.05
+MAX_COVERAGE = 0.8
+
+# distance from the swath edges within which a subset is affected by
+# border noise, in degrees
+EDGE_DISTANCE = 0.1
+
+
+def _import_region(filelist, aoi):
+    """Get the region to which the frames of an acquisition are subset at import
+
+    Frames outside of the buffered AOI are dropped, as long as the remaining
+    frames are consecutive. For subsets, border noise is only expected at the
+    swath edges the region reaches to. Sentinel-1 is right-looking, so that
+    near range is to the west for ascending and to the east for descending
+    passes.
+
+    :param filelist: list of the GRD frames of one acquisition
+    :param aoi: the AOI as WKT, or None
+    :return: list of frames, the region as WKT or None if the frames are not
+             subset, and whether border noise is expected at near and far range
+    """
+
+    from ost.s1.s1scene import Sentinel1Scene
+
+    if not aoi:
+        return filelist, None, (True, True)
+
+    # consecutive frames by their start time
+    frames = sorted(filelist, key=lambda file: Path(file).stem[17:32])
+    try:
+        footprints, directions = zip(
+            *[Sentinel1Scene(Path(file).stem).get_footprint(file) for file in frames]
+        )
+    except (RuntimeError, ValueError, KeyError, OSError, zipfile.BadZipFile) as error:
+        logger.info(f"Could not read the footprints, frames are not subset ({error}).")
+        return filelist, None, (True, True)
+
+    buffered = loads(aoi).buffer(SUBSET_BUFFER, join_style=2)
+    covering = [i for i, footprint in enumerate(footprints) if footprint.intersects(buffered)]
+    if not covering:
+        return filelist, None, (True, True)
+
+    first, last = covering[0], covering[-1] + 1
+    frames = frames[first:last]
+    footprint = unary_union(footprints[first:last])
+    region = footprint.intersection(buffered)
+
+    if len(frames) < len(filelist):
+        logger.info(f"Dropping {len(filelist) - len(frames)} frame(s) outside of the AOI.")
+
+    if region.area > MAX_COVERAGE * footprint.area:
+        return frames, None, (True, True)
+
+    # strips along the western and eastern edge of the swath
+    west = footprint.difference(affinity.translate(footprint, xoff=EDGE_DISTANCE))
+    east = footprint.difference(affinity.translate(footprint, xoff=-EDGE_DISTANCE))
+    edges = region.intersects(west), region.intersects(east)
+
+    if directions[0] == "DESCENDING":
+        edges = edges[::-1]
+
+    return frames, region.wkt, edges
+
+
+def ard_task(filelist, processing_dir):
+    """Get the task of an acquisition within the job ledger
+
+    :param filelist: list of absolute paths to the GRD scene(s) of the acquisition
+    :param processing_dir: the project's processing directory
+    :return: path of the task
+    """
+
+    from ost.s1.s1scene import Sentinel1Scene
+
+    first = Sentinel1Scene(Path(filelist[0]).stem)
+    return Path(processing_dir) / f"{first.rel_orbit}/{first.start_date}" / "bs"
+
 
 def grd_to_ard(filelist, config_file):
     """Main function for the grd to ard generation
@@ -43,7 +131,6 @@ def grd_to_ard(filelist, config_file):
         config_dict = json.load(file)
         ard = config_dict["processing"]["single_ARD"]
         processing_dir = Path(config_dict["processing_dir"])
-        subset = config_dict["subset"]
 
     # ----------------------------------------------------
     # 2 define final destination dir/file and ls mask
@@ -66,7 +153,12 @@ def grd_to_ard(filelist, config_file):
 
     # ----------------------------------------------------
     # 3 check if already processed
-    if (out_dir / ".processed").exists() and out_final.with_suffix(suf).exists():
+    task = ard_task(filelist, processing_dir)
+    parameters = ledger.ard_parameters(ard, task)
+    if (
+        ledger.is_done(processing_dir, task, parameters, legacy=out_dir / ".processed")
+        and out_final.with_suffix(suf).exists()
+    ):
         logger.info(f"Acquisition from {acquisition_date} of track {track} " f"already processed")
 
         if out_ls_mask.with_suffix(suf).exists():
@@ -76,6 +168,9 @@ def grd_to_ard(filelist, config_file):
 
         return filelist, out_final.with_suffix(suf), out_ls, None
 
+    # record the start of the task in the job ledger
+    ledger.start(processing_dir, task, filelist, parameters)
+
     # ----------------------------------------------------
     # 4 run the processing routine
 
@@ -86,296 +181,390 @@ def grd_to_ard(filelist, config_file):
     else:
         temp_dir = config_dict["temp_dir"]
 
-    with TemporaryDirectory(prefix=f"{temp_dir}/") as temp:
+    # subset at import to the AOI, if it covers only part of the frames
+    frames, region, edges = _import_region(filelist, config_dict.get("aoi"))
+    subset = region is not None
+    if subset:
+        config_dict.update(subset=True, aoi=region)
+    else:
+        config_dict.update(subset=False)
 
-        # convert temp directory to Path object
-        temp = Path(temp)
+    # the whole chain runs in a single processing graph, unless the
+    # border noise removal needs the imported product on disk
+    # (configurations without the fused_graph key keep the step-wise chain)
+    fused = ard.get("fused_graph", False)
+    remove_border = ard["remove_border_noise"] and any(edges)
+    import_first = not fused or remove_border
 
-        # ---------------------------------------------------------------------
-        # 4.1 Import
-        # slice assembly if more than one scene
-        if len(filelist) > 1:
+    input_size = sum(h.product_size(file) for file in frames)
+    with ExitStack() as stack:
 
-            # if more than one frame import all files
-            for file in filelist:
+        # temp directory as Path object
+        temp = Path(stack.enter_context(staging.staging_dir(config_dict, input_size, "grd_to_ard", temp_dir)))
 
-                # unzip for faster import?
-                # unpack = None
-                # if Path(file).suffix == ".zip":
-                #    with zipfile.ZipFile(file, "r") as zip_ref:
-                #        zip_ref.extractall(temp)
+        # intermediate products are written to the staged directory, and the
+        # last one is kept until the final product is in place, so that a
+        # rerun resumes from the last finished step
+        checkpoints = Checkpoints(Path(temp_dir) / CHECKPOINT_DIR / file_id, filelist, work_dir=temp)
+        stack.callback(checkpoints.persist)
 
-                #    file = temp / f"{file.stem}.SAFE"
-                #    unpack = True
+        # extract the needed parts of zipped scenes
+        scenes = stack.enter_context(safe_cache.extracted(frames, config_dict, temp_dir=temp_dir))
 
-                # create namespace for temporary imported product
-                grd_import = temp / f"{file.stem}_imported"
+        if import_first:
+
+            # create namespace for imported product
+            grd_import = checkpoints.step(
+                "import", frames=len(frames), aoi=region, remove_border_noise=remove_border and edges
+            )
+
+        if import_first and not checkpoints.reached(grd_import):
+            # -----------------------------------------------------------------
+            # 4.1 Import
+            # slice assembly if more than one scene
+            if len(frames) > 1:
+
+                # import all frames concurrently, sharing the cpus of the job
+                workers = max(min(len(frames), config_dict["snap_cpu_parallelism"]), 1)
+
+                # SNAP's slice assembly needs the full frames, so the subset
+                # is only applied after it. Frames outside of the buffered AOI
+                # are dropped already, and if a single frame remains, it is
+                # subset at import. The concurrent imports count as workers
+                # for the memory budget.
+                frame_config = dict(
+                    config_dict,
+                    subset=False,
+                    snap_cpu_parallelism=max(config_dict["snap_cpu_parallelism"] // workers, 1),
+                    max_workers=config_dict.get("max_workers", 1) * workers,
+                )
+
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    tasks = [
+                        executor.submit(
+                            grd.grd_frame_import,
+                            scene,
+                            # create namespace for temporary imported frame
+                            temp / f"{file.stem}_imported",
+                            # create namespace for import log
+                            out_dir / f"{file.stem}.Import.errLog",
+                            frame_config,
+                        )
+                        for file, scene in zip(frames, scenes)
+                    ]
+
+                # slice assembly only starts once all frames are imported
+                for task in tasks:
+                    try:
+                        task.result()
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
+
+                # create list of scenes for full acquisition in
+                # preparation of slice assembly
+                scenelist = " ".join([str(file) for file in list(temp.glob("*imported.dim"))])
+
+                # create namespace for slice assembled import product,
+                # which is temporary in subset mode
+                assembled = temp / f"{file_id}_imported" if subset else grd_import
+
+                # create namespace for slice assembled log
+                logfile = out_dir / f"{file_id}._slice_assembly.errLog"
+
+                # run slice assembly
+                try:
+                    grd.slice_assembly(scenelist, assembled, logfile, config_dict)
+                except (GPTRuntimeError, NotValidFileError) as error:
+                    logger.info(error)
+                    return filelist, None, None, error
+
+                # delete imported frames
+                for file in frames:
+                    h.delete_dimap(temp / f"{file.stem}_imported")
+
+                # subset mode after slice assembly
+                if subset:
+
+                    # create namespace for subset log
+                    logfile = out_dir / f"{file_id}._slice_assembly.errLog"
+
+                    # run subset routine
+                    try:
+                        grd.grd_subset_georegion(
+                            assembled.with_suffix(".dim"), grd_import, logfile, config_dict
+                        )
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
+
+                    # delete slice assembly input to subset
+                    h.delete_dimap(assembled)
+
+            # single scene case
+            else:
+
+                file = scenes[0]
 
                 # create namespace for import log
-                logfile = out_dir / f"{file.stem}.Import.errLog"
+                logfile = out_dir / f"{file_id}.Import.errLog"
 
-                # set subset temporally to false for import routine
-                config_dict["subset"] = False
-                # frame import
+                # run frame import
                 try:
                     grd.grd_frame_import(file, grd_import, logfile, config_dict)
                 except (GPTRuntimeError, NotValidFileError) as error:
                     logger.info(error)
                     return filelist, None, None, error
 
-                config_dict["subset"] = subset
+            # -----------------------------------------------------------------
+            # 4.2 GRD Border Noise
+            if remove_border:
 
-                # if unpack:
-                #     h.remove_folder_content(file)
-                #     file.rmdir()
+                # get input files of all polarisations
+                files = [
+                    file
+                    for polarisation in ["VV", "VH", "HH", "HV"]
+                    for file in grd_import.with_suffix(".data").glob(f"Intensity_{polarisation}.img")
+                ]
 
-            # create list of scenes for full acquisition in
-            # preparation of slice assembly
-            scenelist = " ".join([str(file) for file in list(temp.glob("*imported.dim"))])
+                # remove border noise of all polarisations concurrently
+                remove = partial(grd.grd_remove_border, near_range=edges[0], far_range=edges[1])
+                with ThreadPoolExecutor(max_workers=max(len(files), 1)) as executor:
+                    list(executor.map(remove, files))
 
-            # create namespace for temporary slice assembled import product
-            grd_import = temp / f"{file_id}_imported"
+            checkpoints.commit(grd_import)
 
-            # create namespace for slice assembled log
-            logfile = out_dir / f"{file_id}._slice_assembly.errLog"
+        # set input for next step
+        if import_first:
+            infile = grd_import.with_suffix(".dim")
 
-            # run slice assembly
-            try:
-                grd.slice_assembly(scenelist, grd_import, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+        # set to none for final return statement
+        out_ls = out_ls_mask.with_suffix(".dim") if ard["create_ls_mask"] is True else None
 
-            # delete imported frames
-            for file in filelist:
-                h.delete_dimap(temp / f"{file.stem}_imported")
+        if fused:
 
-            # subset mode after slice assembly
-            if subset:
+            # -----------------------------------------------------------------
+            # 4.3 Fused processing from import/calibration to geocoding
 
-                # create namespace for temporary subset product
-                grd_subset = temp / f"{file_id}_imported_subset"
+            # create namespace for geocoded product and ls mask
+            ls_mask = checkpoints.branch("ls_mask", frames=len(frames), aoi=region, **ard)
+            geocoded = checkpoints.step("bs", frames=len(frames), aoi=region, **ard)
 
-                # create namespace for subset log
-                logfile = out_dir / f"{file_id}._slice_assembly.errLog"
+            if not checkpoints.reached(geocoded):
+
+                # create namespace for processing log
+                logfile = out_dir / f"{file_id}_bs.errLog"
 
-                # run subset routine
+                # run the processing graph
                 try:
-                    grd.grd_subset_georegion(grd_import.with_suffix(".dim"), grd_subset, logfile, config_dict)
+                    grd.fused_ard(
+                        [infile] if import_first else scenes,
+                        geocoded,
+                        ls_mask,
+                        logfile,
+                        config_dict,
+                        imported=import_first,
+                    )
                 except (GPTRuntimeError, NotValidFileError) as error:
                     logger.info(error)
                     return filelist, None, None, error
 
-                # delete slice assembly input to subset
-                h.delete_dimap(grd_import)
+                # polygonize ls mask
+                if ard["create_ls_mask"] is True:
+                    ls_raster = list(ls_mask.with_suffix(".data").glob("*img"))[0]
+                    ras.polygonize_ls(ls_raster, ls_mask.with_suffix(".json"))
+                    checkpoints.commit(ls_mask)
+
+                checkpoints.commit(geocoded)
 
-                # set subset to import for subsequent functions
-                grd_import = grd_subset
+                # delete imported input
+                if import_first:
+                    h.delete_dimap(infile.with_suffix(""))
 
-        # single scene case
         else:
+            # -----------------------------------------------------------------
+            # 4.3 Calibration
 
-            file = filelist[0]
+            # create namespace for calibrated product
+            calibrated = checkpoints.step("cal", product_type=ard["product_type"])
 
-            # unzip for faster import
-            # unpack = None
-            # if Path(file).suffix == ".zip":
-            #     with zipfile.ZipFile(file, "r") as zip_ref:
-            #         zip_ref.extractall(temp)
+            if not checkpoints.reached(calibrated):
 
-            #    file = temp / f"{file.stem}.SAFE"
-            #    unpack = True
+                # create namespace for calibration log
+                logfile = out_dir / f"{file_id}.calibration.errLog"
 
-            # create namespace for temporary imported product
-            grd_import = temp / f"{file_id}_imported"
+                # run calibration
+                try:
+                    grd.calibration(infile, calibrated, logfile, config_dict)
+                except (GPTRuntimeError, NotValidFileError) as error:
+                    logger.info(error)
+                    return filelist, None, None, error
 
-            # create namespace for import log
-            logfile = out_dir / f"{file_id}.Import.errLog"
+                checkpoints.commit(calibrated)
 
-            # run frame import
-            try:
-                grd.grd_frame_import(file, grd_import, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+                # delete input
+                h.delete_dimap(infile.with_suffix(""))
 
-            # if unpack:
-            #     h.remove_folder_content(file)
-            #     file.rmdir()
+            # input for next step
+            infile = calibrated.with_suffix(".dim")
 
-        # set input for next step
-        infile = grd_import.with_suffix(".dim")
+            # -----------------------------------------------------------------
+            # 4.4 Multi-looking
+            if int(ard["resolution"]) >= 20:
 
-        # ---------------------------------------------------------------------
-        # 4.2 GRD Border Noise
-        if ard["remove_border_noise"] and not subset:
+                # create namespace for multi-looked product
+                multi_looked = checkpoints.step("ml", resolution=ard["resolution"])
 
-            # loop through possible polarisations
-            for polarisation in ["VV", "VH", "HH", "HV"]:
+                if not checkpoints.reached(multi_looked):
 
-                # get input file
-                file = list(temp.glob(f"{file_id}_imported*data/Intensity_{polarisation}.img"))
+                    # create namespace for multi-loook log
+                    logfile = out_dir / f"{file_id}.multilook.errLog"
 
-                # remove border noise
-                if len(file) == 1:
-                    # run grd Border Remove
-                    grd.grd_remove_border(file[0])
+                    # run multi-looking
+                    try:
+                        grd.multi_look(infile, multi_looked, logfile, config_dict)
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
 
-        # ---------------------------------------------------------------------
-        # 4.3 Calibration
+                    checkpoints.commit(multi_looked)
 
-        # create namespace for temporary calibrated product
-        calibrated = temp / f"{file_id}_cal"
+                    # delete input
+                    h.delete_dimap(infile.with_suffix(""))
 
-        # create namespace for calibration log
-        logfile = out_dir / f"{file_id}.calibration.errLog"
+                # define input for next step
+                infile = multi_looked.with_suffix(".dim")
 
-        # run calibration
-        try:
-            grd.calibration(infile, calibrated, logfile, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
-            logger.info(error)
-            return filelist, None, None, error
+            # -----------------------------------------------------------------
+            # 4.5 Layover shadow mask
+            if ard["create_ls_mask"] is True:
 
-        # delete input
-        h.delete_dimap(infile.with_suffix(""))
+                # create namespace for ls mask product
+                ls_mask = checkpoints.branch("ls_mask", dem=ard["dem"], resolution=ard["resolution"])
 
-        # input for next step
-        infile = calibrated.with_suffix(".dim")
+                if not checkpoints.reached(ls_mask):
 
-        # ---------------------------------------------------------------------
-        # 4.4 Multi-looking
-        if int(ard["resolution"]) >= 20:
+                    # create namespace for ls mask log
+                    logfile = out_dir / f"{file_id}.ls_mask.errLog"
 
-            # create namespace for temporary multi-looked product
-            multi_looked = temp / f"{file_id}_ml"
+                    # run ls mask routine
+                    try:
+                        common.ls_mask(infile, ls_mask, logfile, config_dict)
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
 
-            # create namespace for multi-loook log
-            logfile = out_dir / f"{file_id}.multilook.errLog"
+                    # polygonize
+                    ls_raster = list(ls_mask.with_suffix(".data").glob("*img"))[0]
+                    ras.polygonize_ls(ls_raster, ls_mask.with_suffix(".json"))
 
-            # run multi-looking
-            try:
-                grd.multi_look(infile, multi_looked, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+                    checkpoints.commit(ls_mask)
 
-            # delete input
-            h.delete_dimap(infile.with_suffix(""))
+            # -----------------------------------------------------------------
+            # 4.6 Speckle filtering
+            if ard["remove_speckle"]:
 
-            # define input for next step
-            infile = multi_looked.with_suffix(".dim")
+                # create namespace for speckle filtered product
+                filtered = checkpoints.step("spk", **ard["speckle_filter"])
 
-        # ---------------------------------------------------------------------
-        # 4.5 Layover shadow mask
-        out_ls = None  # set to none for final return statement
-        if ard["create_ls_mask"] is True:
+                if not checkpoints.reached(filtered):
 
-            # create namespace for temporary ls mask product
-            ls_mask = temp / f"{file_id}_ls_mask"
+                    # create namespace for speckle filter log
+                    logfile = out_dir / f"{file_id}.Speckle.errLog"
 
-            # create namespace for ls mask log
-            logfile = out_dir / f"{file_id}.ls_mask.errLog"
+                    # run speckle filter
+                    try:
+                        common.speckle_filter(infile, filtered, logfile, config_dict)
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
 
-            # run ls mask routine
-            try:
-                common.ls_mask(infile, ls_mask, logfile, config_dict)
-                out_ls = out_ls_mask.with_suffix(".dim")
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+                    checkpoints.commit(filtered)
 
-            # polygonize
-            ls_raster = list(ls_mask.with_suffix(".data").glob("*img"))[0]
-            ras.polygonize_ls(ls_raster, ls_mask.with_suffix(".json"))
+                    # delete input
+                    h.delete_dimap(infile.with_suffix(""))
 
-        # ---------------------------------------------------------------------
-        # 4.6 Speckle filtering
-        if ard["remove_speckle"]:
+                # define input for next step
+                infile = filtered.with_suffix(".dim")
 
-            # create namespace for temporary speckle filtered product
-            filtered = temp / f"{file_id}_spk"
+            # -----------------------------------------------------------------
+            # 4.7 Terrain flattening
+            if ard["product_type"] == "RTC-gamma0":
 
-            # create namespace for speckle filter log
-            logfile = out_dir / f"{file_id}.Speckle.errLog"
+                # create namespace for terrain flattened product
+                flattened = checkpoints.step("flat", dem=ard["dem"])
 
-            # run speckle filter
-            try:
-                common.speckle_filter(infile, filtered, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+                if not checkpoints.reached(flattened):
 
-            # delete input
-            h.delete_dimap(infile.with_suffix(""))
+                    # create namespace for terrain flattening log
+                    logfile = out_dir / f"{file_id}.tf.errLog"
 
-            # define input for next step
-            infile = filtered.with_suffix(".dim")
+                    # run terrain flattening
+                    try:
+                        common.terrain_flattening(infile, flattened, logfile, config_dict)
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
 
-        # ---------------------------------------------------------------------
-        # 4.7 Terrain flattening
-        if ard["product_type"] == "RTC-gamma0":
+                    checkpoints.commit(flattened)
 
-            # create namespace for temporary terrain flattened product
-            flattened = temp / f"{file_id}_flat"
+                    # delete input file
+                    h.delete_dimap(infile.with_suffix(""))
 
-            # create namespace for terrain flattening log
-            logfile = out_dir / f"{file_id}.tf.errLog"
+                # define input for next step
+                infile = flattened.with_suffix(".dim")
 
-            # run terrain flattening
-            try:
-                common.terrain_flattening(infile, flattened, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+            # -----------------------------------------------------------------
+            # 4.8 Linear to db
+            if ard["to_db"]:
 
-            # delete input file
-            h.delete_dimap(infile.with_suffix(""))
+                # create namespace for db scaled product
+                db_scaled = checkpoints.step("db")
 
-            # define input for next step
-            infile = flattened.with_suffix(".dim")
+                if not checkpoints.reached(db_scaled):
 
-        # ---------------------------------------------------------------------
-        # 4.8 Linear to db
-        if ard["to_db"]:
+                    # create namespace for db scaled log
+                    logfile = out_dir / f"{file_id}.db.errLog"
 
-            # create namespace for temporary db scaled product
-            db_scaled = temp / f"{file_id}_db"
+                    # run db scaling routine
+                    try:
+                        common.linear_to_db(infile, db_scaled, logfile, config_dict)
+                    except (GPTRuntimeError, NotValidFileError) as error:
+                        logger.info(error)
+                        return filelist, None, None, error
 
-            # create namespace for db scaled log
-            logfile = out_dir / f"{file_id}.db.errLog"
+                    checkpoints.commit(db_scaled)
 
-            # run db scaling routine
-            try:
-                common.linear_to_db(infile, db_scaled, logfile, config_dict)
-            except (GPTRuntimeError, NotValidFileError) as error:
-                logger.info(error)
-                return filelist, None, None, error
+                    # delete input file
+                    h.delete_dimap(infile.with_suffix(""))
 
-            # delete input file
-            h.delete_dimap(infile.with_suffix(""))
+                # set input for next step
+                infile = db_scaled.with_suffix(".dim")
 
-            # set input for next step
-            infile = db_scaled.with_suffix(".dim")
+            # -----------------------------------------------------------------
+            # 4.9 Geocoding
 
-        # ---------------------------------------------------------------------
-        # 4.9 Geocoding
+            # create namespace for geocoded product
+            geocoded = checkpoints.step(
+                "bs", dem=ard["dem"], resolution=ard["resolution"], geocoding=ard["geocoding"]
+            )
 
-        # create namespace for temporary geocoded product
-        geocoded = temp / f"{file_id}_bs"
+            if not checkpoints.reached(geocoded):
 
-        # create namespace for geocoding log
-        logfile = out_dir / f"{file_id}_bs.errLog"
+                # create namespace for geocoding log
+                logfile = out_dir / f"{file_id}_bs.errLog"
 
-        # run geocoding
-        try:
-            common.terrain_correction(infile, geocoded, logfile, config_dict)
-        except (GPTRuntimeError, NotValidFileError) as error:
-            logger.info(error)
-            return filelist, None, None, error
+                # run geocoding
+                try:
+                    common.terrain_correction(infile, geocoded, logfile, config_dict)
+                except (GPTRuntimeError, NotValidFileError) as error:
+                    logger.info(error)
+                    return filelist, None, None, error
 
-        # delete input file
-        h.delete_dimap(infile.with_suffix(""))
+                checkpoints.commit(geocoded)
+
+                # delete input file
+                h.delete_dimap(infile.with_suffix(""))
 
         # define final destination
         out_final = out_dir / f"{file_id}_bs"
@@ -387,8 +576,9 @@ def grd_to_ard(filelist, config_file):
         # ---------------------------------------------------------------------
         # 4.11 Copy LS Mask vector to data dir
         if ard["create_ls_mask"] is True:
-            ls_mask.with_suffix(".json").rename(
-                geocoded.with_suffix(".data").joinpath(ls_mask.name).with_suffix(".json")
+            shutil.copy(
+                ls_mask.with_suffix(".json"),
+                geocoded.with_suffix(".data").joinpath(ls_mask.name).with_suffix(".json"),
             )
 
         # ---------------------------------------------------------------------
@@ -396,9 +586,22 @@ def grd_to_ard(filelist, config_file):
         h.move_dimap(geocoded, out_final, ard["to_tif"])
 
     # ---------------------------------------------------------------------
-    # 5 write processed file to keep track of files already processed
-    with (out_dir / ".processed").open("w") as file:
-        file.write("passed all tests \n")
+    # 4.13 Check the final product and evict the checkpoints
+    if ard["to_tif"]:
+        return_code = h.check_out_tiff(out_final.with_suffix(".tif"))
+    else:
+        return_code = h.check_out_dimap(out_final)
+
+    if return_code != 0:
+        error = NotValidFileError(f"Product did not pass file check: {return_code}")
+        logger.info(error)
+        return filelist, None, None, error
+
+    checkpoints.evict()
+
+    # ---------------------------------------------------------------------
+    # 5 record the task as done in the job ledger
+    ledger.finish(processing_dir, task, [out_final.with_suffix(".dim"), out_ls])
 
     return filelist, out_final.with_suffix(".dim"), out_ls, None
 
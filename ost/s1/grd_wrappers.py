@@ -5,15 +5,21 @@ import numpy as np
 import logging
 from retrying import retry
 from pathlib import Path
-from osgeo import gdal
 
-from ost.helpers import helpers as h
+from ost.helpers import helpers as h, envi, gpt_profile, snap_graph
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
 from ost.helpers.settings import GPT_FILE, OST_ROOT
 
 
 logger = logging.getLogger(__name__)
 
+# number of outer columns checked for border noise, column mean
+# below which a column is considered noise, and margin of columns
+# that are set to 0 in addition
+BORDER_WIDTH = 3000
+BORDER_THRESHOLD = 100
+BORDER_MARGIN = 200
+
 
 @retry(stop_max_attempt_number=3, wait_fixed=1)
 def grd_frame_import(infile, outfile, logfile, config_dict):
@@ -74,7 +80,7 @@ def grd_frame_import(infile, outfile, logfile, config_dict):
         )
 
     # run command
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -135,7 +141,7 @@ def slice_assembly(filelist, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -187,7 +193,7 @@ def grd_subset_georegion(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -206,7 +212,7 @@ def grd_subset_georegion(infile, outfile, logfile, config_dict):
 
 
 @retry(stop_max_attempt_number=3, wait_fixed=1)
-def grd_remove_border(infile):
+def grd_remove_border(infile, near_range=True, far_range=True):
     """OST function to remove GRD border noise from Sentinel-1 data
 
 
@@ -218,69 +224,56 @@ def grd_remove_border(infile):
     ENVI style file inside the *data folder.
 
     The routine checks the outer 3000 columns for its mean value.
-    If the mean value is below 100, all values will be set to 0,
-    otherwise the routine will continue fpr another 150 columns setting
-    the value to 0. All further columns towards the inner image are
-    considered valid.
+    All columns from the image edge up to the first column with a mean
+    value above 100 are set to 0, together with a margin of another 200
+    columns. All further columns towards the inner image are considered
+    valid.
+
+    For subsets of a frame, only the sides at the swath edge are cleaned.
+    Near range is at the first columns of GRD products.
 
     :param infile:
+    :param near_range: whether to remove the border noise at near range
+    :param far_range: whether to remove the border noise at far range
     :return:
     """
 
     logger.debug(f"Removing the GRD Border Noise for {infile.name}.")
     currtime = time.time()
 
-    # read raster file and get number of columns adn rows
-    raster = gdal.Open(str(infile), gdal.GA_Update)
-    cols = raster.RasterXSize
-    rows = raster.RasterYSize
-
-    # create 3000xrows array for the left part of the image
-    array_left = np.array(raster.GetRasterBand(1).ReadAsArray(0, 0, 3000, rows))
-
-    cols_left = 3000
-    for x in range(3000):
-        # if mean value of column is below 100, fil with 0s
-        if np.mean(array_left[:, x]) <= 100:
-            array_left[:, x].fill(0)
-        else:
-            z = x + 200
-            if z > 3000:
-                z = 3000
-            for cols_left in range(x, z, 1):
-                array_left[:, cols_left].fill(0)
-
-            break
-
-    # write array_left to disk
-    logger.debug(f"Number of colums set to 0 on the left side: {cols_left}.")
-
-    raster.GetRasterBand(1).WriteArray(array_left[:, :+cols_left], 0, 0)
-    del array_left
-
-    # create 2d array for the right part of the image (3000 columns and rows)
-    cols_last = cols - 3000
-    array_right = np.array(raster.GetRasterBand(1).ReadAsArray(cols_last, 0, 3000, rows))
-
-    # loop through the array_right columns in opposite direction
-    cols_right = 3000
-    for x in range(2999, 0, -1):
-
-        if np.mean(array_right[:, x]) <= 100:
-            array_right[:, x].fill(0)
-        else:
-            z = x - 200
-            if z < 0:
-                z = 0
-            for cols_right in range(x, z, -1):
-                array_right[:, cols_right].fill(0)
-
-            break
-
-    col_right_start = cols - 3000 + cols_right
-    logger.debug(f"Number of columns set to 0 on the right side: {3000 - cols_right}.")
-    logger.debug(f"Amount of columns kept: {col_right_start}.")
-    raster.GetRasterBand(1).WriteArray(array_right[:, cols_right:], col_right_start, 0)
+    # map the ENVI image and get number of columns and rows
+    raster = envi.open_band(infile, mode="r+")
+    rows, cols = raster.shape
+    width = min(BORDER_WIDTH, cols)
+
+    # mean of all columns of both outer strips in a single reduction,
+    # with the right strip flipped, so both are ordered from the edge inwards
+    means = np.stack(
+        [
+            raster[:, :width].mean(axis=0, dtype="float64"),
+            raster[:, -width:].mean(axis=0, dtype="float64")[::-1],
+        ]
+    )
+
+    # first valid column from the edge, plus a margin, or the whole strip
+    valid = means > BORDER_THRESHOLD
+    cut_left, cut_right = np.where(
+        valid.any(axis=1), np.minimum(valid.argmax(axis=1) + BORDER_MARGIN, width), width
+    )
+
+    # sides within the swath are kept as they are
+    cut_left, cut_right = cut_left * near_range, cut_right * far_range
+
+    logger.debug(f"Number of colums set to 0 on the left side: {cut_left}.")
+    logger.debug(f"Number of columns set to 0 on the right side: {cut_right}.")
+    logger.debug(f"Amount of columns kept: {cols - cut_left - cut_right}.")
+
+    # only the zeroed strips are written
+    first_right = cols - cut_right
+    raster[:, :cut_left] = 0
+    raster[:, first_right:] = 0
+    raster.flush()
+    del raster
 
     logger.debug(h.timer(currtime))
 
@@ -324,7 +317,7 @@ def calibration(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -368,7 +361,7 @@ def multi_look(infile, outfile, logfile, config_dict):
     )
 
     # run command and get return code
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     # handle errors and logs
     if return_code == 0:
@@ -384,3 +377,111 @@ def multi_look(infile, outfile, logfile, config_dict):
         return str(outfile.with_suffix(".dim"))
     else:
         raise NotValidFileError(f"Product did not pass file check: {return_code}")
+
+
+def ard_graph(filelist, outfile, ls_mask, config_dict, imported=False):
+    """Assemble the GRD to ARD processing chain into a single SNAP graph
+
+    The nodes of the enabled processing steps are taken from the graph
+    fragments in ost/graphs/S1_GRD2ARD and chained in the same order as
+    the step-wise processing in grd_to_ard.
+
+    :param filelist: list of the GRD frames of one acquisition, or a list with
+                     the already imported (and border noise removed) product
+    :param outfile: the geocoded output product
+    :param ls_mask: the Layover/Shadow mask product, if it is created
+    :param config_dict: an OST configuration dictionary
+    :param imported: whether the input has been imported already
+    :return: ost.helpers.snap_graph.Graph
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+    polars = ard["polarisation"].replace(" ", "")
+    dem_params = snap_graph.dem_parameters(ard["dem"], ard["resolution"])
+
+    calibration = {
+        "GTC-sigma0": "2_CalSigma.xml",
+        "GTC-gamma0": "2_CalGamma.xml",
+        "RTC-gamma0": "2_CalBeta_TF.xml",
+    }
+    if ard["product_type"] not in calibration:
+        raise TypeError("Wrong product type selected.")
+
+    graph = snap_graph.Graph()
+    fragments = Path("S1_GRD2ARD")
+
+    # import, with slice assembly and subset
+    if imported:
+        node = graph.read(filelist[0])
+    else:
+        frames = []
+        for file in filelist:
+            node = graph.read(file)
+            node = graph.add_fragment(fragments / "1_AO_TNR.xml", "Apply-Orbit-File", [node])
+            frames.append(
+                graph.add_fragment(
+                    fragments / "1_AO_TNR.xml", "ThermalNoiseRemoval", [node], {"polarisation": polars}
+                )
+            )
+
+        node = frames[0]
+        if len(frames) > 1:
+            node = graph.add_node("SliceAssembly", frames, selectedPolarisations=polars)
+
+        if config_dict["subset"]:
+            region = {"region": config_dict.get("aoi", "")}
+            node = graph.add_fragment(fragments / "1_AO_TNR_SUB.xml", "Subset", [node], region)
+
+    # calibration
+    node = graph.add_fragment(fragments / calibration[ard["product_type"]], "Calibration", [node])
+
+    # multi-looking
+    if int(ard["resolution"]) >= 20:
+        ml_factor = {"ml": int(int(ard["resolution"]) / 10)}
+        node = graph.add_fragment(fragments / "3_ML_TC.xml", "Multilook", [node], ml_factor)
+
+    # layover/shadow mask as a separate branch
+    if ard["create_ls_mask"] is True:
+        snap_graph.add_ls_mask(graph, node, ls_mask, ard)
+
+    # speckle filtering
+    if ard["remove_speckle"]:
+        speckle_params = snap_graph.speckle_parameters(ard["speckle_filter"])
+        node = graph.add_node("Speckle-Filter", [node], **speckle_params)
+
+    # terrain flattening
+    if ard["product_type"] == "RTC-gamma0":
+        node = graph.add_fragment(fragments / "2_CalBeta_TF.xml", "Terrain-Flattening", [node], dem_params)
+
+    # linear to db
+    if ard["to_db"]:
+        node = graph.add_node("LinearToFromdB", [node])
+
+    # geocoding
+    node = snap_graph.add_geocoding(graph, node, ard)
+
+    graph.write(node, outfile)
+    return graph
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def fused_ard(filelist, outfile, ls_mask, logfile, config_dict, imported=False):
+    """Run the whole GRD to ARD processing chain within a single gpt call
+
+    :param filelist: list of the GRD frames of one acquisition, or a list with
+                     the already imported (and border noise removed) product
+    :param outfile: the geocoded output product
+    :param ls_mask: the Layover/Shadow mask product, if it is created
+    :param logfile:
+    :param config_dict: an OST configuration dictionary
+    :param imported: whether the input has been imported already
+    :return: path to the geocoded product
+    """
+
+    logger.debug("Processing the GRD product within a single processing graph.")
+
+    graph = ard_graph(filelist, outfile, ls_mask, config_dict, imported)
+    graph.run(outfile.with_name(f"{outfile.name}.xml"), logfile, config_dict)
+
+    return str(outfile.with_suffix(".dim"))
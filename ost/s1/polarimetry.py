@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Native dual-pol H-A-Alpha decomposition
+
+For dual-pol data, the H-A-Alpha decomposition is the eigen decomposition
+of the 2x2 covariance matrix of the co- and cross-polarised channel, which
+has a closed-form solution. It is computed with numpy, instead of SNAP's
+Polarimetric-Decomposition operator, on the complex bands of the imported
+burst. The covariance matrix is averaged within a square window, like
+SNAP's windowSize parameter, and the burst is processed in tiles that run
+in parallel.
+
+The result is written with the metadata of the imported burst, so that it
+is debursted and geocoded by SNAP right away.
+"""
+
+import time
+import logging
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+from ost.helpers import helpers as h, envi, dimap
+
+logger = logging.getLogger(__name__)
+
+# size of the tiles in rows and columns
+TILE_ROWS = 512
+TILE_COLS = 2048
+
+# cross-polarised channel of each co-polarised channel
+CHANNELS = {"VV": "VH", "HH": "HV"}
+
+# bands of the decomposition, named as by SNAP
+BANDS = ["Entropy", "Anisotropy", "Alpha"]
+
+
+def _channels(import_file):
+    """Get the i bands of the co- and cross-polarised channel of a burst
+
+    :param import_file: the imported burst without suffix
+    :return: tuple of the i bands of the co- and cross-polarised channel
+    """
+
+    data_dir = Path(import_file).with_suffix(".data")
+    for co_pol, cross_pol in CHANNELS.items():
+        co_band = sorted(data_dir.glob(f"i_*{co_pol}.img"))
+        cross_band = sorted(data_dir.glob(f"i_*{cross_pol}.img"))
+        if co_band and cross_band:
+            return co_band[0], cross_band[0]
+
+    raise ValueError(f"No dual-polarised channels found within {import_file}.")
+
+
+def h_a_alpha(c11, c22, c12):
+    """Dual-pol H-A-Alpha decomposition of a covariance matrix
+
+    :param c11: power of the co-polarised channel
+    :param c22: power of the cross-polarised channel
+    :param c12: complex correlation of both channels
+    :return: entropy, anisotropy and alpha angle in degrees,
+             0 where the matrix is empty
+    """
+
+    # eigenvalues of the hermitian matrix
+    span = c11 + c22
+    root = np.sqrt(np.maximum((c11 - c22) ** 2 / 4 + np.abs(c12) ** 2, 0))
+    lambda1, lambda2 = span / 2 + root, np.maximum(span / 2 - root, 0)
+
+    valid = span > 0
+    p1 = np.divide(lambda1, span, out=np.zeros_like(span), where=valid)
+    p2 = np.divide(lambda2, span, out=np.zeros_like(span), where=valid)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.nan_to_num(p1 * np.log2(p1)) - np.nan_to_num(p2 * np.log2(p2))
+
+    anisotropy = np.divide(lambda1 - lambda2, span, out=np.zeros_like(span), where=valid)
+
+    # squared co-polarised component of the first eigenvector, the second
+    # eigenvector is orthogonal to it
+    cos2_alpha1 = np.divide(lambda1 - c22, 2 * root, out=np.full_like(span, 0.5), where=root > 0)
+    cos2_alpha1 = np.clip(cos2_alpha1, 0, 1)
+    alpha1 = np.arccos(np.sqrt(cos2_alpha1))
+    alpha2 = np.arccos(np.sqrt(1 - cos2_alpha1))
+    alpha = np.degrees(p1 * alpha1 + p2 * alpha2)
+
+    return entropy * valid, anisotropy, alpha * valid
+
+
+def _tile_decomposition(co_pol, cross_pol, tile, shape, window):
+    """Decompose one tile
+
+    :param co_pol: memmaps of the i and q band of the co-polarised channel
+    :param cross_pol: memmaps of the i and q band of the cross-polarised channel
+    :param tile: slices of the tile's rows and columns
+    :param shape: number of rows and columns of the burst
+    :param window: size of the averaging window
+    :return: entropy, anisotropy and alpha of the tile
+    """
+
+    # read with margins, as far as the image goes
+    rows, cols = (
+        slice(max(part.start - window, 0), min(part.stop + window, length))
+        for part, length in zip(tile, shape)
+    )
+
+    co_pol, cross_pol = envi.read_complex(co_pol, rows, cols), envi.read_complex(cross_pol, rows, cols)
+    correlation = co_pol * np.conj(cross_pol)
+
+    c11 = ndimage.uniform_filter(np.abs(co_pol) ** 2, window)
+    c22 = ndimage.uniform_filter(np.abs(cross_pol) ** 2, window)
+    c12 = ndimage.uniform_filter(correlation.real, window) + 1j * ndimage.uniform_filter(
+        correlation.imag, window
+    )
+
+    # cut the margins
+    core = tuple(
+        slice(part.start - margin.start, part.stop - margin.start) for part, margin in zip(tile, (rows, cols))
+    )
+    return h_a_alpha(c11[core], c22[core], c12[core])
+
+
+def decompose(import_file, outfile, config_dict):
+    """Create the H-A-Alpha decomposition of an imported burst
+
+    :param import_file: the imported burst without suffix
+    :param outfile: the decomposed product without suffix
+    :param config_dict: an OST configuration dictionary
+    :return: path to the decomposed product
+    """
+
+    # get relevant config parameters
+    window = config_dict["processing"]["single_ARD"].get("pol_window_size", 5)
+
+    co_pol, cross_pol = _channels(import_file)
+    logger.debug(f"Decomposing {co_pol.stem[2:]} and {cross_pol.stem[2:]} with a {window}x{window} window.")
+    currtime = time.time()
+
+    co_pol, cross_pol = envi.open_complex(co_pol), envi.open_complex(cross_pol)
+    shape = co_pol[0].shape
+
+    bands = dimap.derive_product(import_file, outfile, BANDS)
+    tiles = envi.tiles(shape, TILE_ROWS, TILE_COLS)
+    tile_decomposition = partial(_tile_decomposition, co_pol, cross_pol, shape=shape, window=window)
+
+    with ThreadPoolExecutor(max_workers=config_dict["snap_cpu_parallelism"]) as executor:
+        for tile, layers in zip(tiles, executor.map(tile_decomposition, tiles)):
+            for band, layer in zip(BANDS, layers):
+                bands[band][tile] = layer
+
+    for band in BANDS:
+        bands[band].flush()
+
+    logger.debug(h.timer(currtime))
+    return str(Path(outfile).with_suffix(".dim"))
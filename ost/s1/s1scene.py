@@ -36,10 +36,12 @@ from pathlib import Path
 import requests
 import pandas as pd
 import geopandas as gpd
+from shapely.geometry import Polygon
 
 from ost.helpers import scihub, peps, onda, asf, raster as ras, helpers as h
 from ost.helpers.settings import APIHUB_BASEURL, OST_ROOT
 from ost.helpers.settings import set_log_level, check_ard_parameters
+from ost.generic import ledger
 from ost.s1.grd_to_ard import grd_to_ard, ard_to_rgb
 
 logger = logging.getLogger(__name__)
@@ -868,6 +870,8 @@ class Sentinel1Scene:
             if (file_dir / ".processed").exists():
                 (file_dir / ".processed").unlink()
 
+            ledger.reset(out_dir, file_dir / "bs")
+
         # --------------------------------------------
         # 2 Check if within SRTM coverage
         # set ellipsoid correction and force GTC production
@@ -966,18 +970,43 @@ class Sentinel1Scene:
         ras.visualise_rgb(self.ard_rgb, shrink_factor)
 
     # other functions
-    def _get_center_lat(self, scene_path=None):
+    def _get_manifest(self, scene_path):
 
         if scene_path.suffix == ".zip":
-            zip_archive = zipfile.ZipFile(str(scene_path))
-            manifest = zip_archive.read(f"{self.scene_id}.SAFE/manifest.safe")
+            with zipfile.ZipFile(str(scene_path)) as zip_archive:
+                manifest = zip_archive.read(f"{self.scene_id}.SAFE/manifest.safe")
         elif scene_path.suffix == ".SAFE":
             with (scene_path / "manifest.safe").open("rb") as file:
                 manifest = file.read()
         else:
             raise ValueError("Invalid file.")
 
-        root = eTree.fromstring(manifest)
+        return eTree.fromstring(manifest)
+
+    def get_footprint(self, scene_path):
+        """Get the footprint and pass direction from the scene's manifest
+
+        :param scene_path: path to the scene in zip or SAFE format
+        :return: footprint as shapely Polygon in lon/lat,
+                 and pass direction (ASCENDING or DESCENDING)
+        """
+
+        root = self._get_manifest(Path(scene_path))
+
+        coordinates = root.findtext(".//{http://www.opengis.net/gml}coordinates")
+        if not coordinates:
+            raise RuntimeError("Could not find any coordinates within the metadata file")
+
+        # coordinates are given as lat,lon pairs
+        points = [coords.split(",") for coords in coordinates.split()]
+        footprint = Polygon([(float(lon), float(lat)) for lat, lon in points])
+
+        direction = root.findtext(".//{http://www.esa.int/safe/sentinel-1.0/sentinel-1}pass")
+        return footprint, direction
+
+    def _get_center_lat(self, scene_path=None):
+
+        root = self._get_manifest(scene_path)
         coordinates = None
         for child in root:
             metadata = child.findall("metadataObject")
@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Selective extraction of zipped Sentinel-1 products
+
+SNAP reads the measurement GeoTIFFs of zipped products with random access
+into the deflated archive, which is far slower than reading extracted
+files. Only the members a job needs (the manifest and the annotation,
+calibration, noise and measurement files of the configured polarisations
+and subswaths) are therefore extracted into a cache on local scratch, and
+the extracted SAFE directory is handed to SNAP instead.
+
+The cache is shared by all jobs on a node. Jobs register as users of a
+scene in a SQLite ledger within the cache, so that scenes are only evicted
+once no job uses them anymore and the cache exceeds its size budget.
+"""
+
+import os
+import re
+import time
+import shutil
+import sqlite3
+import logging
+import zipfile
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "safe_cache"
+LEDGER_NAME = ".safe_cache.sqlite"
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 120
+
+# mission, swath and polarisation within the names of the member files
+MEMBER = re.compile(r"s1[a-d]-(\w+?)-\w+?-(\w{2})-", re.IGNORECASE)
+
+
+def _pid_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _connect(cache_dir):
+
+    connection = sqlite3.connect(str(cache_dir / LEDGER_NAME), timeout=TIMEOUT)
+    connection.execute("CREATE TABLE IF NOT EXISTS scenes (scene TEXT PRIMARY KEY, last_used REAL)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS members (member TEXT PRIMARY KEY, scene TEXT, size INTEGER)"
+    )
+    connection.execute("CREATE TABLE IF NOT EXISTS users (scene TEXT, pid INTEGER)")
+    return connection
+
+
+def _polarisations(config_dict):
+    """Get the polarisations a job needs from its ARD parameters"""
+
+    ard = config_dict["processing"]["single_ARD"]
+    polarisations = set(re.findall(r"[HV]{2}", ard["polarisation"]))
+
+    if ard.get("coherence"):
+        polarisations |= set(re.findall(r"[HV]{2}", ard["coherence_bands"]))
+
+    return polarisations
+
+
+def _is_needed(member, polarisations, swaths):
+    """Check if a member of a zipped SAFE product is needed by SNAP
+
+    :param member: name of the member within the zip archive
+    :param polarisations: set of polarisations in upper case
+    :param swaths: set of subswaths in upper case, or None for all
+    :return: bool
+    """
+
+    # path within the SAFE directory
+    path = member.split("/", 1)[-1]
+
+    if path == "manifest.safe":
+        return True
+
+    if member.endswith("/") or not path.startswith(("annotation/", "measurement/")):
+        return False
+
+    match = MEMBER.search(Path(path).name)
+    if not match:
+        return False
+
+    swath, polarisation = match.group(1).upper(), match.group(2).upper()
+    return polarisation in polarisations and (not swaths or swath in swaths)
+
+
+def _register(cache_dir, scene):
+    """Register the job as user of a scene
+
+    :return: rowid of the registration and the scene's extracted members
+    """
+
+    connection = _connect(cache_dir)
+    try:
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO scenes VALUES (?, ?)", (scene, time.time()))
+            rowid = connection.execute(
+                "INSERT INTO users VALUES (?, ?)", (scene, os.getpid())
+            ).lastrowid
+            members = connection.execute(
+                "SELECT member FROM members WHERE scene = ?", (scene,)
+            ).fetchall()
+    finally:
+        connection.close()
+
+    return rowid, {member for member, in members}
+
+
+def _extract(file, cache_dir, scene, extracted, polarisations, swaths):
+    """Extract the needed members of a zipped product that are not cached yet
+
+    :return: path to the extracted SAFE directory
+    """
+
+    with zipfile.ZipFile(str(file), "r") as archive:
+        members = [
+            info
+            for info in archive.infolist()
+            if _is_needed(info.filename, polarisations, swaths)
+        ]
+
+        for info in members:
+            target = cache_dir / info.filename
+            if info.filename in extracted and target.exists():
+                continue
+
+            # extract to a temporary name first, so concurrent jobs
+            # never see incomplete files
+            target.parent.mkdir(parents=True, exist_ok=True)
+            partial = target.with_name(f".{target.name}.{os.getpid()}")
+            with archive.open(info) as src, partial.open("wb") as dst:
+                shutil.copyfileobj(src, dst, 2**24)
+            os.replace(str(partial), str(target))
+
+            connection = _connect(cache_dir)
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO members VALUES (?, ?, ?)",
+                        (info.filename, scene, info.file_size),
+                    )
+            finally:
+                connection.close()
+
+    return cache_dir / members[0].filename.split("/", 1)[0]
+
+
+def _evict(cache_dir, budget):
+    """Remove unused scenes, least recently used first, until within budget
+
+    :param cache_dir: the cache directory
+    :param budget: size budget of the cache in bytes
+    """
+
+    connection = _connect(cache_dir)
+    try:
+        connection.isolation_level = None
+        connection.execute("BEGIN EXCLUSIVE")
+
+        # release registrations of jobs that died
+        for rowid, pid in connection.execute("SELECT rowid, pid FROM users").fetchall():
+            if not _pid_alive(pid):
+                connection.execute("DELETE FROM users WHERE rowid = ?", (rowid,))
+
+        size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM members").fetchone()[0]
+        unused = connection.execute(
+            "SELECT scene FROM scenes WHERE scene NOT IN (SELECT scene FROM users) ORDER BY last_used"
+        ).fetchall()
+
+        for scene, in unused:
+            if size <= budget:
+                break
+
+            logger.debug(f"Evicting {scene} from the SAFE cache.")
+            shutil.rmtree(cache_dir / f"{scene}.SAFE", ignore_errors=True)
+            size -= connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM members WHERE scene = ?", (scene,)
+            ).fetchone()[0]
+            connection.execute("DELETE FROM members WHERE scene = ?", (scene,))
+            connection.execute("DELETE FROM scenes WHERE scene = ?", (scene,))
+
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+
+@contextmanager
+def extracted(files, config_dict, swaths=None, temp_dir=None):
+    """Extract the members of zipped products a job needs
+
+    The extraction is enabled by the safe_cache_quota parameter (in GB) of
+    the configuration. Products that are not zipped, or that can not be
+    extracted, are passed on as they are.
+
+    :param files: list of Sentinel-1 products
+    :param config_dict: an OST configuration dictionary
+    :param swaths: list of subswaths to extract, defaults to all
+    :param temp_dir: local scratch directory for the cache, defaults to
+                     the temp_dir of the configuration
+    :return: list of paths to hand to SNAP, in the order of files
+    """
+
+    quota = config_dict.get("safe_cache_quota") or 0
+    if quota <= 0:
+        yield [Path(file) for file in files]
+        return
+
+    cache_dir = Path(temp_dir or config_dict["temp_dir"]) / CACHE_NAME
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    polarisations = _polarisations(config_dict)
+    swaths = {swath.upper() for swath in swaths} if swaths else None
+
+    scenes, registrations = [], []
+    try:
+        for file in files:
+            file = Path(file)
+            if file.suffix != ".zip":
+                scenes.append(file)
+                continue
+
+            rowid, members = _register(cache_dir, file.stem)
+            registrations.append(rowid)
+
+            try:
+                scenes.append(_extract(file, cache_dir, file.stem, members, polarisations, swaths))
+            except (OSError, IndexError, zipfile.BadZipFile) as error:
+                logger.info(f"Could not extract {file.name}, importing from zip ({error}).")
+                scenes.append(file)
+
+        _evict(cache_dir, quota * 2**30)
+        yield scenes
+
+    finally:
+        connection = _connect(cache_dir)
+        try:
+            with connection:
+                for rowid in registrations:
+                    connection.execute("DELETE FROM users WHERE rowid = ?", (rowid,))
+        finally:
+            connection.close()
+
+        _evict(cache_dir, quota * 2**30)
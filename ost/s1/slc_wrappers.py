@@ -2,12 +2,13 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from pathlib import Path
 
 from retrying import retry
 
 from ost.helpers.settings import GPT_FILE, OST_ROOT
 from ost.helpers.errors import GPTRuntimeError, NotValidFileError
-from ost.helpers import helpers as h
+from ost.helpers import helpers as h, gpt_profile, snap_graph
 
 
 logger = logging.getLogger(__name__)
@@ -63,7 +64,7 @@ def burst_import(infile, outfile, logfile, swath, burst, config_dict):
     )
 
     logger.debug(f"Executing command: {command}")
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Succesfully imported burst.")
@@ -128,7 +129,7 @@ def ha_alpha(infile, outfile, logfile, config_dict):
         )
 
     logger.debug(f"Executing command: {command}")
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Succesfully created H/A/Alpha product")
@@ -232,7 +233,7 @@ def calibration(infile, outfile, logfile, config_dict):
         raise TypeError("Wrong product type selected.")
 
     logger.debug(f"Command: {command}")
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Succesfully calibrated product")
@@ -286,7 +287,7 @@ def coreg(master, slave, outfile, logfile, config_dict):
     )
 
     logger.debug(f"Executing command: {command}")
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Succesfully coregistered product.")
@@ -339,7 +340,7 @@ def coreg2(master, slave, outfile, logfile, config_dict):
         f" -Poutput={str(outfile)}"
     )
 
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Successfully co-registered product.")
@@ -390,7 +391,7 @@ def coherence(infile, outfile, logfile, config_dict):
     )
 
     logger.debug(f"Executing command: {command}")
-    return_code = h.run_command(command, logfile)
+    return_code = gpt_profile.run(command, logfile, config_dict)
 
     if return_code == 0:
         logger.debug("Succesfully created coherence product.")
@@ -405,3 +406,234 @@ def coherence(infile, outfile, logfile, config_dict):
         return str(outfile.with_suffix(".dim"))
     else:
         raise NotValidFileError(f"Product did not pass file check: {return_code}")
+
+
+def ard_graph(import_file, out_bs, out_ls, out_pol, config_dict, pol_file=None):
+    """Assemble the backscatter and polarimetric processing of a burst
+
+    Both products are derived from the same imported burst within a single
+    SNAP graph, so the burst is read only once. The nodes are taken from the
+    graph fragments in ost/graphs/S1_SLC2ARD and chained in the same order
+    as in the step-wise processing of burst_to_ard.
+
+    :param import_file: the imported burst
+    :param out_bs: the geocoded backscatter product, or None to skip it
+    :param out_ls: the Layover/Shadow mask product, if it is created
+    :param out_pol: the geocoded H-A-Alpha product, or None to skip it
+    :param config_dict: an OST configuration dictionary
+    :param pol_file: H-A-Alpha decomposition of the burst by
+                     ost.s1.polarimetry, which is only debursted and geocoded
+    :return: ost.helpers.snap_graph.Graph
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+    fragments = Path("S1_SLC2ARD")
+
+    graph = snap_graph.Graph()
+
+    # the imported burst is not needed for the native decomposition alone
+    burst = graph.read(import_file) if out_bs or not pol_file else None
+
+    if out_bs:
+
+        calibration = {
+            "GTC-sigma0": "S1_SLC_TNR_CalSigma_Deb_ML_Sub.xml",
+            "GTC-gamma0": "S1_SLC_TNR_CalGamma_Deb_ML_Sub.xml",
+            "RTC-gamma0": "S1_SLC_TNR_CalBeta_Deb_ML_TF_Sub.xml",
+        }
+        if ard["product_type"] not in calibration:
+            raise TypeError("Wrong product type selected.")
+
+        # calibration, debursting, multi-looking (and terrain flattening)
+        placeholders = snap_graph.dem_parameters(ard["dem"], ard["resolution"])
+        placeholders.update(range_looks=6, azimuth_looks=1, region="")
+        node = graph.add_chain(fragments / calibration[ard["product_type"]], burst, placeholders)
+
+        # layover/shadow mask as a separate branch
+        if ard["create_ls_mask"] is True:
+            snap_graph.add_ls_mask(graph, node, out_ls, ard)
+
+        if ard["remove_speckle"]:
+            speckle_params = snap_graph.speckle_parameters(ard["speckle_filter"])
+            node = graph.add_node("Speckle-Filter", [node], **speckle_params)
+
+        if ard["to_db"]:
+            node = graph.add_node("LinearToFromdB", [node])
+
+        node = snap_graph.add_geocoding(graph, node, ard)
+        graph.write(node, out_bs)
+
+    if out_pol:
+
+        # debursting, (polarimetric speckle filter) and decomposition
+        if pol_file:
+            node = graph.add_node("TOPSAR-Deburst", [graph.read(pol_file)], selectedPolarisations="")
+        elif ard["remove_pol_speckle"]:
+            pol_speckle_dict = ard["pol_speckle_filter"]
+            node = graph.add_chain(
+                fragments / "S1_SLC_Deb_Spk_Halpha.xml",
+                burst,
+                {
+                    "filter": pol_speckle_dict["polarimetric_filter"],
+                    "filter_size": pol_speckle_dict["filter_size"],
+                    "nr_looks": pol_speckle_dict["num_of_looks"],
+                    "window_size": pol_speckle_dict["window_size"],
+                    "target_window_size": pol_speckle_dict["target_window_size"],
+                    "pan_size": pol_speckle_dict["pan_size"],
+                    "sigma": pol_speckle_dict["sigma"],
+                },
+            )
+        else:
+            node = graph.add_chain(fragments / "S1_SLC_Deb_Halpha.xml", burst)
+
+        node = snap_graph.add_geocoding(graph, node, ard)
+        graph.write(node, out_pol)
+
+    return graph
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def fused_ard(import_file, out_bs, out_ls, out_pol, logfile, config_dict, pol_file=None):
+    """Create the backscatter and polarimetric layers within a single gpt call
+
+    :param import_file: the imported burst
+    :param out_bs: the geocoded backscatter product, or None to skip it
+    :param out_ls: the Layover/Shadow mask product, if it is created
+    :param out_pol: the geocoded H-A-Alpha product, or None to skip it
+    :param logfile:
+    :param config_dict: an OST configuration dictionary
+    :param pol_file: H-A-Alpha decomposition of the burst by ost.s1.polarimetry
+    :return: list of the written products
+    """
+
+    logger.debug("Processing the burst within a single processing graph.")
+
+    graph = ard_graph(import_file, out_bs, out_ls, out_pol, config_dict, pol_file)
+    graph_file = (out_bs or out_pol).with_name(f"{(out_bs or out_pol).name}.xml")
+    return graph.run(graph_file, logfile, config_dict)
+
+
+def coherence_graph(master, slave, outfile, config_dict):
+    """Assemble co-registration, coherence estimation and geocoding
+
+    :param master: the imported master burst
+    :param slave: the imported slave burst
+    :param outfile: the geocoded coherence product
+    :param config_dict: an OST configuration dictionary
+    :return: ost.helpers.snap_graph.Graph
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+    dem_dict = ard["dem"]
+
+    graph = snap_graph.Graph()
+    node = graph.add_node(
+        "Back-Geocoding",
+        [graph.read(master), graph.read(slave)],
+        demName=dem_dict["dem_name"],
+        demResamplingMethod=dem_dict["dem_resampling"],
+        externalDEMFile=dem_dict["dem_file"],
+        externalDEMNoDataValue=dem_dict["dem_nodata"],
+        maskOutAreaWithoutElevation=False,
+        resamplingType="BILINEAR_INTERPOLATION",
+    )
+
+    node = graph.add_chain(
+        Path("S1_SLC2ARD") / "S1_SLC_Coh_Deb.xml",
+        node,
+        {
+            "azimuth_window": ard["coherence_azimuth"],
+            "range_window": ard["coherence_range"],
+            "polar": ard["coherence_bands"].replace(" ", ""),
+        },
+    )
+
+    node = snap_graph.add_geocoding(graph, node, ard)
+    graph.write(node, outfile)
+    return graph
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def fused_coherence(master, slave, outfile, logfile, config_dict):
+    """Create the coherence layer of a burst pair within a single gpt call
+
+    :param master: the imported master burst
+    :param slave: the imported slave burst
+    :param outfile: the geocoded coherence product
+    :param logfile:
+    :param config_dict: an OST configuration dictionary
+    :return: path to the geocoded coherence product
+    """
+
+    logger.debug(f"Estimating the coherence of {master} and {slave} within a single processing graph.")
+
+    graph = coherence_graph(master, slave, outfile, config_dict)
+    graph.run(outfile.with_name(f"{outfile.name}.xml"), logfile, config_dict)
+
+    return str(outfile.with_suffix(".dim"))
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def coreg_stack(master, slaves, outfile, logfile, config_dict):
+    """Co-register several slave bursts to one master within a single gpt call
+
+    :param master: the imported master burst
+    :param slaves: list of the imported slave bursts
+    :param outfile: the co-registered stack
+    :param logfile:
+    :param config_dict: an OST configuration dictionary
+    :return: path to the co-registered stack
+    """
+
+    # get relevant config parameters
+    dem_dict = config_dict["processing"]["single_ARD"]["dem"]
+
+    logger.debug(f"Co-registering {len(slaves)} slave burst(s) to {master}.")
+
+    graph = snap_graph.Graph()
+    node = graph.add_node(
+        "Back-Geocoding",
+        [graph.read(file) for file in [master] + list(slaves)],
+        demName=dem_dict["dem_name"],
+        demResamplingMethod=dem_dict["dem_resampling"],
+        externalDEMFile=dem_dict["dem_file"],
+        externalDEMNoDataValue=dem_dict["dem_nodata"],
+        maskOutAreaWithoutElevation=False,
+        resamplingType="BILINEAR_INTERPOLATION",
+    )
+    graph.write(node, outfile)
+    graph.run(outfile.with_name(f"{outfile.name}.xml"), logfile, config_dict)
+
+    return str(outfile.with_suffix(".dim"))
+
+
+@retry(stop_max_attempt_number=3, wait_fixed=1)
+def deburst_geocoding(infile, outfile, logfile, config_dict, polarisations=None):
+    """Deburst and geocode a product within a single gpt call
+
+    This is the SNAP part of the processing of layers that are derived
+    from the bursts with numpy, i.e. by ost.s1.coherence and
+    ost.s1.polarimetry.
+
+    :param infile: the product derived from the bursts
+    :param outfile: the geocoded product
+    :param logfile:
+    :param config_dict: an OST configuration dictionary
+    :param polarisations: polarisations to deburst, defaults to all bands
+    :return: path to the geocoded product
+    """
+
+    # get relevant config parameters
+    ard = config_dict["processing"]["single_ARD"]
+
+    logger.debug(f"Debursting and geocoding {infile}.")
+
+    graph = snap_graph.Graph()
+    node = graph.add_node("TOPSAR-Deburst", [graph.read(infile)], selectedPolarisations=polarisations or "")
+    node = snap_graph.add_geocoding(graph, node, ard)
+    graph.write(node, outfile)
+    graph.run(outfile.with_name(f"{outfile.name}.xml"), logfile, config_dict)
+
+    return str(outfile.with_suffix(".dim"))
@@ -0,0 +1,24 @@
+import json
+
+from ost.helpers import gpt_profile
+from ost.s1 import burst_batch
+
+
+def test_worker_config(tmp_path, monkeypatch):
+
+    config_file = tmp_path / "config.json"
+    config_dict = {"temp_dir": str(tmp_path / "temp"), "max_workers": 1, "snap_cpu_parallelism": 2}
+    config_file.write_text(json.dumps(config_dict))
+
+    assert burst_batch._worker_config(config_file, config_dict, 1) == config_file
+
+    # the jobs budget their memory by the raised number of workers
+    worker_config = burst_batch._worker_config(config_file, config_dict, 4)
+    with open(worker_config, "r") as file:
+        worker_dict = json.load(file)
+
+    assert worker_dict == dict(config_dict, max_workers=4)
+    assert json.loads(config_file.read_text())["max_workers"] == 1
+
+    monkeypatch.setattr(gpt_profile.os, "sysconf", lambda name: 2**20 if name == "SC_PAGE_SIZE" else 800)
+    assert gpt_profile._memory_budget(worker_dict) == gpt_profile._memory_budget(config_dict) // 4
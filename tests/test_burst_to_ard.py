@@ -0,0 +1,85 @@
+import json
+
+import pandas as pd
+import pytest
+
+from ost.s1 import burst_cache, burst_to_ard
+
+
+def _config_dict(tmp_path):
+
+    return {
+        "processing_dir": str(tmp_path),
+        "temp_dir": str(tmp_path / "temp"),
+        "subset": False,
+        "processing": {
+            "single_ARD": {
+                "polarisation": "VV",
+                "resolution": 20,
+                "backscatter": True,
+                "H-A-Alpha": False,
+                "coherence": True,
+                "coherence_bands": "VV",
+                "coherence_stack": True,
+                "coherence_baselines": [1],
+            }
+        },
+    }
+
+
+def _bursts(tmp_path, dates):
+
+    return pd.DataFrame(
+        {
+            "bid": "A117_IW1_1",
+            "Date": dates,
+            "SceneID": [f"S1A_{date}" for date in dates],
+            "SwathID": "IW1",
+            "BurstNr": 1,
+            "file_location": [str(tmp_path / f"S1A_{date}.zip") for date in dates],
+            "out_directory": [str(tmp_path / "A117_IW1_1" / date) for date in dates],
+            "master_prefix": [f"{date}_A117_IW1_1" for date in dates],
+        }
+    )
+
+
+def _consumers(config_dict):
+
+    connection = burst_cache._connect(burst_cache._cache_dir(config_dict))
+    try:
+        return sorted(connection.execute("SELECT consumer, name FROM consumers").fetchall())
+    finally:
+        connection.close()
+
+
+def test_stack_imports(tmp_path):
+
+    config_dict = _config_dict(tmp_path)
+    bursts = _bursts(tmp_path, ["20200113", "20200101", "20200125"])
+
+    claims = burst_to_ard.stack_imports(bursts, config_dict)
+    assert [consumer for consumer, _ in claims] == ["A117_IW1_1_coherence_stack"] * 3
+    assert [name.split("_")[1] for _, name in claims] == ["20200101", "20200113", "20200125"]
+
+    # the imports stay in the cache after the burst jobs released them
+    burst_cache.register(claims + [("20200101_A117_IW1_1", claims[0][1])], config_dict)
+    burst_cache.release("20200101_A117_IW1_1", config_dict)
+    assert _consumers(config_dict) == sorted((consumer, name) for consumer, name in claims)
+
+
+def test_stack_releases_imports_on_error(tmp_path, monkeypatch):
+
+    config_dict = _config_dict(tmp_path)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config_dict))
+    bursts = _bursts(tmp_path, ["20200101", "20200113"])
+    burst_cache.register(burst_to_ard.stack_imports(bursts, config_dict), config_dict)
+
+    def failing_import(*args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(burst_cache, "cached_import", failing_import)
+    with pytest.raises(KeyboardInterrupt):
+        burst_to_ard.coherence_stack_to_ard(bursts, config_file)
+
+    assert _consumers(config_dict) == []
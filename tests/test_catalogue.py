@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from ost.generic import catalogue, mosaic
+from ost.helpers import raster as ras
+from ost.s1 import grd_batch
+
+
+def _write_tif(path, value=1.0):
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    profile = dict(
+        driver="GTiff",
+        width=4,
+        height=4,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(10, 50, 0.01, 0.01),
+        nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.full((1, 4, 4), value, dtype="float32"))
+
+    return path
+
+
+def _config(processing_dir):
+
+    return {
+        "processing_dir": str(processing_dir),
+        "temp_dir": str(processing_dir / "temp"),
+        "executor_type": "concurrent_threads",
+        "max_workers": 1,
+        "processing": {
+            "time-scan_ARD": {"metrics": ["avg"]},
+            "mosaic": {"virtual": False, "harmonization": False, "cut_to_aoi": False},
+        },
+    }
+
+
+def test_register_and_glob(tmp_path):
+
+    files = [
+        _write_tif(tmp_path / "117" / "20200101" / "a.bs.VV.tif"),
+        _write_tif(tmp_path / "117" / "20200113" / "a.bs.VV.tif"),
+        _write_tif(tmp_path / "117" / "20200113" / "sub" / "a.bs.VV.tif"),
+    ]
+    catalogue.register(tmp_path, files)
+
+    # no recursion into subdirectories
+    assert catalogue.glob(tmp_path, "117/20*/*bs.VV.tif") == sorted(files[:2])
+
+    # removed files are not returned
+    files[0].unlink()
+    assert catalogue.glob(tmp_path, "117/20*/*bs.VV.tif") == [files[1]]
+
+    catalogue.unregister(tmp_path, [files[1]])
+    assert catalogue.glob(tmp_path, "117/20*/*bs.VV.tif") == []
+
+
+def test_glob_does_not_scan(tmp_path):
+
+    registered = _write_tif(tmp_path / "117" / "Timeseries" / "01.bs.VV.tif")
+    catalogue.register(tmp_path, [registered])
+
+    # written after the catalogue exists, but never registered
+    unregistered = _write_tif(tmp_path / "44" / "Timescan" / "bs.VV.avg.tif")
+    assert catalogue.glob(tmp_path, "*/Timescan/*bs.VV.avg.tif") == []
+
+    catalogue.register_dir(tmp_path, tmp_path / "44")
+    assert catalogue.glob(tmp_path, "*/Timescan/*bs.VV.avg.tif") == [unregistered]
+
+
+def test_tscan_vrt_keeps_catalogue(tmp_path):
+
+    config_dict = _config(tmp_path)
+    for track in ["117", "44"]:
+        timescan_dir = tmp_path / track / "Timescan"
+        catalogue.register(tmp_path, [_write_tif(timescan_dir / "bs.VV.avg.tif")])
+        ras.create_tscan_vrt(timescan_dir, config_dict)
+
+    assert catalogue.glob(tmp_path, "*/Timescan/*bs.VV.avg.tif") == [
+        tmp_path / "117" / "Timescan" / "01.bs.VV.avg.tif",
+        tmp_path / "44" / "Timescan" / "01.bs.VV.avg.tif",
+    ]
+
+
+def test_mosaic_timescan_after_timescan(tmp_path, monkeypatch):
+
+    config_dict = _config(tmp_path)
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config_dict))
+
+    for track in ["117", "44"]:
+        timescan_dir = tmp_path / track / "Timescan"
+        catalogue.register(tmp_path, [_write_tif(timescan_dir / "bs.VV.avg.tif")])
+        ras.create_tscan_vrt(timescan_dir, config_dict)
+
+    # mosaicking itself needs OTB, so the first input stands in for the mosaic
+    mosaics = {}
+
+    def fake_mosaic(list_of_args):
+        filelist, outfile, _ = list_of_args
+        mosaics[outfile.name] = filelist.split(" ")
+        _write_tif(outfile)
+
+    monkeypatch.setattr(mosaic, "gd_mosaic", fake_mosaic)
+    grd_batch.mosaic_timescan(config_file)
+
+    assert mosaics == {
+        "bs.VV.avg.tif": [
+            str(tmp_path / "117" / "Timescan" / "01.bs.VV.avg.tif"),
+            str(tmp_path / "44" / "Timescan" / "01.bs.VV.avg.tif"),
+        ]
+    }
+    assert (tmp_path / "Mosaic" / "Timescan" / "01.bs.VV.avg.tif").exists()
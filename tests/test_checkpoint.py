@@ -0,0 +1,66 @@
+from ost.helpers.checkpoint import Checkpoints
+
+
+def _write_dimap(product):
+
+    product.with_suffix(".dim").write_text("<Dimap_Document/>")
+    product.with_suffix(".data").mkdir()
+    (product.with_suffix(".data") / "band.img").write_bytes(b"\x01" * 16)
+
+
+def test_resume(tmp_path):
+
+    scene = tmp_path / "scene.zip"
+    scene.write_bytes(b"scene")
+
+    checkpoints = Checkpoints(tmp_path / "checkpoints", [scene])
+    calibrated = checkpoints.step("cal", product_type="GTC-gamma0")
+    _write_dimap(calibrated)
+    checkpoints.commit(calibrated)
+
+    # the calibration is skipped on a rerun, the next step is not
+    checkpoints = Checkpoints(tmp_path / "checkpoints", [scene])
+    assert checkpoints.reached(checkpoints.step("cal", product_type="GTC-gamma0"))
+    assert not checkpoints.reached(checkpoints.step("ml", resolution=20))
+
+    # other parameters need a rerun
+    checkpoints = Checkpoints(tmp_path / "checkpoints", [scene])
+    assert not checkpoints.reached(checkpoints.step("cal", product_type="RTC-gamma0"))
+
+    checkpoints.evict()
+    assert not (tmp_path / "checkpoints").exists()
+
+
+def test_persist_from_work_dir(tmp_path):
+
+    scene, work_dir = tmp_path / "scene.zip", tmp_path / "staged"
+    scene.write_bytes(b"scene")
+    work_dir.mkdir()
+
+    checkpoints = Checkpoints(tmp_path / "checkpoints", [scene], work_dir=work_dir)
+    calibrated = checkpoints.step("cal", product_type="GTC-gamma0")
+    ls_mask = checkpoints.branch("ls_mask", resolution=20)
+    multi_looked = checkpoints.step("ml", resolution=20)
+    for product in [calibrated, ls_mask, multi_looked]:
+        assert product.parent == work_dir
+        _write_dimap(product)
+
+    checkpoints.commit(calibrated)
+    checkpoints.commit(ls_mask)
+    checkpoints.commit(multi_looked)
+
+    # only the last product of the chain and its branches are copied back
+    checkpoints.persist()
+    assert sorted(file.name for file in (tmp_path / "checkpoints").glob("*.dim")) == [
+        f"{ls_mask.name}.dim",
+        f"{multi_looked.name}.dim",
+    ]
+
+    # a rerun resumes from the persisted products in place
+    checkpoints = Checkpoints(tmp_path / "checkpoints", [scene], work_dir=tmp_path / "staged_again")
+    assert checkpoints.reached(checkpoints.step("cal", product_type="GTC-gamma0"))
+    assert checkpoints.reached(checkpoints.branch("ls_mask", resolution=20))
+    multi_looked = checkpoints.step("ml", resolution=20)
+    assert checkpoints.reached(multi_looked)
+    assert multi_looked.parent == tmp_path / "checkpoints"
+    assert checkpoints.step("spk", filter="Refined Lee").parent == tmp_path / "staged_again"
@@ -0,0 +1,44 @@
+from functools import partial
+
+import numpy as np
+
+from ost.s1 import coherence
+
+WINDOW = (3, 10)
+SHAPE = (64, 128)
+
+
+def _image(seed):
+
+    rng = np.random.default_rng(seed)
+    image = rng.normal(size=SHAPE) + 1j * rng.normal(size=SHAPE)
+    return image.real.astype("float32"), image.imag.astype("float32")
+
+
+def _coherence(first, second, window="boxcar"):
+
+    smooth = partial(coherence.WINDOWS[window], size=WINDOW)
+    tile = (slice(0, SHAPE[0]), slice(0, SHAPE[1]))
+    return coherence._tile_coherence(first, second, tile, SHAPE, WINDOW, smooth)
+
+
+def test_identical_images():
+
+    image = _image(1)
+    for window in coherence.WINDOWS:
+        np.testing.assert_allclose(_coherence(image, image, window), 1, atol=1e-5)
+
+
+def test_independent_images():
+
+    assert _coherence(_image(1), _image(2)).mean() < 0.3
+
+
+def test_fringes_are_removed():
+
+    first = _image(1)
+    fringes = np.exp(2j * np.pi * 0.0625 * np.arange(SHAPE[1]))
+    second = (first[0] + 1j * first[1]) * fringes
+    second = second.real.astype("float32"), second.imag.astype("float32")
+
+    np.testing.assert_allclose(_coherence(first, second), 1, atol=1e-3)
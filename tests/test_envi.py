@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from ost.helpers import envi
+
+
+def _write_envi(img_file, array, interleave, byte_order=1, header_offset=0):
+    """Write a bands, rows, columns array as ENVI image"""
+
+    bands, rows, cols = array.shape
+    header = [
+        "ENVI",
+        "description = {test image}",
+        f"samples = {cols}",
+        f"lines = {rows}",
+        f"bands = {bands}",
+        f"header offset = {header_offset}",
+        "file type = ENVI Standard",
+        "data type = 4",
+        f"interleave = {interleave}",
+        f"byte order = {byte_order}",
+        "band names = { Intensity_VV,",
+        " Intensity_VH }",
+    ]
+    img_file.with_suffix(".hdr").write_text("\n".join(header) + "\n")
+
+    layout = {"bsq": (0, 1, 2), "bil": (1, 0, 2), "bip": (1, 2, 0)}[interleave]
+    dtype = np.dtype(">f4" if byte_order == 1 else "<f4")
+    data = np.ascontiguousarray(array.transpose(layout)).astype(dtype)
+    img_file.write_bytes(b"\x00" * header_offset + data.tobytes())
+
+
+def test_read_header(tmp_path):
+
+    img_file = tmp_path / "image.img"
+    _write_envi(img_file, np.zeros((2, 3, 4)), "bsq")
+
+    header = envi.read_header(img_file.with_suffix(".hdr"))
+    assert (header["samples"], header["lines"], header["bands"]) == ("4", "3", "2")
+    assert header["band names"].split(",")[0] == "Intensity_VV"
+
+    img_file.with_suffix(".hdr").write_text("not a header")
+    with pytest.raises(ValueError):
+        envi.read_header(img_file.with_suffix(".hdr"))
+
+
+@pytest.mark.parametrize("interleave", ["bsq", "bil", "bip"])
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_open_band(tmp_path, interleave, byte_order):
+
+    array = np.arange(2 * 3 * 4, dtype="float32").reshape(2, 3, 4)
+    img_file = tmp_path / "image.img"
+    _write_envi(img_file, array, interleave, byte_order, header_offset=16)
+
+    band = envi.open_band(img_file)
+    assert band.shape == (2, 3, 4)
+    np.testing.assert_array_equal(band, array)
+
+    # a single band is mapped as rows and columns
+    _write_envi(img_file, array[:1], interleave, byte_order)
+    np.testing.assert_array_equal(envi.open_band(img_file), array[0])
+
+
+def test_create_band(tmp_path):
+
+    img_file = tmp_path / "Alpha.img"
+    band = envi.create_band(img_file, 3, 4, band_name="Alpha", ignore=0)
+    band[:] = np.arange(12).reshape(3, 4)
+    band.flush()
+    del band
+
+    np.testing.assert_array_equal(envi.open_band(img_file), np.arange(12).reshape(3, 4))
+    assert envi.ignore_value(img_file) == 0
+    assert envi.has_valid_data(img_file)
+
+    band = envi.open_band(img_file, mode="r+")
+    band[:] = 0
+    band.flush()
+    del band
+    assert not envi.has_valid_data(img_file)
+
+
+def test_complex(tmp_path):
+
+    i_band = envi.create_band(tmp_path / "i_IW1_VV.img", 2, 3)
+    q_band = envi.create_band(tmp_path / "q_IW1_VV.img", 2, 3)
+    i_band[:], q_band[:] = 1, 2
+    i_band.flush(), q_band.flush()
+
+    bands = envi.open_complex(tmp_path / "i_IW1_VV.img")
+    window = envi.read_complex(bands, slice(0, 2), slice(1, 3))
+    np.testing.assert_array_equal(window, np.full((2, 2), 1 + 2j))
+    assert envi.tiles((5, 3), 2, 2)[-1] == (slice(4, 5), slice(2, 3))
@@ -0,0 +1,98 @@
+import numpy as np
+
+from ost.helpers import envi
+from ost.s1 import grd_wrappers
+
+
+def _baseline_remove_border(array):
+    """The GDAL based border noise removal of OST 0.12, on an array"""
+
+    array = array.copy()
+    rows, cols = array.shape
+
+    array_left = array[:, :3000].copy()
+    cols_left = 3000
+    for x in range(3000):
+        if np.mean(array_left[:, x]) <= 100:
+            array_left[:, x].fill(0)
+        else:
+            z = x + 200
+            if z > 3000:
+                z = 3000
+            for cols_left in range(x, z, 1):
+                array_left[:, cols_left].fill(0)
+
+            break
+
+    array[:, :cols_left] = array_left[:, :cols_left]
+
+    cols_last = cols - 3000
+    array_right = array[:, cols_last:].copy()
+    cols_right = 3000
+    for x in range(2999, 0, -1):
+        if np.mean(array_right[:, x]) <= 100:
+            array_right[:, x].fill(0)
+        else:
+            z = x - 200
+            if z < 0:
+                z = 0
+            for cols_right in range(x, z, -1):
+                array_right[:, cols_right].fill(0)
+
+            break
+
+    col_right_start = cols - 3000 + cols_right
+    array[:, col_right_start:] = array_right[:, cols_right:]
+    return array
+
+
+def _scene(tmp_path, noise_left, noise_right, cols=8000, rows=20):
+
+    rng = np.random.default_rng(0)
+    array = rng.uniform(150, 1000, size=(rows, cols)).astype("float32")
+    array[:, :noise_left] = rng.uniform(0, 50, size=(rows, noise_left))
+    array[:, -noise_right:] = rng.uniform(0, 50, size=(rows, noise_right))
+
+    img_file = tmp_path / "Intensity_VV.img"
+    band = envi.create_band(img_file, rows, cols)
+    band[:] = array
+    band.flush()
+    del band
+
+    return img_file, array
+
+
+def test_remove_border_as_baseline(tmp_path):
+
+    img_file, array = _scene(tmp_path, noise_left=700, noise_right=1200)
+    grd_wrappers.grd_remove_border(img_file)
+
+    result, baseline = np.array(envi.open_band(img_file)), _baseline_remove_border(array)
+
+    # the baseline keeps the last column of the margin at near range,
+    # the margin now has the same 200 columns on both sides
+    zeroed = (result == 0).all(axis=0)
+    assert zeroed[:900].all() and not zeroed[900:-1400].any() and zeroed[-1400:].all()
+    np.testing.assert_array_equal(result[:, 900:], baseline[:, 900:])
+    np.testing.assert_array_equal(result[:, :899], baseline[:, :899])
+    assert (baseline[:, 899] == array[:, 899]).all()
+
+
+def test_remove_border_of_subsets(tmp_path):
+
+    img_file, array = _scene(tmp_path, noise_left=700, noise_right=1200)
+    grd_wrappers.grd_remove_border(img_file, near_range=False)
+
+    result = np.array(envi.open_band(img_file))
+    np.testing.assert_array_equal(result[:, :-1400], array[:, :-1400])
+    assert (result[:, -1400:] == 0).all()
+
+
+def test_remove_border_noise_only_strip(tmp_path):
+
+    img_file, array = _scene(tmp_path, noise_left=3500, noise_right=100)
+    grd_wrappers.grd_remove_border(img_file)
+
+    result = np.array(envi.open_band(img_file))
+    assert (result[:, :3000] == 0).all()
+    np.testing.assert_array_equal(result[:, 3000:-300], array[:, 3000:-300])
@@ -0,0 +1,101 @@
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from ost.generic import harmonization
+
+
+def _write_tif(path, array, left):
+
+    profile = dict(
+        driver="GTiff",
+        width=array.shape[1],
+        height=array.shape[0],
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(left, 50, 0.01, 0.01),
+        nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(array.astype("float32"), 1)
+
+    return str(path)
+
+
+def _files(tmp_path, gain=2.0, offset=5.0, name="bs.VV"):
+
+    # the second image overlaps the right half of the first one, with a
+    # different gain and offset
+    field = np.random.default_rng(0).uniform(1, 100, size=(40, 60))
+    return [
+        _write_tif(tmp_path / f"a.{name}.tif", field[:, :40], left=10),
+        _write_tif(tmp_path / f"b.{name}.tif", field[:, 20:] * gain + offset, left=10.2),
+    ]
+
+
+def test_gain_and_offset_recovery(tmp_path):
+
+    files = _files(tmp_path)
+    overlaps = harmonization.get_overlap_samples(files, tmp_path / "cache")
+    assert [overlap["pair"] for overlap in overlaps] == [[0, 1]]
+
+    (gain_a, offset_a), (gain_b, offset_b) = harmonization.harmonization_coefficients(files, overlaps)
+
+    # the first file is the reference
+    np.testing.assert_allclose([gain_a, offset_a], [1, 0], atol=1e-4)
+    np.testing.assert_allclose([gain_b, offset_b], [0.5, -2.5], atol=1e-3)
+
+
+def test_overlap_samples_are_cached(tmp_path):
+
+    cache_dir = tmp_path / "cache"
+    overlaps = harmonization.get_overlap_samples(_files(tmp_path), cache_dir)
+    assert len(list(cache_dir.glob("*.json"))) == 1
+
+    # another layer with the same footprints reuses the samples
+    other = _files(tmp_path, gain=3.0, offset=1.0, name="bs.VH")
+    assert harmonization.get_overlap_samples(other, cache_dir) == overlaps
+    assert len(list(cache_dir.glob("*.json"))) == 1
+
+
+def test_no_overlap(tmp_path):
+
+    field = np.ones((10, 10))
+    files = [
+        _write_tif(tmp_path / "a.tif", field, left=10),
+        _write_tif(tmp_path / "b.tif", field, left=11),
+    ]
+    overlaps = harmonization.get_overlap_samples(files, tmp_path / "cache")
+    assert overlaps == []
+    assert harmonization.harmonization_coefficients(files, overlaps) == [(1.0, 0.0), (1.0, 0.0)]
+
+
+def test_harmonize(tmp_path):
+
+    files = _files(tmp_path)
+    vrts = harmonization.harmonize(" ".join(files), tmp_path, tmp_path / "cache").split(" ")
+
+    with rasterio.open(vrts[0]) as first, rasterio.open(vrts[1]) as second:
+        np.testing.assert_allclose(first.read(1)[:, 20:], second.read(1)[:, :20], rtol=1e-3)
+
+
+def test_harmonize_groups(tmp_path):
+
+    # two bursts of the same subswath, and one of another subswath overlapping
+    # the second one, with a different gain and offset
+    field = np.random.default_rng(0).uniform(1, 100, size=(40, 80))
+    first = _write_tif(tmp_path / "a.tif", field[:, :30], left=10)
+    second = _write_tif(tmp_path / "b.tif", field[:, 30:60], left=10.3)
+    third = _write_tif(tmp_path / "c.tif", field[:, 40:] * 2 + 5, left=10.4)
+
+    vrts = harmonization.harmonize_groups([f"{first} {second}", third], tmp_path, tmp_path / "cache")
+    vrts = vrts.split(" ")
+    assert len(vrts) == 3
+
+    # the bursts of a group share the same correction
+    with rasterio.open(vrts[0]) as src:
+        np.testing.assert_allclose(src.read(1), field[:, :30], rtol=1e-3)
+
+    with rasterio.open(vrts[1]) as second, rasterio.open(vrts[2]) as third:
+        np.testing.assert_allclose(second.read(1)[:, 10:], third.read(1)[:, :20], rtol=1e-3)
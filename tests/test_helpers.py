@@ -0,0 +1,62 @@
+from ost.helpers import helpers as h
+from ost.helpers.checkpoint import CHECKPOINT_DIR
+from ost.s1.safe_cache import CACHE_NAME, LEDGER_NAME
+
+
+def _tree(folder):
+    return sorted(str(path.relative_to(folder)) for path in folder.rglob("*"))
+
+
+def test_remove_folder_content(tmp_path):
+
+    (tmp_path / "aborted" / "sub").mkdir(parents=True)
+    (tmp_path / "aborted" / "sub" / "product.dim").write_text("")
+    (tmp_path / "leftover.tif").write_text("")
+
+    h.remove_folder_content(tmp_path)
+    assert _tree(tmp_path) == []
+
+
+def test_remove_folder_content_keeps_checkpoints(tmp_path):
+
+    product = tmp_path / CHECKPOINT_DIR / "S1A_20200101_117" / "cal_0123.data"
+    product.mkdir(parents=True)
+    (product / "Sigma0_VV.img").write_text("")
+    (product.parent / "cal_0123.dim").write_text("")
+    (product.parent / "0123.checkpoint").write_text("{}")
+    (tmp_path / "aborted").mkdir()
+    (tmp_path / "aborted" / "product.dim").write_text("")
+
+    h.remove_folder_content(tmp_path, exclude=[CHECKPOINT_DIR])
+    assert _tree(tmp_path) == [
+        CHECKPOINT_DIR,
+        f"{CHECKPOINT_DIR}/S1A_20200101_117",
+        f"{CHECKPOINT_DIR}/S1A_20200101_117/0123.checkpoint",
+        f"{CHECKPOINT_DIR}/S1A_20200101_117/cal_0123.data",
+        f"{CHECKPOINT_DIR}/S1A_20200101_117/cal_0123.data/Sigma0_VV.img",
+        f"{CHECKPOINT_DIR}/S1A_20200101_117/cal_0123.dim",
+    ]
+
+
+def test_remove_folder_content_keeps_safe_cache(tmp_path):
+
+    scene = tmp_path / CACHE_NAME / "S1A_IW_GRDH_1SDV_20200101.SAFE"
+    (scene / "measurement").mkdir(parents=True)
+    (scene / "manifest.safe").write_text("")
+    (scene / "measurement" / "s1a-iw-grd-vv.tiff").write_text("")
+    (tmp_path / CACHE_NAME / LEDGER_NAME).write_text("")
+    (tmp_path / "aborted").mkdir()
+
+    h.remove_folder_content(tmp_path, exclude=[CHECKPOINT_DIR, CACHE_NAME])
+    assert _tree(tmp_path) == [
+        CACHE_NAME,
+        f"{CACHE_NAME}/{LEDGER_NAME}",
+        f"{CACHE_NAME}/{scene.name}",
+        f"{CACHE_NAME}/{scene.name}/manifest.safe",
+        f"{CACHE_NAME}/{scene.name}/measurement",
+        f"{CACHE_NAME}/{scene.name}/measurement/s1a-iw-grd-vv.tiff",
+    ]
+
+    # unless we start from scratch
+    h.remove_folder_content(tmp_path)
+    assert _tree(tmp_path) == []
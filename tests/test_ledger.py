@@ -0,0 +1,135 @@
+import sqlite3
+
+from ost.generic import ledger, mosaic
+
+ARD = {"resolution": 20}
+
+
+def _status(processing_dir, task):
+
+    connection = sqlite3.connect(str(processing_dir / ledger.LEDGER_NAME))
+    try:
+        return connection.execute(
+            "SELECT status, attempts, error FROM jobs WHERE task = ?",
+            (ledger.task_id(processing_dir, task),),
+        ).fetchone()
+    finally:
+        connection.close()
+
+
+def test_start_finish(tmp_path):
+
+    task = tmp_path / "A" / "20200101" / "bs"
+    assert not ledger.is_done(tmp_path, task, ARD)
+
+    ledger.start(tmp_path, task, ["scene.zip"], ARD)
+    assert not ledger.is_done(tmp_path, task, ARD)
+    assert _status(tmp_path, task)[:2] == (ledger.RUNNING, 1)
+
+    ledger.finish(tmp_path, task, ["bs.dim"])
+    assert ledger.is_done(tmp_path, task, ARD)
+    assert ledger.is_done(tmp_path, task)
+
+    # other parameters need a rerun
+    assert not ledger.is_done(tmp_path, task, {"resolution": 10})
+
+
+def test_fail(tmp_path):
+
+    task, other = tmp_path / "A" / "20200101" / "bs", tmp_path / "A" / "20200101" / "pol"
+    ledger.start(tmp_path, task, ["scene.zip"], ARD)
+    ledger.start(tmp_path, other, ["scene.zip"], ARD)
+    ledger.finish(tmp_path, other, ["pol.dim"])
+
+    # done tasks of a failed job are kept
+    ledger.fail(tmp_path, [task, other], "boom")
+    assert _status(tmp_path, task) == (ledger.FAILED, 1, "boom")
+    assert ledger.is_done(tmp_path, other, ARD)
+
+    # a retry counts the attempts
+    ledger.start(tmp_path, task, ["scene.zip"], ARD)
+    assert _status(tmp_path, task) == (ledger.RUNNING, 2, None)
+
+
+def test_completed(tmp_path):
+
+    for date in ["20200101", "20200113"]:
+        task = tmp_path / "A" / date / "bs"
+        ledger.start(tmp_path, task, ["scene.zip"], ARD)
+        ledger.finish(tmp_path, task, [f"{date}_bs.dim"])
+
+    ledger.start(tmp_path, tmp_path / "B" / "20200101" / "bs", ["scene.zip"], ARD)
+
+    assert ledger.completed(tmp_path, ARD) == {
+        "A/20200101/bs": ["20200101_bs.dim"],
+        "A/20200113/bs": ["20200113_bs.dim"],
+    }
+    assert list(ledger.completed(tmp_path, ARD, prefix="A/20200113/")) == ["A/20200113/bs"]
+    assert ledger.completed(tmp_path, {"resolution": 10}) == {}
+
+
+def test_completed_per_product(tmp_path):
+
+    ard = {"resolution": 20, "to_db": False, "coherence_azimuth": 4, "pol_window_size": 5}
+    for product in ["bs", "pol", "coh"]:
+        task = tmp_path / "A" / "20200101" / product
+        ledger.start(tmp_path, task, ["scene.zip"], ledger.ard_parameters(ard, product))
+        ledger.finish(tmp_path, task, [f"{product}.dim"])
+
+    assert len(ledger.completed(tmp_path, ard)) == 3
+
+    # only the products that depend on a changed parameter are processed again
+    assert list(ledger.completed(tmp_path, dict(ard, coherence_azimuth=2))) == ["A/20200101/bs", "A/20200101/pol"]
+    assert list(ledger.completed(tmp_path, dict(ard, to_db=True))) == ["A/20200101/pol", "A/20200101/coh"]
+    assert ledger.completed(tmp_path, dict(ard, resolution=10)) == {}
+
+
+def test_legacy_takeover(tmp_path):
+
+    out_dir = tmp_path / "A" / "20200101"
+    out_dir.mkdir(parents=True)
+    (out_dir / ".bs.processed").write_text("passed all tests \n")
+
+    task = out_dir / "bs"
+    assert "A/20200101/bs" not in ledger.completed(tmp_path, ARD)
+    assert ledger.is_done(tmp_path, task, ARD, legacy=out_dir / ".bs.processed")
+
+    # taken over once, after that the marker is not needed anymore
+    (out_dir / ".bs.processed").unlink()
+    assert ledger.is_done(tmp_path, task, ARD)
+    assert "A/20200101/bs" in ledger.completed(tmp_path, ARD)
+
+    ledger.reset(tmp_path, task)
+    assert not ledger.is_done(tmp_path, task, ARD)
+
+
+def test_check_outputs(tmp_path):
+
+    outfile = tmp_path / "Mosaic" / "temp" / "A.bs.VV.tif"
+    outfile.parent.mkdir(parents=True)
+    outfile.write_text("")
+
+    task = outfile.parent / "A.bs.VV"
+    ledger.start(tmp_path, task, ["a.tif", "b.tif"], ARD)
+    ledger.finish(tmp_path, task, [outfile])
+    assert ledger.is_done(tmp_path, task, ARD, check_outputs=True)
+
+    outfile.unlink()
+    assert ledger.is_done(tmp_path, task, ARD)
+    assert not ledger.is_done(tmp_path, task, ARD, check_outputs=True)
+
+
+def test_removed_temp_mosaic_is_not_processed(tmp_path):
+
+    config_dict = {"processing_dir": str(tmp_path), "processing": {"mosaic": {"harmonization": False}}}
+    outfile = tmp_path / "Mosaic" / "temp" / "20200101.bs.VV.tif"
+    outfile.parent.mkdir(parents=True)
+    outfile.write_text("")
+
+    task = outfile.parent / "20200101.bs.VV"
+    ledger.start(tmp_path, task, ["a.tif"], config_dict["processing"])
+    ledger.finish(tmp_path, task, [outfile])
+    assert mosaic.is_processed(outfile, config_dict)
+
+    outfile.unlink()
+    assert not mosaic.is_processed(outfile, config_dict)
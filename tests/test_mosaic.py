@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from ost.generic import mosaic
+
+
+def _config_file(tmp_path):
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(
+        json.dumps(
+            {
+                "processing_dir": str(tmp_path),
+                "temp_dir": str(tmp_path / "temp"),
+                "processing": {"mosaic": {"harmonization": True}},
+            }
+        )
+    )
+    return config_file
+
+
+def _burst_lists(lists):
+    return lambda track, date, product, subswath, config_dict: lists[subswath]
+
+
+def test_mosaic_slc_acquisition(tmp_path, monkeypatch):
+
+    config_file = _config_file(tmp_path)
+    outfile = tmp_path / "Mosaic" / "temp" / "0.20200101.117.bs.VV.tif"
+    (tmp_path / "temp").mkdir()
+    iw1, iw2 = _write_tif(tmp_path / "iw1.tif", 1), _write_tif(tmp_path / "iw2.tif", 1, left=10.03)
+    iw3 = _write_tif(tmp_path / "iw3.tif", 2, left=10.06)
+
+    calls = []
+
+    def fake_mosaic(filelist, outfile, config_file):
+        calls.append([Path(file) for file in filelist.split(" ")])
+
+    monkeypatch.setattr(mosaic, "mosaic", fake_mosaic)
+    monkeypatch.setattr(mosaic, "_burst_list", _burst_lists({"IW[1,2]": f"{iw1} {iw2}", "IW3": str(iw3)}))
+    mosaic.mosaic_slc_acquisition("117", "20200101", "bs.VV", outfile, config_file)
+
+    # all bursts go into a single mosaic, referenced by VRTs, without
+    # any pre-mosaic being written
+    assert len(calls) == 1 and len(calls[0]) == 3
+    assert all(file.suffix == ".vrt" for file in calls[0])
+    assert not outfile.parent.exists() and not any((tmp_path / "temp").iterdir())
+
+    # a single group of subswaths is mosaicked straight to the output
+    calls.clear()
+    monkeypatch.setattr(mosaic, "_burst_list", _burst_lists({"IW[1,2]": None, "IW3": str(iw3)}))
+    mosaic.mosaic_slc_acquisition("117", "20200101", "bs.VV", outfile, config_file)
+    assert calls == [[iw3]]
+
+    calls.clear()
+    monkeypatch.setattr(mosaic, "_burst_list", _burst_lists({"IW[1,2]": None, "IW3": None}))
+    mosaic.mosaic_slc_acquisition("117", "20200101", "bs.VV", outfile, config_file)
+    assert calls == []
+
+
+def _write_tif(path, value, left=10.0):
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    profile = dict(
+        driver="GTiff",
+        width=4,
+        height=4,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(left, 50, 0.01, 0.01),
+        nodata=0,
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.full((1, 4, 4), value, dtype="float32"))
+
+    return path
+
+
+def _virtual_config_file(tmp_path, cut_to_aoi=False):
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(
+        json.dumps(
+            {
+                "processing_dir": str(tmp_path),
+                "executor_type": "concurrent_threads",
+                "max_workers": 1,
+                # covers the left half of the mosaic
+                "aoi": "POLYGON ((10 49.96, 10.03 49.96, 10.03 50, 10 50, 10 49.96))",
+                "processing": {"mosaic": {"harmonization": False, "cut_to_aoi": cut_to_aoi, "virtual": True}},
+            }
+        )
+    )
+    return config_file
+
+
+def test_materialize_virtual_mosaic(tmp_path):
+
+    config_file = _virtual_config_file(tmp_path)
+    left = _write_tif(tmp_path / "a.tif", 1)
+    right = _write_tif(tmp_path / "b.tif", 2, left=10.02)
+
+    outfile = tmp_path / "Mosaic" / "bs.VV.vrt"
+    outfile.parent.mkdir()
+    mosaic.mosaic(f"{left} {right}", outfile, config_file)
+    assert mosaic.is_processed(outfile, json.loads(config_file.read_text()))
+
+    tif = mosaic.materialize(outfile, tmp_path / "bs.VV.tif")
+    with rasterio.open(tif) as src:
+        assert (src.width, src.height) == (6, 4)
+        # later files are on top of earlier ones
+        assert src.read(1).tolist() == [[1, 1, 2, 2, 2, 2]] * 4
+
+    # a single tile, given in the CRS of the mosaic
+    tif = mosaic.materialize(outfile, tmp_path / "tile.tif", bounds=(10.01, 49.97, 10.03, 49.99))
+    with rasterio.open(tif) as src:
+        assert src.read(1).tolist() == [[1, 2]] * 2
+
+    assert mosaic.materialize(outfile, tmp_path / "none.tif", bounds=(11, 49, 12, 50)) is None
+
+
+def test_export_mosaics(tmp_path):
+
+    config_file = _virtual_config_file(tmp_path, cut_to_aoi=True)
+    left = _write_tif(tmp_path / "a.tif", 1)
+    right = _write_tif(tmp_path / "b.tif", 2, left=10.02)
+
+    tscan_dir = tmp_path / "Mosaic" / "Timescan"
+    tscan_dir.mkdir(parents=True)
+    mosaic.mosaic(f"{left} {right}", tscan_dir / "01.bs.VV.avg.vrt", config_file)
+    (tscan_dir / "Timescan.vrt").write_text("")
+
+    outfiles = mosaic.export_mosaics(tscan_dir, config_file, tmp_path / "export")
+    assert outfiles == [tmp_path / "export" / "01.bs.VV.avg.tif"]
+
+    # cut to the AOI
+    with rasterio.open(outfiles[0]) as src:
+        assert src.read(1).tolist() == [[1, 1, 2]] * 4
+
+    # already exported layers are kept
+    assert mosaic.export_mosaics(tscan_dir, config_file, tmp_path / "export") == outfiles
@@ -0,0 +1,96 @@
+import itertools
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from ost.generic import mt_speckle
+
+SPECKLE = {"filter_x_size": 5, "filter_y_size": 5}
+
+
+def _speckle_dict(name):
+    return dict(SPECKLE, filter=name)
+
+
+def _write_stack(tmp_path, images):
+
+    stack = []
+    for i, image in enumerate(images):
+        profile = dict(
+            driver="GTiff",
+            width=image.shape[1],
+            height=image.shape[0],
+            count=1,
+            dtype="float32",
+            crs="EPSG:32632",
+            transform=from_origin(500000, 5000000, 20, 20),
+            nodata=0,
+        )
+        with rasterio.open(tmp_path / f"{i}.tif", "w", **profile) as dst:
+            dst.write(image.astype("float32"), 1)
+        stack.append(tmp_path / f"{i}.tif")
+
+    return stack
+
+
+@pytest.mark.parametrize("name", ["Boxcar", "Median", "Lee"])
+def test_local_mean_keeps_no_data(name):
+
+    arr = np.full((20, 20), 2.0)
+    arr[5:8, 5:8] = np.nan
+
+    mean = mt_speckle._local_mean(arr, _speckle_dict(name), enl=4)
+
+    # no-data pixels do not bias their neighbours
+    assert np.isnan(mean[5:8, 5:8]).all()
+    np.testing.assert_allclose(mean[np.isfinite(arr)], 2)
+
+
+def test_local_mean_lee():
+
+    rng = np.random.default_rng(0)
+    arr = rng.gamma(4, 0.25, size=(64, 64))
+    arr[:, 32:] *= 10
+
+    mean = mt_speckle._local_mean(arr, _speckle_dict("Lee"), enl=4)
+    boxcar = mt_speckle._local_mean(arr, _speckle_dict("Boxcar"), enl=4)
+
+    # the filter is between the local mean and the original pixel
+    assert ((mean - boxcar) * (arr - boxcar) >= -1e-12).all()
+    assert (np.abs(mean - boxcar) <= np.abs(arr - boxcar) + 1e-12).all()
+
+    # homogeneous areas are smoothed
+    assert mean[8:24, 8:24].std() < arr[8:24, 8:24].std() / 2
+
+    assert mt_speckle._local_mean(arr, _speckle_dict("None"), enl=4) is arr
+
+
+def test_filter_tile_constant_stack(tmp_path):
+
+    stack = _write_stack(tmp_path, [np.full((16, 16), value) for value in [1.0, 2.0, 4.0]])
+
+    window, filtered = mt_speckle._filter_tile(stack, Window(0, 0, 16, 16), 3, _speckle_dict("Lee"), enl=4)
+    assert filtered.shape == (3, 16, 16)
+    np.testing.assert_allclose(filtered, [np.full((16, 16), value) for value in [1.0, 2.0, 4.0]], rtol=1e-6)
+
+
+@pytest.mark.parametrize("name", ["Boxcar", "Median", "Lee"])
+def test_filter_tile_seamless(tmp_path, name):
+
+    rng = np.random.default_rng(1)
+    stack = _write_stack(tmp_path, rng.gamma(4, 0.25, size=(3, 40, 40)))
+    speckle_dict, halo = _speckle_dict(name), 2
+
+    _, whole = mt_speckle._filter_tile(stack, Window(0, 0, 40, 40), halo, speckle_dict, enl=4)
+
+    tiled = np.zeros_like(whole)
+    for row, col in itertools.product(range(0, 40, 16), range(0, 40, 16)):
+        window = Window(col, row, min(16, 40 - col), min(16, 40 - row))
+        window, filtered = mt_speckle._filter_tile(stack, window, halo, speckle_dict, enl=4)
+        rows, cols = window.toslices()
+        tiled[:, rows, cols] = filtered
+
+    np.testing.assert_allclose(tiled, whole, rtol=1e-5)
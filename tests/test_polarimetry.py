@@ -0,0 +1,48 @@
+import numpy as np
+
+from ost.s1 import polarimetry
+
+
+def test_h_a_alpha_diagonal():
+
+    # a single, purely co-polarised scattering mechanism
+    entropy, anisotropy, alpha = polarimetry.h_a_alpha(np.array([2.0]), np.array([0.0]), np.array([0j]))
+
+    np.testing.assert_allclose(entropy, 0, atol=1e-12)
+    np.testing.assert_allclose(anisotropy, 1)
+    np.testing.assert_allclose(alpha, 0, atol=1e-6)
+
+
+def test_h_a_alpha_equal_eigenvalues():
+
+    # uncorrelated channels of equal power, i.e. random scattering
+    entropy, anisotropy, alpha = polarimetry.h_a_alpha(np.array([1.0]), np.array([1.0]), np.array([0j]))
+
+    np.testing.assert_allclose(entropy, 1)
+    np.testing.assert_allclose(anisotropy, 0, atol=1e-12)
+    np.testing.assert_allclose(alpha, 45)
+
+
+def test_h_a_alpha_empty():
+
+    entropy, anisotropy, alpha = polarimetry.h_a_alpha(np.zeros(1), np.zeros(1), np.zeros(1, dtype=complex))
+    assert (entropy.tolist(), anisotropy.tolist(), alpha.tolist()) == ([0], [0], [0])
+
+
+def test_h_a_alpha_matches_eigen_decomposition():
+
+    rng = np.random.default_rng(42)
+    k = rng.normal(size=(2, 50, 20)) + 1j * rng.normal(size=(2, 50, 20))
+    c11, c22 = (np.abs(k[0]) ** 2).mean(axis=1), (np.abs(k[1]) ** 2).mean(axis=1)
+    c12 = (k[0] * np.conj(k[1])).mean(axis=1)
+
+    entropy, anisotropy, alpha = polarimetry.h_a_alpha(c11, c22, c12)
+
+    for i in range(len(c11)):
+        eigenvalues, eigenvectors = np.linalg.eigh(np.array([[c11[i], c12[i]], [np.conj(c12[i]), c22[i]]]))
+        p = eigenvalues / eigenvalues.sum()
+        alphas = np.degrees(np.arccos(np.abs(eigenvectors[0])))
+
+        np.testing.assert_allclose(entropy[i], -(p * np.log2(p)).sum())
+        np.testing.assert_allclose(anisotropy[i], (eigenvalues[1] - eigenvalues[0]) / eigenvalues.sum())
+        np.testing.assert_allclose(alpha[i], (p * alphas).sum())
@@ -0,0 +1,78 @@
+import json
+import shlex
+
+import pytest
+
+from ost.generic import common_wrappers as cw
+from ost.helpers import snap_graph
+from ost.helpers.settings import OST_ROOT
+from ost.s1 import slc_wrappers
+
+
+def _config_dict(template, geocoding="terrain"):
+
+    with open(OST_ROOT / "graphs" / "ard_json" / template, "r") as file:
+        config_dict = json.load(file)
+
+    config_dict["snap_cpu_parallelism"] = 1
+    config_dict["processing"]["single_ARD"]["geocoding"] = geocoding
+    return config_dict
+
+
+def _stepwise_parameters(config_dict, monkeypatch, tmp_path):
+    """Get operator and parameters of the step-wise geocoding command"""
+
+    commands = []
+    monkeypatch.setattr(cw.gpt_profile, "run", lambda command, logfile, config_dict: commands.append(command) or 0)
+    monkeypatch.setattr(cw.h, "check_out_dimap", lambda outfile: 0)
+
+    # without the retries
+    cw.terrain_correction.__wrapped__(tmp_path / "in.dim", tmp_path / "out", None, config_dict)
+
+    args = shlex.split(commands[0])
+    parameters = dict(arg[2:].split("=", 1) for arg in args if arg.startswith("-P"))
+    return args[1], parameters
+
+
+def _node_parameters(graph, node_id):
+    """Get operator and parameters of a node of a graph"""
+
+    node = next(node for node in graph.root.iter("node") if node.get("id") == node_id)
+    parameters = {element.tag: element.text or "" for element in node.find("parameters")}
+    return node.find("operator").text, parameters
+
+
+@pytest.mark.parametrize("geocoding", ["terrain", "ellipsoid"])
+def test_add_geocoding_matches_stepwise(geocoding, monkeypatch, tmp_path):
+
+    config_dict = _config_dict("grd.ost_gtc.json", geocoding)
+    # a projected output
+    config_dict["processing"]["single_ARD"]["dem"]["out_projection"] = 32632
+
+    graph = snap_graph.Graph()
+    node = snap_graph.add_geocoding(graph, graph.read("in.dim"), config_dict["processing"]["single_ARD"])
+
+    stepwise = _stepwise_parameters(config_dict, monkeypatch, tmp_path)
+    assert _node_parameters(graph, node) == stepwise
+
+    # everything else is left at the SNAP defaults, as in the step-wise processing
+    assert "nodataValueAtSea" not in stepwise[1]
+
+
+def test_burst_geocoding_matches_stepwise(monkeypatch, tmp_path):
+
+    config_dict = _config_dict("slc.ost_gtc.json")
+    config_dict["processing"]["single_ARD"]["create_ls_mask"] = False
+    stepwise = _stepwise_parameters(config_dict, monkeypatch, tmp_path)
+
+    # backscatter and H-A-Alpha of the fused burst processing
+    graph = slc_wrappers.ard_graph(
+        tmp_path / "import.dim", tmp_path / "bs", None, tmp_path / "pol", config_dict
+    )
+    nodes = [node.get("id") for node in graph.root.iter("node") if node.get("id").startswith("Terrain")]
+    assert len(nodes) == 2
+    assert all(_node_parameters(graph, node) == stepwise for node in nodes)
+
+    # fused coherence
+    graph = slc_wrappers.coherence_graph(tmp_path / "m.dim", tmp_path / "s.dim", tmp_path / "coh", config_dict)
+    assert _node_parameters(graph, "Terrain-Correction") == stepwise